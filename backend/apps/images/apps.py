@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class ImagesConfig(AppConfig):
+    name = "apps.images"
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
+        # Hooks database connections for tracing, so it must be imported before the first one opens
+        from .services import tracing  # noqa: F401
@@ -0,0 +1,146 @@
+"""In-process blockchain stand-in for load tests, backed by eth-tester."""
+
+import json
+import logging
+import os
+import threading
+
+from web3 import Web3
+
+from apps.images.services import blockchain_service
+from apps.images.services.config import BASE_DIR, BLOCKCHAIN_PRIVATE_KEY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTRACT_SOURCE = os.path.join(BASE_DIR, "contracts", "smart_contract.sol")
+DEFAULT_SOLC_VERSION = "0.8.19"
+
+# Nothing listens here, so chain calls fail fast as they do when the node is down
+UNREACHABLE_RPC = "http://127.0.0.1:9"
+
+
+def compile_contract(source_path=DEFAULT_CONTRACT_SOURCE, solc_version=DEFAULT_SOLC_VERSION):
+    """
+    Compile the image verification contract with py-solc-x.
+
+    Returns:
+        tuple: (abi, bytecode)
+    """
+    try:
+        import solcx
+    except ImportError:
+        raise RuntimeError("Compiling the contract needs py-solc-x: pip install py-solc-x")
+    if solc_version not in [str(v) for v in solcx.get_installed_solc_versions()]:
+        logger.info(f"Installing solc {solc_version}")
+        solcx.install_solc(solc_version)
+    compiled = solcx.compile_files([source_path], output_values=["abi", "bin"], solc_version=solc_version)
+    # A single contract per source file
+    contract = next(iter(compiled.values()))
+    return contract["abi"], contract["bin"]
+
+
+def load_artifact(path):
+    """
+    Read a precompiled contract artifact (JSON with "abi" and "bytecode").
+
+    Returns:
+        tuple: (abi, bytecode)
+    """
+    with open(path) as f:
+        artifact = json.load(f)
+    return artifact["abi"], artifact.get("bytecode") or artifact["bin"]
+
+
+class LocalChain:
+    """
+    An eth-tester chain with the contract deployed, wired into blockchain_service.
+
+    The account of BLOCKCHAIN_PRIVATE_KEY is funded from a pre-funded test
+    account and deploys the contract, so it is the owner and an authorized
+    user exactly as on a real deployment. Every transaction is mined
+    immediately.
+
+    With ``rpc_url`` a Ganache-compatible development node (unlocked,
+    pre-funded accounts) is used instead of eth-tester.
+    """
+
+    def __init__(self, abi, bytecode, rpc_url=None):
+        self.abi = abi
+        self.bytecode = bytecode
+        self.rpc_url = rpc_url
+        self.web3 = None
+        self.contract_address = None
+        self._saved = None
+
+    def _provider(self):
+        if self.rpc_url:
+            return Web3.HTTPProvider(self.rpc_url)
+        try:
+            from web3 import EthereumTesterProvider
+        except ImportError:
+            raise RuntimeError("The local chain needs eth-tester: pip install 'eth-tester[py-evm]'")
+
+        class SerializedTesterProvider(EthereumTesterProvider):
+            # eth-tester is not thread-safe and request threads share the provider
+            _lock = threading.Lock()
+
+            def make_request(self, method, params):
+                with self._lock:
+                    return super().make_request(method, params)
+
+        return SerializedTesterProvider()
+
+    def start(self):
+        web3 = Web3(self._provider())
+        web3.middleware_onion.add(blockchain_service.TracingMiddleware, "tracing")
+        account = web3.eth.account.from_key(BLOCKCHAIN_PRIVATE_KEY)
+        funding = web3.eth.send_transaction({
+            "from": web3.eth.accounts[0],
+            "to": account.address,
+            "value": web3.to_wei(1000, "ether"),
+        })
+        web3.eth.wait_for_transaction_receipt(funding)
+
+        tx = web3.eth.contract(abi=self.abi, bytecode=self.bytecode).constructor().build_transaction({
+            "from": account.address,
+            "nonce": web3.eth.get_transaction_count(account.address),
+            "gasPrice": web3.eth.gas_price,
+        })
+        signed_tx = account.sign_transaction(tx)
+        receipt = web3.eth.wait_for_transaction_receipt(web3.eth.send_raw_transaction(signed_tx.raw_transaction))
+        if receipt.status != 1 or not receipt.contractAddress:
+            raise RuntimeError("Contract deployment failed on the local chain")
+
+        web3.eth.default_account = account.address
+        self.web3 = web3
+        self.contract_address = receipt.contractAddress
+        self._saved = (blockchain_service.w3, blockchain_service.CONTRACT_ADDRESS)
+        blockchain_service.w3 = web3
+        blockchain_service.CONTRACT_ADDRESS = self.contract_address
+        logger.info(f"Local chain {web3.eth.chain_id} ready, contract deployed at {self.contract_address}")
+        return self
+
+    def stop(self):
+        if self._saved is not None:
+            blockchain_service.w3, blockchain_service.CONTRACT_ADDRESS = self._saved
+            self._saved = None
+
+    def stats(self):
+        return {
+            "chain_id": self.web3.eth.chain_id,
+            "contract_address": self.contract_address,
+            "blocks": self.web3.eth.block_number,
+            "node": self.rpc_url or "eth-tester",
+        }
+
+
+def disconnect_chain():
+    """Point blockchain_service at an unreachable node so uploads run without anchoring."""
+    saved = (blockchain_service.w3, blockchain_service.BLOCKCHAIN_RPC)
+    blockchain_service.w3 = None
+    blockchain_service.BLOCKCHAIN_RPC = UNREACHABLE_RPC
+    return saved
+
+
+def restore_chain(saved):
+    blockchain_service.w3, blockchain_service.BLOCKCHAIN_RPC = saved
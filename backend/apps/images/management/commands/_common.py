@@ -0,0 +1,57 @@
+"""Helpers shared by the image management commands."""
+
+import os
+
+from apps.images.services.config import BASE_DIR
+
+# Sample images shipped with the repository
+DEFAULT_IMAGE_DIR = os.path.join(os.path.dirname(BASE_DIR), "data", "test_images")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+
+
+def list_image_files(directory, limit=None):
+    """
+    List image files in a directory, sorted by name.
+
+    Args:
+        directory: Directory to scan (not recursive)
+        limit: Optional maximum number of files to return
+
+    Returns:
+        list: Absolute paths of the image files
+    """
+    paths = sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def summarize_timings(samples):
+    """
+    Summarize latency samples in seconds.
+
+    Returns:
+        dict: count, mean, min, max and p50/p90/p95/p99, all in milliseconds
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        # Nearest-rank percentile
+        index = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered))) - 1))
+        return ordered[index] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "min_ms": ordered[0] * 1000,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+    }
@@ -0,0 +1,247 @@
+"""Synthetic corpora and images derived from the sample images, for benchmarks, evaluations and load tests."""
+
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from apps.images.services.bovw_index import BovwIndex
+
+SyntheticImage = namedtuple("SyntheticImage", ["id", "orb_features"])
+
+
+def perturb_descriptors(descriptors, rng, flip_probability=0.05, keep_ratio=0.9):
+    """
+    Make a near-duplicate descriptor set.
+
+    A random subset of descriptors is kept and each bit flips independently,
+    roughly what re-encoding or light edits do to ORB descriptors.
+    """
+    keep = max(1, int(len(descriptors) * keep_ratio))
+    rows = descriptors[np.sort(rng.choice(len(descriptors), keep, replace=False))]
+    flips = np.packbits(rng.random((keep, rows.shape[1] * 8)) < flip_probability, axis=1)
+    return np.bitwise_xor(rows, flips)
+
+
+def _encode_jpeg(img, quality):
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("Failed to encode synthetic image")
+    return buf.tobytes()
+
+
+def unique_image(background, seed, size=768, shapes=60):
+    """
+    Generate an image that no other seed resembles.
+
+    The sample image is blurred into a background that contributes its colors
+    but no ORB keypoints; the keypoints come from seeded random shapes drawn
+    on top, so images from different seeds stay far below the similarity
+    threshold.
+
+    Args:
+        background: Encoded sample image bytes
+        seed: Random seed; the same seed gives the same image
+        size: Width and height in pixels
+        shapes: Number of polygons, circles and lines drawn
+
+    Returns:
+        bytes: JPEG image
+    """
+    rng = np.random.default_rng(seed)
+    img = cv2.imdecode(np.frombuffer(background, np.uint8), cv2.IMREAD_COLOR)
+    img = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
+    img = cv2.GaussianBlur(img, (0, 0), sigmaX=size / 32)
+    for _ in range(shapes):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        kind = rng.integers(3)
+        if kind == 0:
+            points = rng.integers(0, size, (int(rng.integers(3, 7)), 2)).astype(np.int32)
+            cv2.fillPoly(img, [points], color)
+        elif kind == 1:
+            center = tuple(int(v) for v in rng.integers(0, size, 2))
+            cv2.circle(img, center, int(rng.integers(5, size // 8)), color, int(rng.choice([-1, 2, 4])))
+        else:
+            start = tuple(int(v) for v in rng.integers(0, size, 2))
+            end = tuple(int(v) for v in rng.integers(0, size, 2))
+            cv2.line(img, start, end, color, int(rng.integers(1, 6)))
+    return _encode_jpeg(img, 90)
+
+
+def near_duplicate(data, seed):
+    """
+    Make a near-duplicate of an encoded image.
+
+    Applies a slight crop, a brightness/contrast shift and JPEG re-encoding,
+    mild enough that ORB verification still flags it as similar.
+
+    Returns:
+        bytes: JPEG image
+    """
+    rng = np.random.default_rng(seed)
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    height, width = img.shape[:2]
+    margin = rng.uniform(0, 0.015)
+    top, left = int(height * margin), int(width * margin)
+    img = img[top:height - top, left:width - left]
+    img = cv2.convertScaleAbs(img, alpha=rng.uniform(0.95, 1.05), beta=rng.uniform(-10, 10))
+    return _encode_jpeg(img, rng.integers(80, 93))
+
+
+def _crop(img, rng):
+    height, width = img.shape[:2]
+    top, bottom, left, right = (rng.uniform(0.02, 0.12, 4) * [height, height, width, width]).astype(int)
+    return img[top:height - bottom, left:width - right], {
+        "top": int(top), "bottom": int(bottom), "left": int(left), "right": int(right)
+    }
+
+
+def _resize(img, rng):
+    scale = rng.uniform(0.3, 0.75)
+    height, width = img.shape[:2]
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA), {"scale": round(scale, 3)}
+
+
+def _affine(img, rng):
+    height, width = img.shape[:2]
+    angle, scale = rng.uniform(-8, 8), rng.uniform(0.9, 1.1)
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, scale)
+    matrix[:, 2] += rng.uniform(-0.03, 0.03, 2) * [width, height]
+    warped = cv2.warpAffine(img, matrix, (width, height), borderMode=cv2.BORDER_REFLECT)
+    return warped, {"angle": round(angle, 2), "scale": round(scale, 3)}
+
+
+def _color_shift(img, rng):
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV).astype(np.float32)
+    hue_shift, saturation = rng.uniform(-10, 10), rng.uniform(0.7, 1.3)
+    hsv[..., 0] = (hsv[..., 0] + hue_shift) % 180
+    hsv[..., 1] = np.clip(hsv[..., 1] * saturation, 0, 255)
+    img = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
+    gamma = rng.uniform(0.7, 1.4)
+    table = np.clip(((np.arange(256) / 255.0) ** gamma) * 255, 0, 255).astype(np.uint8)
+    return cv2.LUT(img, table), {
+        "hue_shift": round(hue_shift, 2), "saturation": round(saturation, 3), "gamma": round(gamma, 3)
+    }
+
+
+# Transform name -> (function of (image, rng) returning (image, params) or None, JPEG quality range)
+NEAR_DUPLICATE_TRANSFORMS = {
+    "crop": (_crop, (85, 95)),
+    "resize": (_resize, (85, 95)),
+    "recompress": (None, (20, 50)),
+    "affine": (_affine, (85, 95)),
+    "color": (_color_shift, (85, 95)),
+    # A milder crop, resize and color shift together, re-encoded at medium quality
+    "combined": (None, (60, 80)),
+}
+
+
+def transformed_variant(data, transform, seed):
+    """
+    Make a labelled near-duplicate of an encoded image with one kind of edit.
+
+    Unlike near_duplicate, the edits are strong enough that some variants
+    fall below the similarity threshold; evaluations use them to measure
+    how recall degrades per kind of edit.
+
+    Args:
+        data: Encoded image bytes
+        transform: Name from NEAR_DUPLICATE_TRANSFORMS
+        seed: Random seed; the same seed gives the same variant
+
+    Returns:
+        tuple: (JPEG bytes, dict of the applied parameters)
+    """
+    fn, quality_range = NEAR_DUPLICATE_TRANSFORMS[transform]
+    rng = np.random.default_rng(seed)
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    params = {}
+    if transform == "combined":
+        height, width = img.shape[:2]
+        margin = rng.uniform(0.01, 0.05)
+        img = img[int(height * margin):height - int(height * margin), int(width * margin):width - int(width * margin)]
+        img, params = _resize(img, rng)
+        img = cv2.convertScaleAbs(img, alpha=rng.uniform(0.9, 1.1), beta=rng.uniform(-15, 15))
+        params["margin"] = round(margin, 3)
+    elif fn is not None:
+        img, params = fn(img, rng)
+    quality = int(rng.integers(quality_range[0], quality_range[1] + 1))
+    params["quality"] = quality
+    return _encode_jpeg(img, quality), params
+
+
+class SyntheticCorpus:
+    """
+    A corpus of ``size`` images, each a perturbed copy of one of the base images.
+
+    Image ids run from 1 to ``size``. Features are generated deterministically
+    from the id, so any image can be materialized on demand without holding
+    the whole corpus in memory.
+    """
+
+    def __init__(self, base_features, size, seed=0, flip_probability=0.05, word_noise=0.3):
+        self.base_features = [f for f in base_features if f and f.get("descriptors")]
+        if not self.base_features:
+            raise ValueError("Synthetic corpora need at least one base image with ORB features")
+        self.base_descriptors = [np.asarray(f["descriptors"], dtype=np.uint8) for f in self.base_features]
+        self.size = size
+        self.seed = seed
+        self.flip_probability = flip_probability
+        self.word_noise = word_noise
+
+    def base_of(self, image_id):
+        return (image_id - 1) % len(self.base_features)
+
+    def features(self, image_id):
+        """Get the ORB features of a synthetic image in the stored (JSON) layout."""
+        rng = np.random.default_rng([self.seed, image_id])
+        base = self.base_of(image_id)
+        descriptors = perturb_descriptors(self.base_descriptors[base], rng, self.flip_probability)
+        return {
+            "keypoints": [],
+            "descriptors": descriptors.tolist(),
+            "decode": self.base_features[base].get("decode"),
+        }
+
+    def image(self, image_id):
+        return SyntheticImage(image_id, self.features(image_id))
+
+    def images(self, ids):
+        return [self.image(image_id) for image_id in ids]
+
+    def bovw_index(self, vocabulary):
+        """
+        Build a BoVW index over the whole corpus.
+
+        Postings are synthesized in word space: each image gets its base
+        image's visual words with a fraction replaced by random words, which
+        keeps building a 100k-image index to a few seconds.
+        """
+        index = BovwIndex(vocabulary)
+        rng = np.random.default_rng(self.seed)
+        base_words = [index.quantize(descriptors) for descriptors in self.base_descriptors]
+        all_ids = np.arange(1, self.size + 1)
+        bases = (all_ids - 1) % len(base_words)
+
+        docs_parts, words_parts, tf_parts = [], [], []
+        for base, (words, tf) in enumerate(base_words):
+            doc_indices = np.flatnonzero(bases == base).astype(np.int32)
+            docs = np.repeat(doc_indices, len(words))
+            sampled_words = np.tile(words.astype(np.int32), len(doc_indices))
+            noisy = rng.random(len(sampled_words)) < self.word_noise
+            sampled_words[noisy] = rng.integers(0, index.num_words, int(noisy.sum()))
+            docs_parts.append(docs)
+            words_parts.append(sampled_words)
+            tf_parts.append(np.tile(tf, len(doc_indices)))
+
+        docs = np.concatenate(docs_parts)
+        words = np.concatenate(words_parts)
+        tf = np.concatenate(tf_parts).astype(np.float32)
+        del docs_parts, words_parts, tf_parts
+        order = np.argsort(words, kind="stable")
+        word_ptr = np.zeros(index.num_words + 1, dtype=np.int64)
+        word_ptr[1:] = np.cumsum(np.bincount(words, minlength=index.num_words))
+        return BovwIndex.from_postings(
+            vocabulary, word_ptr, docs[order], tf[order], all_ids, high_water=self.size
+        )
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.images.services import blockchain_service
+from apps.images.services.blockchain_service import (
+    delete_image_from_blockchain,
+    store_image_on_blockchain,
+    store_images_on_blockchain,
+    verify_image
+)
+from apps.images.services.tracing import Trace
+from ._chain import DEFAULT_CONTRACT_SOURCE, DEFAULT_SOLC_VERSION, LocalChain, compile_contract, load_artifact
+from ._common import summarize_timings
+
+OPERATIONS = ("store", "verify", "delete")
+
+# Images anchored per transaction batch while growing the corpus between levels
+PREFILL_BATCH = 100
+
+
+class _Operation:
+    """One measured call: its outcome, wall time and the RPC spans it produced."""
+
+    def __init__(self, seconds, result=None, error=None, spans=()):
+        self.seconds = seconds
+        self.result = result
+        self.error = error
+        rpc_spans = [s for s in spans if s.name.startswith("rpc.")]
+        self.rpc_methods = Counter(s.name[len("rpc."):] for s in rpc_spans)
+        sends = [s for s in rpc_spans if s.name == "rpc.eth_sendRawTransaction"]
+        receipts = [s for s in rpc_spans if s.name == "rpc.eth_getTransactionReceipt"]
+        # From submitting the transaction until the receipt poll that returned it
+        self.submit_to_receipt = (
+            (receipts[-1].end_ns - sends[0].start_ns) / 1e9 if sends and receipts else None
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark blockchain store, verify and delete transactions against a local chain with the "
+        "image contract deployed: throughput, submit-to-receipt latency, RPC calls and gas per operation "
+        "at increasing concurrency and corpus size"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--contract", default=DEFAULT_CONTRACT_SOURCE, help="Contract source to compile and deploy")
+        parser.add_argument("--contract-artifact", help="Precompiled contract JSON (abi, bytecode), skips solc")
+        parser.add_argument("--solc-version", default=DEFAULT_SOLC_VERSION)
+        parser.add_argument(
+            "--rpc-url",
+            help="Deploy to a Ganache-compatible development node at this URL instead of an in-process eth-tester chain"
+        )
+        parser.add_argument("--operations", default=",".join(OPERATIONS), help="Comma-separated operations to measure")
+        parser.add_argument("--concurrency", default="1,2,4,8", help="Comma-separated numbers of concurrent callers")
+        parser.add_argument(
+            "--corpus-sizes", default="0,250,1000",
+            help="Comma-separated numbers of images stored on the contract before each round"
+        )
+        parser.add_argument("--ops", type=int, default=20, help="Calls per operation, concurrency and corpus size")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--verbose-logs", action="store_true", help="Keep per-call blockchain logging enabled")
+        parser.add_argument("--output", help="Write the report as JSON to this file")
+
+    def handle(self, *args, **options):
+        operations = [op for op in options["operations"].split(",") if op.strip()]
+        unknown = set(operations) - set(OPERATIONS)
+        if unknown:
+            raise CommandError(f"Unknown operations: {', '.join(sorted(unknown))}")
+        concurrency_levels = [int(c) for c in options["concurrency"].split(",") if c.strip()]
+        corpus_sizes = sorted(int(s) for s in options["corpus_sizes"].split(",") if s.strip())
+
+        if options["contract_artifact"]:
+            abi, bytecode = load_artifact(options["contract_artifact"])
+        else:
+            try:
+                abi, bytecode = compile_contract(options["contract"], options["solc_version"])
+            except Exception as e:
+                raise CommandError(f"Could not compile {options['contract']} ({e}); pass --contract-artifact instead")
+
+        log_level = blockchain_service.logger.level
+        if not options["verbose_logs"]:
+            # Per-step INFO logging would otherwise be part of every measured call
+            blockchain_service.logger.setLevel(logging.WARNING)
+        chain = LocalChain(abi, bytecode, rpc_url=options["rpc_url"]).start()
+        try:
+            report = self._run(chain, operations, concurrency_levels, corpus_sizes, options)
+            report["meta"]["chain"] = chain.stats()
+        finally:
+            chain.stop()
+            blockchain_service.logger.setLevel(log_level)
+
+        self._print_summary(report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def _run(self, chain, operations, concurrency_levels, corpus_sizes, options):
+        rng = random.Random(options["seed"])
+        report = {
+            "meta": {
+                "created_at": time.time(),
+                "operations": operations,
+                "concurrency": concurrency_levels,
+                "corpus_sizes": corpus_sizes,
+                "ops": options["ops"],
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+            },
+            "results": [],
+        }
+        # Hashes currently stored on the contract, in the order they were added
+        stored = []
+        counter = iter(range(10 ** 9))
+
+        def new_hash():
+            return hashlib.sha256(f"benchmark-chain-{options['seed']}-{next(counter)}".encode()).hexdigest()
+
+        for corpus_size in corpus_sizes:
+            self._prefill(stored, corpus_size, new_hash)
+            for concurrency in concurrency_levels:
+                for operation in operations:
+                    if operation == "store":
+                        targets = [new_hash() for _ in range(options["ops"])]
+                    else:
+                        # Random picks, so deletes pay the contract's average scan rather than the best case
+                        targets = rng.sample(stored, min(options["ops"], len(stored)))
+                    if not targets:
+                        continue
+                    self.stderr.write(
+                        f"{operation}: {len(targets)} calls at concurrency {concurrency}, {len(stored)} images stored"
+                    )
+                    result = self._measure(chain, operation, targets, concurrency)
+                    result.update({"corpus_size": len(stored), "concurrency": concurrency})
+                    report["results"].append(result)
+                    if operation == "store":
+                        stored.extend(h for h, ok in zip(targets, result.pop("succeeded")) if ok)
+                    elif operation == "delete":
+                        removed = {h for h, ok in zip(targets, result.pop("succeeded")) if ok}
+                        stored[:] = [h for h in stored if h not in removed]
+                    else:
+                        result.pop("succeeded")
+        return report
+
+    def _prefill(self, stored, corpus_size, new_hash):
+        missing = corpus_size - len(stored)
+        if missing <= 0:
+            return
+        self.stderr.write(f"Storing {missing} images to reach a corpus of {corpus_size}")
+        while missing > 0:
+            hashes = [new_hash() for _ in range(min(PREFILL_BATCH, missing))]
+            txs = store_images_on_blockchain((h, "Real", 0.9) for h in hashes)
+            added = [h for h in hashes if txs.get(h)]
+            if not added:
+                raise CommandError("Could not grow the corpus: no batch transaction succeeded")
+            stored.extend(added)
+            missing -= len(added)
+
+    def _call(self, operation, sha256_hash):
+        trace = Trace(f"benchmark.{operation}")
+        trace.activate()
+        start_time = time.perf_counter()
+        try:
+            if operation == "store":
+                result = store_image_on_blockchain(sha256_hash, "Real", 0.9)
+            elif operation == "verify":
+                result = verify_image(sha256_hash, True)
+            else:
+                result = delete_image_from_blockchain(sha256_hash)
+            return _Operation(time.perf_counter() - start_time, result=result, spans=trace.spans)
+        except Exception as e:
+            return _Operation(time.perf_counter() - start_time, error=str(e), spans=trace.spans)
+        finally:
+            # The trace is only a span collector here and is never exported
+            trace.deactivate()
+
+    def _measure(self, chain, operation, targets, concurrency):
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            calls = list(executor.map(lambda h: self._call(operation, h), targets))
+        wall_seconds = time.perf_counter() - start_time
+
+        succeeded = [c.error is None and c.result not in (None, "IMAGE_EXISTS") for c in calls]
+        gas = []
+        for call, ok in zip(calls, succeeded):
+            if ok:
+                receipt = chain.web3.eth.get_transaction_receipt(call.result)
+                gas.append(receipt.gasUsed)
+
+        rpc_methods = Counter()
+        for call in calls:
+            rpc_methods.update(call.rpc_methods)
+        errors = Counter(c.error.split(":")[0][:120] for c in calls if c.error)
+        return {
+            "operation": operation,
+            "calls": len(calls),
+            "succeeded": succeeded,
+            "errors": sum(1 for c in calls if c.error),
+            "error_kinds": dict(errors),
+            "wall_seconds": wall_seconds,
+            "tx_per_second": sum(succeeded) / wall_seconds if wall_seconds else 0.0,
+            "latency": summarize_timings([c.seconds for c in calls]),
+            "submit_to_receipt": summarize_timings([c.submit_to_receipt for c in calls if c.submit_to_receipt is not None]),
+            "rpc_calls_per_op": sum(rpc_methods.values()) / len(calls),
+            "rpc_methods_per_op": {m: n / len(calls) for m, n in rpc_methods.most_common()},
+            "gas": {
+                "mean": sum(gas) / len(gas),
+                "min": min(gas),
+                "max": max(gas),
+            } if gas else None,
+        }
+
+    def _print_summary(self, report):
+        self.stdout.write(
+            f"{'operation':>9} {'corpus':>7} {'conc':>5} {'ok':>7} {'tx/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'rcpt p50':>9} {'rpc/op':>7} {'gas':>9}"
+        )
+        for r in report["results"]:
+            gas = r["gas"]["mean"] if r["gas"] else float("nan")
+            self.stdout.write(
+                f"{r['operation']:>9} {r['corpus_size']:>7} {r['concurrency']:>5} "
+                f"{r['calls'] - r['errors']:>3}/{r['calls']:<3} {r['tx_per_second']:>8.2f} "
+                f"{r['latency'].get('p50_ms', float('nan')):>8.1f} {r['latency'].get('p95_ms', float('nan')):>8.1f} "
+                f"{r['submit_to_receipt'].get('p50_ms', float('nan')):>9.1f} {r['rpc_calls_per_op']:>7.1f} {gas:>9.0f}"
+            )
@@ -0,0 +1,87 @@
+import json
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.images.services.config import ORB_DECODE_TARGET_LONG_SIDE
+from apps.images.services.cpu_pool import decode_grayscale, extract_orb_features, preprocess_for_xception
+from ._common import DEFAULT_IMAGE_DIR, list_image_files, summarize_timings
+
+
+class Command(BaseCommand):
+    help = "Benchmark full-resolution decoding against reduced-resolution decoding"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", default=DEFAULT_IMAGE_DIR)
+        parser.add_argument("--limit", type=int)
+        parser.add_argument(
+            "--upscale", type=int, default=8,
+            help="Re-encode each image at this multiple of its size to simulate large phone photos (1 = as is)"
+        )
+        parser.add_argument("--target-long-side", type=int, default=ORB_DECODE_TARGET_LONG_SIDE or 1024)
+        parser.add_argument("--repeats", type=int, default=3)
+        parser.add_argument("--output", help="Write the report as JSON to this file")
+
+    def handle(self, *args, **options):
+        paths = list_image_files(options["images"], limit=options["limit"])
+        if not paths:
+            raise CommandError(f"No images found in {options['images']}")
+
+        samples = [self._load(path, options["upscale"]) for path in paths]
+        sizes = [cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED).shape[:2] for data in samples]
+        self.stdout.write(
+            f"Benchmarking {len(samples)} images, median size {int(np.median([max(s) for s in sizes]))}px"
+        )
+
+        target = options["target_long_side"]
+        cases = {
+            "decode_full": lambda data: decode_grayscale(data, 0),
+            "decode_reduced": lambda data: decode_grayscale(data, target),
+            "orb_full": lambda data: extract_orb_features(data, 1000, 0),
+            "orb_reduced": lambda data: extract_orb_features(data, 1000, target),
+            "xception_preprocess_full": lambda data: preprocess_for_xception(data, draft=False),
+            "xception_preprocess_draft": lambda data: preprocess_for_xception(data, draft=True),
+        }
+
+        report = {
+            "images": len(samples),
+            "upscale": options["upscale"],
+            "target_long_side": target,
+            "cases": {},
+        }
+        for name, fn in cases.items():
+            timings = []
+            peak_bytes = 0
+            for _ in range(options["repeats"]):
+                for data in samples:
+                    start_time = time.perf_counter()
+                    result = fn(data)
+                    timings.append(time.perf_counter() - start_time)
+                    if name.startswith("decode") and result[0] is not None:
+                        peak_bytes = max(peak_bytes, result[0].nbytes)
+            summary = summarize_timings(timings)
+            if peak_bytes:
+                summary["max_decoded_bytes"] = peak_bytes
+            report["cases"][name] = summary
+
+        for base in ("decode", "orb"):
+            full = report["cases"][f"{base}_full"]["mean_ms"]
+            reduced = report["cases"][f"{base}_reduced"]["mean_ms"]
+            report[f"{base}_speedup"] = full / reduced if reduced else None
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def _load(self, path, upscale):
+        with open(path, "rb") as f:
+            data = f.read()
+        if upscale <= 1:
+            return data
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        img = cv2.resize(img, (img.shape[1] * upscale, img.shape[0] * upscale), interpolation=cv2.INTER_CUBIC)
+        ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        return encoded.tobytes()
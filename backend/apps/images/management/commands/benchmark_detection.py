@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.images.services import detection_service
+from apps.images.services.bovw_index import descriptors_from_features, load_vocabulary, train_vocabulary
+from apps.images.services.config import BOVW_SHORTLIST_SIZE, BOVW_VOCABULARY_PATH, ORB_DECODE_TARGET_LONG_SIDE
+from apps.images.services.cpu_pool import decode_grayscale, get_cpu_pool
+from apps.images.services.detection_service import (
+    compare_orb_features,
+    deepfake_check,
+    get_orb_features,
+    get_sha256,
+    scan_candidates
+)
+from ._common import DEFAULT_IMAGE_DIR, list_image_files, summarize_timings
+from ._synthetic import SyntheticCorpus
+
+# Metrics compared against the baseline, per kind of stage
+COMPARED_METRICS = ("p50_ms", "p95_ms", "projected_ms")
+
+# Never reached, so scans visit every candidate
+NO_MATCH_THRESHOLD = 2.0
+
+
+class Command(BaseCommand):
+    help = "Benchmark the latency of each detection stage and optionally compare against a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", default=DEFAULT_IMAGE_DIR)
+        parser.add_argument("--limit", type=int, help="Maximum number of sample images")
+        parser.add_argument("--repeats", type=int, default=3, help="Timed passes for the per-image stages")
+        parser.add_argument(
+            "--corpus-sizes", default="1000,10000,100000",
+            help="Comma-separated synthetic corpus sizes for the similarity stages"
+        )
+        parser.add_argument(
+            "--scan-limit", type=int, default=100,
+            help="Candidates actually compared per query in the linear scan; the full scan is projected"
+        )
+        parser.add_argument("--queries", type=int, default=5, help="Query images for the similarity stages")
+        parser.add_argument("--skip-deepfake", action="store_true")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--verbose-logs", action="store_true", help="Keep per-call detection logging enabled")
+        parser.add_argument("--output", help="Write the report as JSON to this file")
+        parser.add_argument("--compare", help="Baseline report to compare against")
+        parser.add_argument(
+            "--regression-threshold", type=float, default=0.15,
+            help="Relative slowdown of a compared metric that counts as a regression"
+        )
+        parser.add_argument(
+            "--min-regression-ms", type=float, default=0.5,
+            help="Ignore slowdowns smaller than this many milliseconds (timer noise on the fast stages)"
+        )
+
+    def handle(self, *args, **options):
+        paths = list_image_files(options["images"], limit=options["limit"])
+        if not paths:
+            raise CommandError(f"No images found in {options['images']}")
+        samples = []
+        for path in paths:
+            with open(path, "rb") as f:
+                samples.append(f.read())
+
+        log_level = detection_service.logger.level
+        if not options["verbose_logs"]:
+            # Per-call INFO logging would otherwise dominate the fast stages
+            detection_service.logger.setLevel(logging.WARNING)
+        try:
+            report = self._run(samples, options)
+        finally:
+            detection_service.logger.setLevel(log_level)
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+        if options["compare"]:
+            self._compare(report, options["compare"], options["regression_threshold"], options["min_regression_ms"])
+
+    def _run(self, samples, options):
+        repeats = options["repeats"]
+        report = {
+            "meta": {
+                "created_at": time.time(),
+                "images": len(samples),
+                "repeats": repeats,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "numpy": np.__version__,
+                "opencv": cv2.__version__,
+                "cpu_pool": get_cpu_pool().kind,
+                "orb_target_long_side": ORB_DECODE_TARGET_LONG_SIDE,
+                "deepfake_backend": getattr(detection_service.deepfake_backend, "name", None),
+            },
+            "stages": {},
+        }
+        stages = report["stages"]
+
+        stages["sha256"] = self._time_each(get_sha256, samples, repeats)
+        stages["decode"] = self._time_each(lambda data: decode_grayscale(data, ORB_DECODE_TARGET_LONG_SIDE), samples, repeats)
+        stages["get_orb_features"] = self._time_each(get_orb_features, samples, repeats)
+
+        features = [get_orb_features(data) for data in samples]
+        features = [f for f in features if f]
+        if len(features) < 2:
+            raise CommandError("Need at least two sample images with ORB features")
+        pairs = [(features[i], features[(i + 1) % len(features)]) for i in range(len(features))]
+        stages["compare_orb_features"] = self._time_each(lambda pair: compare_orb_features(*pair), pairs, repeats)
+
+        queries = features[:options["queries"]]
+        vocabulary, report["meta"]["vocabulary"] = self._vocabulary(features, options["seed"])
+        for size in [int(s) for s in options["corpus_sizes"].split(",") if s.strip()]:
+            self.stderr.write(f"Benchmarking similarity over a synthetic corpus of {size} images")
+            corpus = SyntheticCorpus(features, size, seed=options["seed"])
+            stages[f"verify_linear_{size}"] = self._linear_scan(corpus, queries, options["scan_limit"])
+            stages.update(self._indexed_scan(corpus, vocabulary, queries, size))
+
+        if not options["skip_deepfake"]:
+            if detection_service.deepfake_backend is None:
+                self.stderr.write("Deepfake model not loaded, skipping deepfake_check")
+            else:
+                stages["deepfake_check"] = self._time_each(deepfake_check, samples, repeats)
+
+        return report
+
+    def _time_each(self, fn, inputs, repeats):
+        timings = []
+        for _ in range(repeats):
+            for item in inputs:
+                start_time = time.perf_counter()
+                fn(item)
+                timings.append(time.perf_counter() - start_time)
+        return summarize_timings(timings)
+
+    def _vocabulary(self, features, seed):
+        if os.path.exists(BOVW_VOCABULARY_PATH):
+            return load_vocabulary(BOVW_VOCABULARY_PATH), BOVW_VOCABULARY_PATH
+        descriptors = np.concatenate([descriptors_from_features(f) for f in features])
+        words = min(1024, len(descriptors) // 4)
+        self.stderr.write(f"No trained vocabulary at {BOVW_VOCABULARY_PATH}, training {words} words on the samples")
+        return train_vocabulary(descriptors, words, iterations=5, seed=seed), f"trained on samples ({words} words)"
+
+    def _linear_scan(self, corpus, queries, scan_limit):
+        """Time a full scan by comparing against a prefix of the corpus and projecting."""
+        candidates = corpus.images(range(1, min(scan_limit, corpus.size) + 1))
+        per_candidate = []
+        for query in queries:
+            start_time = time.perf_counter()
+            scan_candidates(candidates, lambda stored: query, threshold=NO_MATCH_THRESHOLD)
+            per_candidate.append((time.perf_counter() - start_time) / len(candidates))
+        summary = summarize_timings(per_candidate)
+        summary["measured_candidates"] = len(candidates)
+        summary["projected_ms"] = summary["mean_ms"] * corpus.size
+        return summary
+
+    def _indexed_scan(self, corpus, vocabulary, queries, size):
+        """Time BoVW retrieval and verification of its shortlist."""
+        start_time = time.perf_counter()
+        index = corpus.bovw_index(vocabulary)
+        build_seconds = time.perf_counter() - start_time
+
+        query_timings, verify_timings = [], []
+        for query in queries:
+            descriptors = descriptors_from_features(query)
+            start_time = time.perf_counter()
+            shortlist = index.query(descriptors, BOVW_SHORTLIST_SIZE)
+            query_timings.append(time.perf_counter() - start_time)
+
+            # Materializing synthetic features is not part of the measured cost
+            candidates = corpus.images([image_id for image_id, _ in shortlist])
+            start_time = time.perf_counter()
+            scan_candidates(candidates, lambda stored: query, threshold=NO_MATCH_THRESHOLD)
+            verify_timings.append(query_timings[-1] + time.perf_counter() - start_time)
+
+        query_summary = summarize_timings(query_timings)
+        query_summary.update(index.stats())
+        query_summary["build_seconds"] = build_seconds
+        verify_summary = summarize_timings(verify_timings)
+        verify_summary["shortlist_size"] = BOVW_SHORTLIST_SIZE
+        return {f"bovw_query_{size}": query_summary, f"verify_bovw_{size}": verify_summary}
+
+    def _compare(self, report, baseline_path, threshold, min_delta_ms):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        self.stdout.write(f"Comparison against {baseline_path} (regression threshold {threshold:.0%}):")
+        for stage, current in report["stages"].items():
+            previous = baseline.get("stages", {}).get(stage)
+            if previous is None:
+                self.stdout.write(f"  {stage}: not in baseline")
+                continue
+            for metric in COMPARED_METRICS:
+                if metric not in current or not previous.get(metric):
+                    continue
+                change = current[metric] / previous[metric] - 1
+                line = f"  {stage}.{metric}: {previous[metric]:.3f} -> {current[metric]:.3f} ms ({change:+.1%})"
+                if change > threshold and current[metric] - previous[metric] >= min_delta_ms:
+                    regressions.append(f"{stage}.{metric}")
+                    self.stdout.write(self.style.ERROR(line + " REGRESSION"))
+                else:
+                    self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS("No regressions"))
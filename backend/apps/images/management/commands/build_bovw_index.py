@@ -0,0 +1,38 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.images.models import Image
+from apps.images.services.bovw_index import BovwIndex, descriptors_from_features, load_vocabulary
+from apps.images.services.config import BOVW_INDEX_PATH, BOVW_VOCABULARY_PATH
+
+
+class Command(BaseCommand):
+    help = "Quantize every stored image with the trained vocabulary and write the BoVW inverted index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vocabulary", default=BOVW_VOCABULARY_PATH)
+        parser.add_argument("--output", default=BOVW_INDEX_PATH)
+
+    def handle(self, *args, **options):
+        try:
+            vocabulary = load_vocabulary(options["vocabulary"])
+        except FileNotFoundError:
+            raise CommandError(f"Vocabulary not found at {options['vocabulary']}, run train_bovw_vocabulary first")
+
+        index = BovwIndex(vocabulary, meta={"vocabulary": options["vocabulary"], "built_at": time.time()})
+        start_time = time.time()
+        images = Image.objects.filter(orb_features__isnull=False).only("id", "orb_features").order_by("id")
+        for count, img in enumerate(images.iterator(), 1):
+            index.add(img.id, descriptors_from_features(img.orb_features))
+            index.high_water = img.id
+            if count % 1000 == 0:
+                self.stdout.write(f"Indexed {count} images ({count / (time.time() - start_time):.1f}/s)")
+
+        index.save(options["output"])
+        self.stdout.write(json.dumps(index.stats(), indent=2))
+        self.stdout.write(
+            f"Indexed {len(index)} images in {time.time() - start_time:.1f}s; "
+            "restart the application servers to load the new index"
+        )
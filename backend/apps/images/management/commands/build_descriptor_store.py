@@ -0,0 +1,35 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.images.models import Image
+from apps.images.services.config import DESCRIPTOR_STORE_DIR
+from apps.images.services.descriptor_store import DescriptorStore, descriptor_item
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the shared descriptor store from the ORB features in the database, "
+        "or compact it with --compact"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", default=DESCRIPTOR_STORE_DIR)
+        parser.add_argument("--compact", action="store_true", help="Only drop deleted and replaced rows")
+
+    def handle(self, *args, **options):
+        store = DescriptorStore(options["directory"])
+        start_time = time.time()
+        if options["compact"]:
+            store.refresh()
+            if store.generation is None:
+                raise CommandError(f"No descriptor store in {options['directory']}")
+            store.compact()
+        else:
+            images = Image.objects.filter(orb_features__isnull=False).only("id", "orb_features").order_by("id")
+            store.rebuild(descriptor_item(img.id, img.orb_features) for img in images.iterator())
+
+        self.stdout.write(json.dumps(store.stats(), indent=2))
+        # Running workers switch to the new generation on their next refresh
+        self.stdout.write(f"Wrote generation {store.generation} in {time.time() - start_time:.1f}s")
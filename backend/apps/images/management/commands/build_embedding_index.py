@@ -0,0 +1,64 @@
+import json
+import math
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.images.models import Image
+from apps.images.services.config import EMBEDDING_INDEX_PATH, EMBEDDING_IVF_LISTS
+from apps.images.services.embedding_index import IvfFlatIndex, embedding_from_bytes, train_centroids
+from apps.images.services.inference import load_inference_backend
+
+
+class Command(BaseCommand):
+    help = "Train the IVF coarse quantizer on stored Xception embeddings and index the corpus"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model-version",
+            help="Index embeddings produced by this model version (defaults to the configured model)"
+        )
+        parser.add_argument("--lists", type=int, help="Inverted lists, defaults to 4 * sqrt(corpus size)")
+        parser.add_argument("--train-size", type=int, default=100000, help="Embeddings sampled for training")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default=EMBEDDING_INDEX_PATH)
+
+    def handle(self, *args, **options):
+        model_version = options["model_version"] or load_inference_backend().version
+        images = Image.objects.filter(embedding__isnull=False, deepfake_model_version=model_version)
+        total = images.count()
+        if not total:
+            raise CommandError(
+                f"No embeddings stored for model {model_version}; run rescore_deepfakes to backfill them"
+            )
+
+        nlist = options["lists"] or max(1, min(EMBEDDING_IVF_LISTS, int(4 * math.sqrt(total))))
+        nlist = min(nlist, total)
+        rng = np.random.default_rng(options["seed"])
+        sample_ids = list(images.values_list("id", flat=True))
+        if len(sample_ids) > options["train_size"]:
+            sample_ids = rng.choice(sample_ids, options["train_size"], replace=False).tolist()
+        sample = np.stack([
+            embedding_from_bytes(data)
+            for data in Image.objects.filter(id__in=sample_ids).values_list("embedding", flat=True).iterator()
+        ]).astype(np.float32)
+
+        self.stdout.write(f"Training {nlist} lists on {len(sample)} embeddings of model {model_version}")
+        start_time = time.time()
+        centroids = train_centroids(sample, nlist, options["iterations"], options["seed"])
+
+        index = IvfFlatIndex(centroids, meta={"model_version": model_version, "built_at": time.time()})
+        for count, (image_id, data) in enumerate(
+                images.order_by("id").values_list("id", "embedding").iterator(), 1):
+            index.add(image_id, embedding_from_bytes(data))
+            index.high_water = image_id
+            if count % 10000 == 0:
+                self.stdout.write(f"Indexed {count}/{total} images")
+
+        index.save(options["output"])
+        self.stdout.write(json.dumps(index.stats(), indent=2))
+        self.stdout.write(
+            f"Built in {time.time() - start_time:.1f}s; restart the application servers to load the new index"
+        )
@@ -0,0 +1,94 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.images.services.cpu_pool import preprocess_for_xception
+from apps.images.services.exceptions import ModelError
+from apps.images.services.inference import BACKENDS, default_model_path, load_inference_backend
+from ._common import DEFAULT_IMAGE_DIR, list_image_files, summarize_timings
+
+
+class Command(BaseCommand):
+    help = "Compare accuracy and latency of an inference backend against the original Keras model"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", choices=sorted(BACKENDS), required=True)
+        parser.add_argument("--model", help="Model file for the backend under test")
+        parser.add_argument("--reference", default=default_model_path("keras"), help="Reference Keras model")
+        parser.add_argument("--images", default=DEFAULT_IMAGE_DIR)
+        parser.add_argument("--limit", type=int, help="Maximum number of images to use")
+        parser.add_argument("--batch-size", type=int, default=1)
+        parser.add_argument("--repeats", type=int, default=3, help="Timed passes over the images")
+        parser.add_argument(
+            "--max-label-disagreement", type=float, default=0.02,
+            help="Fail if more than this fraction of Real/Fake labels differ"
+        )
+        parser.add_argument("--output", help="Write the report as JSON to this file")
+
+    def handle(self, *args, **options):
+        paths = list_image_files(options["images"], limit=options["limit"])
+        if not paths:
+            raise CommandError(f"No images found in {options['images']}")
+
+        batch = []
+        for path in paths:
+            with open(path, "rb") as f:
+                batch.append(preprocess_for_xception(f.read()))
+        batch = np.stack(batch)
+        self.stdout.write(f"Loaded {len(batch)} images from {options['images']}")
+
+        try:
+            reference = load_inference_backend("keras", options["reference"])
+            candidate = load_inference_backend(options["backend"], options["model"])
+        except ModelError as e:
+            raise CommandError(e.message)
+
+        ref_scores, ref_timings = self._run(reference, batch, options)
+        cand_scores, cand_timings = self._run(candidate, batch, options)
+
+        diff = np.abs(ref_scores - cand_scores)
+        disagreement = float(np.mean((ref_scores > 0.5) != (cand_scores > 0.5)))
+        report = {
+            "backend": options["backend"],
+            "model": candidate.model_path,
+            "reference": reference.model_path,
+            "images": len(batch),
+            "batch_size": options["batch_size"],
+            "accuracy": {
+                "label_disagreement": disagreement,
+                "mean_abs_diff": float(np.mean(diff)),
+                "max_abs_diff": float(np.max(diff)),
+            },
+            "latency_per_batch": {
+                "keras": summarize_timings(ref_timings),
+                options["backend"]: summarize_timings(cand_timings),
+            },
+        }
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+        if disagreement > options["max_label_disagreement"]:
+            raise CommandError(
+                f"Label disagreement {disagreement:.2%} exceeds {options['max_label_disagreement']:.2%}"
+            )
+        self.stdout.write(self.style.SUCCESS("Backend is within the parity threshold"))
+
+    def _run(self, backend, batch, options):
+        batch_size = options["batch_size"]
+        chunks = [batch[i:i + batch_size] for i in range(0, len(batch), batch_size)]
+
+        # Warm-up pass, also used for the accuracy comparison
+        scores = np.concatenate([backend.predict(chunk) for chunk in chunks])
+
+        timings = []
+        for _ in range(options["repeats"]):
+            for chunk in chunks:
+                start_time = time.perf_counter()
+                backend.predict(chunk)
+                timings.append(time.perf_counter() - start_time)
+        return scores, timings
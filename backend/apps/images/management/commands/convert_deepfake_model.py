@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.images.services.cpu_pool import preprocess_for_xception
+from apps.images.services.inference import build_embedding_model, default_model_path
+from ._common import DEFAULT_IMAGE_DIR, list_image_files
+
+
+class Command(BaseCommand):
+    help = "Convert the Keras deepfake model to TFLite (float32/float16/int8) or ONNX"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["tflite", "onnx"], default="tflite")
+        parser.add_argument(
+            "--quantize", choices=["none", "float16", "int8"], default="none",
+            help="TFLite quantization mode"
+        )
+        parser.add_argument("--source", default=default_model_path("keras"), help="Keras .h5 model to convert")
+        parser.add_argument("--output", help="Output model file (defaults to the backend's model file)")
+        parser.add_argument(
+            "--calibration-dir", default=DEFAULT_IMAGE_DIR,
+            help="Images used as the representative dataset for int8 calibration"
+        )
+        parser.add_argument("--calibration-samples", type=int, default=100)
+        parser.add_argument("--opset", type=int, default=13, help="ONNX opset version")
+        parser.add_argument(
+            "--no-embeddings", action="store_true",
+            help="Only export the probability output, not the pooled embedding"
+        )
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        if not os.path.exists(options["source"]):
+            raise CommandError(f"Model file not found: {options['source']}")
+        model = tf.keras.models.load_model(options["source"])
+        if not options["no_embeddings"]:
+            # Export the pooled embedding as a second output so converted
+            # backends can feed the embedding index too
+            model = build_embedding_model(model) or model
+
+        # Quantized models go to the same file, so DEEPFAKE_BACKEND alone selects them
+        output = options["output"] or default_model_path(options["format"])
+
+        if options["format"] == "tflite":
+            data = self._convert_tflite(tf, model, options)
+        else:
+            data = self._convert_onnx(tf, model, options)
+
+        with open(output, "wb") as f:
+            f.write(data)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['format']} model to {output} ({len(data) / 1024 / 1024:.1f} MB)"
+        ))
+        if os.path.abspath(output) != os.path.abspath(default_model_path(options["format"])):
+            self.stdout.write(
+                f"Serve it with DEEPFAKE_BACKEND={options['format']} DEEPFAKE_MODEL_PATH={os.path.abspath(output)}"
+            )
+
+    def _convert_tflite(self, tf, model, options):
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+        if options["quantize"] == "float16":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif options["quantize"] == "int8":
+            paths = list_image_files(options["calibration_dir"], limit=options["calibration_samples"])
+            if not paths:
+                raise CommandError(f"No calibration images found in {options['calibration_dir']}")
+            self.stdout.write(f"Calibrating int8 quantization on {len(paths)} images")
+
+            def representative_dataset():
+                for path in paths:
+                    with open(path, "rb") as f:
+                        yield [np.expand_dims(preprocess_for_xception(f.read()), axis=0)]
+
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            # Keep float32 I/O so the backend can feed the usual preprocessed batch
+            converter.inference_input_type = tf.float32
+            converter.inference_output_type = tf.float32
+
+        return converter.convert()
+
+    def _convert_onnx(self, tf, model, options):
+        try:
+            import tf2onnx
+        except ImportError:
+            raise CommandError("tf2onnx is required for ONNX conversion (pip install tf2onnx)")
+
+        input_signature = [tf.TensorSpec([None, 299, 299, 3], tf.float32, name="input")]
+        onnx_model, _ = tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=options["opset"])
+        return onnx_model.SerializeToString()
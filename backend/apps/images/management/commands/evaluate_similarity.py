@@ -0,0 +1,404 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.images.services import detection_service
+from apps.images.services.bovw_index import BovwIndex, load_vocabulary, train_vocabulary
+from apps.images.services.config import BOVW_VOCABULARY_PATH, EMBEDDING_IVF_NPROBE, ORB_DECODE_TARGET_LONG_SIDE
+from apps.images.services.cpu_pool import extract_orb_features
+from apps.images.services.detection_service import (
+    ORB_MATCH_MAX_DISTANCE,
+    ORB_SIMILARITY_THRESHOLD,
+    deepfake_check,
+    match_orb_descriptors,
+    orb_similarity
+)
+from apps.images.services.embedding_index import IvfFlatIndex, normalize_embedding, train_centroids
+from ._common import DEFAULT_IMAGE_DIR, list_image_files, summarize_timings
+from ._synthetic import NEAR_DUPLICATE_TRANSFORMS, transformed_variant, unique_image
+
+# The configuration currently deployed, marked in the report
+CURRENT_NFEATURES = 1000
+
+DEFAULT_THRESHOLDS = ",".join(f"{t / 100:.2f}" for t in range(5, 100, 5))
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _float_list(value):
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Evaluate recall, precision and per-query latency of similarity configurations "
+        "on labelled near-duplicates generated from the sample images"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", default=DEFAULT_IMAGE_DIR)
+        parser.add_argument("--limit", type=int, help="Maximum number of sample images")
+        parser.add_argument(
+            "--transforms", default=",".join(NEAR_DUPLICATE_TRANSFORMS),
+            help="Comma-separated near-duplicate transforms to generate queries with"
+        )
+        parser.add_argument("--variants", type=int, default=1, help="Query variants per base image and transform")
+        parser.add_argument(
+            "--synthetic-bases", type=int, default=30,
+            help="Synthetic base images (sample colors, random structure) added to the sample images"
+        )
+        parser.add_argument(
+            "--holdout", type=float, default=0.25,
+            help="Share of base groups left out of the corpus; their variants are negative queries"
+        )
+        parser.add_argument("--distractors", type=int, default=60, help="Unrelated synthetic images added to the corpus")
+        parser.add_argument("--negatives", type=int, default=20, help="Unrelated synthetic images used as negative queries")
+        parser.add_argument("--nfeatures", default="500,1000", help="Comma-separated ORB feature counts")
+        parser.add_argument(
+            "--max-distances", default="30,40,50,60,70",
+            help="Comma-separated Hamming distance cut-offs for a good match"
+        )
+        parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS, help="Comma-separated similarity thresholds")
+        parser.add_argument(
+            "--bovw-shortlists", default="10,50",
+            help="Comma-separated BoVW shortlist sizes to evaluate as candidate generators, empty for none"
+        )
+        parser.add_argument(
+            "--embedding-shortlists", default="",
+            help="Comma-separated embedding-index shortlist sizes (needs the deepfake model), empty for none"
+        )
+        parser.add_argument(
+            "--target-precision", type=float, default=0.99,
+            help="Precision an operating point must reach; the threshold with the best recall is reported"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--verbose-logs", action="store_true", help="Keep per-call detection logging enabled")
+        parser.add_argument("--output", help="Write the report as JSON to this file")
+
+    def handle(self, *args, **options):
+        paths = list_image_files(options["images"], limit=options["limit"])
+        if len(paths) < 2:
+            raise CommandError(f"Need at least two images in {options['images']}")
+        transforms = [t for t in options["transforms"].split(",") if t.strip()]
+        unknown = set(transforms) - set(NEAR_DUPLICATE_TRANSFORMS)
+        if unknown:
+            raise CommandError(f"Unknown transforms: {', '.join(sorted(unknown))}")
+        samples = []
+        for path in paths:
+            with open(path, "rb") as f:
+                samples.append((os.path.basename(path), f.read()))
+
+        log_level = detection_service.logger.level
+        if not options["verbose_logs"]:
+            detection_service.logger.setLevel(logging.WARNING)
+        try:
+            report = self._run(samples, transforms, options)
+        finally:
+            detection_service.logger.setLevel(log_level)
+
+        self._print_summary(report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def _run(self, samples, transforms, options):
+        corpus, queries = self._dataset(samples, transforms, options)
+        self.stderr.write(
+            f"Corpus of {len(corpus)} images, {len(queries)} queries "
+            f"({sum(1 for q in queries if q['positive'])} with a duplicate in the corpus)"
+        )
+        thresholds = sorted(set(_float_list(options["thresholds"])) | {ORB_SIMILARITY_THRESHOLD})
+        max_distances = _int_list(options["max_distances"])
+
+        embedding_candidates = {}
+        embedding_shortlists = _int_list(options["embedding_shortlists"])
+        if embedding_shortlists:
+            embedding_candidates = self._embedding_candidates(corpus, queries, embedding_shortlists)
+
+        report = {
+            "meta": {
+                "created_at": time.time(),
+                "images": len(samples),
+                "corpus": len(corpus),
+                "queries": len(queries),
+                "positive_queries": sum(1 for q in queries if q["positive"]),
+                "transforms": transforms,
+                "variants": options["variants"],
+                "seed": options["seed"],
+                "orb_target_long_side": ORB_DECODE_TARGET_LONG_SIDE,
+                "current": {
+                    "nfeatures": CURRENT_NFEATURES,
+                    "max_distance": ORB_MATCH_MAX_DISTANCE,
+                    "threshold": ORB_SIMILARITY_THRESHOLD,
+                    "candidates": "linear",
+                },
+                "python": platform.python_version(),
+                "opencv": cv2.__version__,
+            },
+            "configurations": [],
+        }
+
+        for nfeatures in _int_list(options["nfeatures"]):
+            self.stderr.write(f"Extracting ORB features with nfeatures={nfeatures}")
+            corpus_descriptors = [self._descriptors(item["data"], nfeatures)[0] for item in corpus]
+            query_descriptors, extract_seconds = zip(*(self._descriptors(q["data"], nfeatures) for q in queries))
+
+            generators = {"linear": self._linear_candidates(corpus, queries)}
+            bovw_shortlists = _int_list(options["bovw_shortlists"])
+            if bovw_shortlists:
+                generators.update(self._bovw_candidates(
+                    corpus, corpus_descriptors, query_descriptors, bovw_shortlists, options["seed"]
+                ))
+            generators.update(embedding_candidates)
+
+            # Matches are independent of the candidate generator, so each pair is matched once
+            matches = {}
+            for name, (candidates, generate_seconds) in generators.items():
+                self.stderr.write(f"  Scoring {name} candidates")
+                for max_distance in max_distances:
+                    report["configurations"].append(self._evaluate(
+                        queries, corpus, corpus_descriptors, query_descriptors, candidates, matches,
+                        extract_seconds, generate_seconds, nfeatures, name, max_distance, thresholds, options
+                    ))
+        return report
+
+    def _dataset(self, samples, transforms, options):
+        """
+        Build the corpus and the labelled queries.
+
+        Images are labelled with a group: a query is a duplicate of every
+        corpus image in its group. The sample images are themselves edits of
+        a few photos ("00717_blur.jpg", "00717_rotated.jpg", ...), so each
+        file name prefix is one group. Synthetic bases and distractors are
+        groups of their own.
+
+        Returns:
+            tuple: (corpus items with id, group and data,
+                    queries with data, group, positive, transform and params)
+        """
+        bases = [(name.split("_")[0], name, data) for name, data in samples]
+        for i in range(options["synthetic_bases"]):
+            background = samples[i % len(samples)][1]
+            bases.append((f"synthetic-{i}", f"synthetic-{i}", unique_image(background, seed=i)))
+
+        rng = np.random.default_rng(options["seed"])
+        groups = sorted({group for group, _, _ in bases})
+        holdout_count = min(len(groups) - 1, int(round(len(groups) * options["holdout"])))
+        held_out = set(rng.permutation(groups)[:holdout_count].tolist())
+
+        corpus = []
+        for group, name, data in bases:
+            if group not in held_out:
+                corpus.append({"id": len(corpus) + 1, "group": group, "name": name, "data": data})
+        # Synthetic seeds after the bases, so distractors and negatives resemble nothing else
+        seed = options["synthetic_bases"]
+        for i in range(options["distractors"]):
+            background = samples[i % len(samples)][1]
+            corpus.append({
+                "id": len(corpus) + 1, "group": f"distractor-{i}", "name": f"distractor-{i}",
+                "data": unique_image(background, seed=seed + i),
+            })
+        seed += options["distractors"]
+
+        queries = []
+        for index, (group, name, data) in enumerate(bases):
+            for transform in transforms:
+                for variant in range(options["variants"]):
+                    variant_data, params = transformed_variant(
+                        data, transform, [options["seed"], index, transforms.index(transform), variant]
+                    )
+                    queries.append({
+                        "name": name,
+                        "data": variant_data,
+                        "group": group,
+                        "positive": group not in held_out,
+                        "transform": transform,
+                        "params": params,
+                    })
+        for i in range(options["negatives"]):
+            background = samples[i % len(samples)][1]
+            queries.append({
+                "name": f"negative-{i}",
+                "data": unique_image(background, seed=seed + i),
+                "group": f"negative-{i}",
+                "positive": False,
+                "transform": "unrelated",
+                "params": {},
+            })
+        return corpus, queries
+
+    def _descriptors(self, data, nfeatures):
+        start_time = time.perf_counter()
+        _, descriptors, _ = extract_orb_features(data, nfeatures, ORB_DECODE_TARGET_LONG_SIDE)
+        return descriptors, time.perf_counter() - start_time
+
+    def _linear_candidates(self, corpus, queries):
+        ids = [item["id"] for item in corpus]
+        return [ids] * len(queries), [0.0] * len(queries)
+
+    def _bovw_candidates(self, corpus, corpus_descriptors, query_descriptors, shortlists, seed):
+        descriptors = np.concatenate([d for d in corpus_descriptors if d is not None])
+        if os.path.exists(BOVW_VOCABULARY_PATH):
+            vocabulary = load_vocabulary(BOVW_VOCABULARY_PATH)
+        else:
+            words = max(2, min(1024, len(descriptors) // 20))
+            self.stderr.write(f"  No trained vocabulary at {BOVW_VOCABULARY_PATH}, training {words} words on the corpus")
+            vocabulary = train_vocabulary(descriptors, words, iterations=5, seed=seed)
+        index = BovwIndex(vocabulary)
+        for item, item_descriptors in zip(corpus, corpus_descriptors):
+            index.add(item["id"], item_descriptors)
+        index.refresh_norms()
+
+        generators = {}
+        for top_n in shortlists:
+            candidates, seconds = [], []
+            for descriptors in query_descriptors:
+                start_time = time.perf_counter()
+                shortlist = index.query(descriptors, top_n)
+                seconds.append(time.perf_counter() - start_time)
+                candidates.append([image_id for image_id, _ in shortlist])
+            generators[f"bovw@{top_n}"] = (candidates, seconds)
+        return generators
+
+    def _embedding_candidates(self, corpus, queries, shortlists):
+        if detection_service.deepfake_backend is None:
+            raise CommandError("Embedding shortlists need the deepfake model, which is not loaded")
+        self.stderr.write("Computing Xception embeddings")
+        corpus_embeddings = [deepfake_check(item["data"]).get("embedding") for item in corpus]
+        if any(e is None for e in corpus_embeddings):
+            raise CommandError("The deepfake backend does not expose embeddings")
+        vectors = np.stack([normalize_embedding(e).astype(np.float32) for e in corpus_embeddings])
+        nlist = max(1, int(np.sqrt(len(vectors))))
+        index = IvfFlatIndex(train_centroids(vectors, nlist))
+        for item, embedding in zip(corpus, corpus_embeddings):
+            index.add(item["id"], embedding)
+
+        generators = {}
+        query_embeddings = []
+        for query in queries:
+            start_time = time.perf_counter()
+            embedding = deepfake_check(query["data"]).get("embedding")
+            # The embedding comes from the deepfake pass uploads run anyway, so it is not counted here
+            query_embeddings.append((embedding, time.perf_counter() - start_time))
+        for top_n in shortlists:
+            candidates, seconds = [], []
+            for embedding, _ in query_embeddings:
+                start_time = time.perf_counter()
+                shortlist = index.search(embedding, top_n, nprobe=EMBEDDING_IVF_NPROBE)
+                seconds.append(time.perf_counter() - start_time)
+                candidates.append([image_id for image_id, _ in shortlist])
+            generators[f"embedding@{top_n}"] = (candidates, seconds)
+        return generators
+
+    def _evaluate(self, queries, corpus, corpus_descriptors, query_descriptors, candidates, matches,
+                  extract_seconds, generate_seconds, nfeatures, generator, max_distance, thresholds, options):
+        best = []
+        verify_seconds = []
+        for q, query in enumerate(queries):
+            descriptors = query_descriptors[q]
+            best_score, best_id, seconds = 0.0, None, 0.0
+            for image_id in candidates[q]:
+                stored = corpus_descriptors[image_id - 1]
+                if descriptors is None or stored is None:
+                    continue
+                key = (q, image_id)
+                if key not in matches:
+                    start_time = time.perf_counter()
+                    matches[key] = (match_orb_descriptors(descriptors, stored), time.perf_counter() - start_time)
+                distances, match_seconds = matches[key]
+                seconds += match_seconds
+                score = orb_similarity(distances, len(descriptors), len(stored), max_distance)
+                if score > best_score:
+                    best_score, best_id = score, image_id
+            best.append((best_score, best_id))
+            verify_seconds.append(seconds)
+
+        group_of = {item["id"]: item["group"] for item in corpus}
+        best = [(score, group_of.get(image_id)) for score, image_id in best]
+        positives = [q for q, query in enumerate(queries) if query["positive"]]
+        curve = [self._point(queries, best, threshold) for threshold in thresholds]
+        eligible = [p for p in curve if p["precision"] >= options["target_precision"]]
+        operating_point = max(eligible, key=lambda p: (p["recall"], -p["threshold"])) if eligible else None
+
+        current = self._point(queries, best, ORB_SIMILARITY_THRESHOLD)
+        recall_by_transform = {}
+        for transform in sorted({queries[q]["transform"] for q in positives}):
+            subset = [q for q in positives if queries[q]["transform"] == transform]
+            found = sum(1 for q in subset if best[q][1] == queries[q]["group"] and best[q][0] >= ORB_SIMILARITY_THRESHOLD)
+            recall_by_transform[transform] = found / len(subset)
+
+        latency = summarize_timings([
+            extract_seconds[q] + generate_seconds[q] + verify_seconds[q] for q in range(len(queries))
+        ])
+        latency.update({
+            "extract_mean_ms": float(np.mean(extract_seconds)) * 1000,
+            "candidates_mean_ms": float(np.mean(generate_seconds)) * 1000,
+            "verify_mean_ms": float(np.mean(verify_seconds)) * 1000,
+            "mean_candidates": float(np.mean([len(c) for c in candidates])),
+        })
+        return {
+            "nfeatures": nfeatures,
+            "candidates": generator,
+            "max_distance": max_distance,
+            "is_current": (
+                nfeatures == CURRENT_NFEATURES and generator == "linear" and max_distance == ORB_MATCH_MAX_DISTANCE
+            ),
+            # Share of positive queries with a duplicate among the verified candidates
+            "candidate_recall": sum(
+                1 for q in positives if any(group_of[image_id] == queries[q]["group"] for image_id in candidates[q])
+            ) / len(positives) if positives else None,
+            "latency": latency,
+            "at_current_threshold": current,
+            "recall_by_transform": recall_by_transform,
+            "operating_point": operating_point,
+            "curve": curve,
+        }
+
+    def _point(self, queries, best, threshold):
+        """Precision and recall when the best-scoring candidate is reported as a duplicate at ``threshold``."""
+        tp = fp = fn = 0
+        for query, (score, group) in zip(queries, best):
+            predicted = group is not None and score >= threshold
+            correct = predicted and group == query["group"]
+            if correct:
+                tp += 1
+            elif predicted:
+                fp += 1
+            if query["positive"] and not correct:
+                fn += 1
+        return {
+            "threshold": threshold,
+            "precision": tp / (tp + fp) if tp + fp else 1.0,
+            "recall": tp / (tp + fn) if tp + fn else 0.0,
+            "tp": tp,
+            "fp": fp,
+            "fn": fn,
+        }
+
+    def _print_summary(self, report):
+        current = report["meta"]["current"]
+        self.stdout.write(
+            f"{'nfeatures':>9} {'candidates':>12} {'max_dist':>8} "
+            f"{'P@' + format(current['threshold'], '.2f'):>7} {'R@' + format(current['threshold'], '.2f'):>7} "
+            f"{'op.thr':>6} {'op.P':>6} {'op.R':>6} {'p50 ms':>8} {'p95 ms':>8}"
+        )
+        for config in report["configurations"]:
+            at_current = config["at_current_threshold"]
+            op = config["operating_point"] or {}
+            line = (
+                f"{config['nfeatures']:>9} {config['candidates']:>12} {config['max_distance']:>8} "
+                f"{at_current['precision']:>7.3f} {at_current['recall']:>7.3f} "
+                f"{op.get('threshold', float('nan')):>6.2f} {op.get('precision', float('nan')):>6.3f} "
+                f"{op.get('recall', float('nan')):>6.3f} "
+                f"{config['latency']['p50_ms']:>8.1f} {config['latency']['p95_ms']:>8.1f}"
+            )
+            self.stdout.write(self.style.SUCCESS(line + "  (current)") if config["is_current"] else line)
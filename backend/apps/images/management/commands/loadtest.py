@@ -0,0 +1,454 @@
+import itertools
+import json
+import os
+import platform
+import random
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connection
+from django.test.utils import override_settings
+
+from apps.images.services import config
+from ._chain import (
+    DEFAULT_CONTRACT_SOURCE,
+    DEFAULT_SOLC_VERSION,
+    LocalChain,
+    compile_contract,
+    disconnect_chain,
+    load_artifact,
+    restore_chain
+)
+from ._common import DEFAULT_IMAGE_DIR, list_image_files, summarize_timings
+from ._synthetic import near_duplicate, unique_image
+
+ENDPOINTS = ("upload", "list", "file")
+IMAGE_KINDS = ("unique", "exact", "near")
+
+# Upload outcome each kind of image should get
+EXPECTED_OUTCOMES = {"unique": "created", "exact": "exact_duplicate", "near": "similar"}
+
+# Server configuration recorded with every in-process run
+RECORDED_CONFIG = (
+    "CPU_POOL_KIND", "CPU_POOL_WORKERS", "DEEPFAKE_BACKEND", "ORB_DECODE_TARGET_LONG_SIDE",
+    "BOVW_ENABLED", "EMBEDDING_INDEX_ENABLED", "BATCH_UPLOAD_WORKERS",
+)
+
+# Metrics compared against baselines and whether higher values are better
+COMPARED_METRICS = (
+    ("throughput_rps", True),
+    ("p50_ms", False),
+    ("p95_ms", False),
+    ("p99_ms", False),
+    ("error_rate", False),
+)
+
+# Uploaded images kept around as sources for duplicates
+DUPLICATE_SOURCES = 200
+
+
+def parse_mix(value, names):
+    """Parse "name=weight,..." into a weight per name."""
+    weights = {}
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in names:
+            raise CommandError(f"Unknown mix entry {name!r}, expected one of {', '.join(names)}")
+        try:
+            weights[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise CommandError(f"Invalid weight in {part!r}")
+    if not weights or sum(weights.values()) <= 0:
+        raise CommandError(f"Mix {value!r} has no positive weights")
+    return weights
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Workload:
+    """Chooses requests and tracks the uploaded images shared by the client threads."""
+
+    def __init__(self, samples, endpoint_mix, image_mix, seed):
+        self.samples = samples
+        self.endpoints, self.endpoint_weights = zip(*endpoint_mix.items())
+        self.kinds, self.kind_weights = zip(*image_mix.items())
+        self.seed = seed
+        self._seeds = itertools.count()
+        self._lock = threading.Lock()
+        self._sources = deque(maxlen=DUPLICATE_SOURCES)
+        self._image_ids = []
+
+    def next_seed(self):
+        with self._lock:
+            return self.seed * 1000003 + next(self._seeds)
+
+    def pick_endpoint(self, rng):
+        endpoint = rng.choices(self.endpoints, self.endpoint_weights)[0]
+        if endpoint == "file" and not self._image_ids:
+            return "upload"
+        return endpoint
+
+    def make_image(self, rng):
+        """Generate the next upload (not part of the measured latency)."""
+        kind = rng.choices(self.kinds, self.kind_weights)[0]
+        with self._lock:
+            source = rng.choice(self._sources) if self._sources else None
+        if source is None:
+            kind = "unique"
+        seed = self.next_seed()
+        if kind == "unique":
+            data = unique_image(self.samples[seed % len(self.samples)], seed)
+        elif kind == "exact":
+            data = source
+        else:
+            data = near_duplicate(source, seed)
+        return kind, f"{kind}-{seed}.jpg", data
+
+    def record_upload(self, image_id, data):
+        with self._lock:
+            self._sources.append(data)
+            self._image_ids.append(image_id)
+
+    def random_image_id(self, rng):
+        with self._lock:
+            return rng.choice(self._image_ids)
+
+
+class Results:
+    """Latencies and outcomes per endpoint, collected from all client threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+        self.outcomes = defaultdict(Counter)
+
+    def record(self, endpoint, elapsed, status, error=False, kind=None, outcome=None):
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            self.statuses[endpoint][str(status)] += 1
+            if error:
+                self.errors[endpoint] += 1
+            if kind is not None:
+                self.outcomes[kind][outcome] += 1
+
+    def endpoint_report(self, endpoint, elapsed):
+        latencies = self.latencies.get(endpoint, [])
+        summary = summarize_timings(latencies)
+        summary["throughput_rps"] = len(latencies) / elapsed if elapsed else 0.0
+        summary["errors"] = self.errors[endpoint]
+        summary["error_rate"] = self.errors[endpoint] / len(latencies) if latencies else 0.0
+        summary["statuses"] = dict(self.statuses.get(endpoint, {}))
+        return summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the upload, admin listing and image file endpoints with concurrent clients, "
+        "against an in-process server with a throwaway database and local chain, or a running server"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="Base URL of a running server; by default an in-process server is started")
+        parser.add_argument("--username", help="Login for --url (needs is_staff for the listing endpoint)")
+        parser.add_argument("--password", help="Password for --url")
+        parser.add_argument(
+            "--chain", choices=("eth-tester", "rpc", "none"), default="eth-tester",
+            help="In-process runs: local eth-tester chain, the configured BLOCKCHAIN_RPC, or no chain"
+        )
+        parser.add_argument("--contract", default=DEFAULT_CONTRACT_SOURCE, help="Contract source deployed on eth-tester")
+        parser.add_argument("--contract-artifact", help="Precompiled contract JSON (abi, bytecode), skips solc")
+        parser.add_argument("--solc-version", default=DEFAULT_SOLC_VERSION)
+        parser.add_argument("--images", default=DEFAULT_IMAGE_DIR, help="Sample images the uploads are generated from")
+        parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+        parser.add_argument("--duration", type=float, default=60.0, help="Seconds to run")
+        parser.add_argument("--requests", type=int, help="Stop after this many requests instead of --duration")
+        parser.add_argument("--warmup", type=int, default=2, help="Unique uploads sent before measuring")
+        parser.add_argument("--endpoint-mix", default="upload=6,list=2,file=2",
+                            help="Relative weights of the upload, list and file endpoints")
+        parser.add_argument("--image-mix", default="unique=6,exact=2,near=2",
+                            help="Relative weights of unique, exact duplicate and near-duplicate uploads")
+        parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--label", help="Name of the configuration under test, stored in the report")
+        parser.add_argument("--output", help="Write the report as JSON to this file")
+        parser.add_argument("--compare", nargs="+", help="Earlier reports to compare against")
+        parser.add_argument(
+            "--regression-threshold", type=float,
+            help="Fail if a compared metric is this much worse (relative) than the first baseline"
+        )
+        parser.add_argument("--keep-files", action="store_true", help="Keep the in-process run's scratch directory")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1")
+        endpoint_mix = parse_mix(options["endpoint_mix"], ENDPOINTS)
+        image_mix = parse_mix(options["image_mix"], IMAGE_KINDS)
+
+        paths = list_image_files(options["images"])
+        if not paths:
+            raise CommandError(f"No images found in {options['images']}")
+        samples = []
+        for path in paths:
+            with open(path, "rb") as f:
+                samples.append(f.read())
+        workload = Workload(samples, endpoint_mix, image_mix, options["seed"])
+
+        meta = {
+            "label": options["label"],
+            "created_at": time.time(),
+            "concurrency": options["concurrency"],
+            "duration": None if options["requests"] else options["duration"],
+            "requests": options["requests"],
+            "endpoint_mix": endpoint_mix,
+            "image_mix": image_mix,
+            "seed": options["seed"],
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        }
+
+        if options["url"]:
+            if not options["username"] or not options["password"]:
+                raise CommandError("--url needs --username and --password")
+            base_url = options["url"].rstrip("/")
+            token = self._login(base_url, options["username"], options["password"])
+            meta["target"] = base_url
+            report = self._run(base_url, token, workload, options, meta)
+        else:
+            with self._local_server(options, meta) as (base_url, token):
+                report = self._run(base_url, token, workload, options, meta)
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+        if options["compare"]:
+            self._compare(report, options["compare"], options["regression_threshold"])
+
+    def _login(self, base_url, username, password):
+        response = requests.post(f"{base_url}/api/auth/login/", json={"username": username, "password": password})
+        if response.status_code != 200:
+            raise CommandError(f"Login failed ({response.status_code}): {response.text[:200]}")
+        return response.json()["access"]
+
+    @contextmanager
+    def _local_server(self, options, meta):
+        """Serve the project from this process on a throwaway database, media directory and chain."""
+        from rest_framework_simplejwt.tokens import RefreshToken
+        from apps.users.models import User
+
+        for path in (config.BOVW_INDEX_PATH, config.EMBEDDING_INDEX_PATH):
+            if os.path.exists(path):
+                self.stderr.write(self.style.WARNING(
+                    f"{path} was built for another database and will return stale candidates; "
+                    f"run with --settings=django_backend.settings_loadtest to use empty indexes"
+                ))
+
+        workdir = tempfile.mkdtemp(prefix="honour-loadtest-")
+        if connection.vendor == "sqlite" and not connection.settings_dict["TEST"].get("NAME"):
+            # Request threads need a database file, not a per-connection in-memory database
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(workdir, "test_db.sqlite3")
+        old_database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        media = override_settings(MEDIA_ROOT=os.path.join(workdir, "media"))
+        media.enable()
+
+        chain = None
+        saved_chain = None
+        server = None
+        try:
+            meta["target"] = "in-process"
+            meta["database"] = connection.vendor
+            meta["chain"] = options["chain"]
+            meta["config"] = {name: getattr(config, name) for name in RECORDED_CONFIG}
+            if options["chain"] == "eth-tester":
+                if options["contract_artifact"]:
+                    abi, bytecode = load_artifact(options["contract_artifact"])
+                else:
+                    abi, bytecode = compile_contract(options["contract"], options["solc_version"])
+                chain = LocalChain(abi, bytecode).start()
+            elif options["chain"] == "none":
+                saved_chain = disconnect_chain()
+
+            user = User.objects.create_user(
+                username="loadtest", password=secrets.token_urlsafe(16), is_staff=True, role="admin"
+            )
+            token = str(RefreshToken.for_user(user).access_token)
+
+            server = ThreadedWSGIServer(("127.0.0.1", 0), _QuietRequestHandler)
+            server.set_app(get_internal_wsgi_application())
+            threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True).start()
+            host, port = server.server_address[:2]
+            self.stderr.write(f"Serving on http://{host}:{port} with a throwaway {connection.vendor} database")
+
+            yield f"http://{host}:{port}", token
+
+            if chain is not None:
+                meta["chain_stats"] = chain.stats()
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            if chain is not None:
+                chain.stop()
+            if saved_chain is not None:
+                restore_chain(saved_chain)
+            media.disable()
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            if options["keep_files"]:
+                self.stderr.write(f"Scratch files kept in {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    def _run(self, base_url, token, workload, options, meta):
+        results = Results()
+        local = threading.local()
+
+        def session():
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+                local.session.headers["Authorization"] = f"Bearer {token}"
+            return local.session
+
+        def upload(rng, measured=True):
+            kind, name, data = workload.make_image(rng)
+            start_time = time.perf_counter()
+            try:
+                response = session().post(
+                    f"{base_url}/api/images/upload/",
+                    files={"file": (name, data, "image/jpeg")},
+                    timeout=options["timeout"]
+                )
+            except requests.RequestException:
+                if measured:
+                    results.record("upload", time.perf_counter() - start_time, "exception", error=True,
+                                   kind=kind, outcome="error")
+                return
+            elapsed = time.perf_counter() - start_time
+
+            outcome, error = "error", True
+            if response.status_code == 201:
+                outcome, error = "created", False
+                workload.record_upload(response.json()["id"], data)
+            elif response.status_code == 400:
+                duplicate_type = response.json().get("duplicate_type")
+                if duplicate_type is not None:
+                    outcome, error = ("exact_duplicate" if duplicate_type == "exact" else "similar"), False
+            if measured:
+                results.record("upload", elapsed, response.status_code, error=error, kind=kind, outcome=outcome)
+
+        def get(endpoint, url):
+            start_time = time.perf_counter()
+            try:
+                response = session().get(url, timeout=options["timeout"])
+                # Include the transfer of the whole body
+                response.content
+            except requests.RequestException:
+                results.record(endpoint, time.perf_counter() - start_time, "exception", error=True)
+                return
+            results.record(endpoint, time.perf_counter() - start_time, response.status_code,
+                           error=response.status_code != 200)
+
+        warmup_rng = random.Random(options["seed"])
+        for _ in range(options["warmup"]):
+            upload(warmup_rng, measured=False)
+
+        issued = itertools.count()
+        issued_lock = threading.Lock()
+        deadline = None if options["requests"] else time.perf_counter() + options["duration"]
+
+        def client(index):
+            rng = random.Random(options["seed"] * 7919 + index)
+            while True:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                if options["requests"] is not None:
+                    with issued_lock:
+                        if next(issued) >= options["requests"]:
+                            return
+                endpoint = workload.pick_endpoint(rng)
+                if endpoint == "upload":
+                    upload(rng)
+                elif endpoint == "list":
+                    get("list", f"{base_url}/api/images/admin/images/?page=1&limit=20")
+                else:
+                    get("file", f"{base_url}/api/images/{workload.random_image_id(rng)}/file/")
+
+        self.stderr.write(f"Running {options['concurrency']} clients against {base_url}")
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"], thread_name_prefix="loadtest-client") as pool:
+            for future in [pool.submit(client, i) for i in range(options["concurrency"])]:
+                future.result()
+        elapsed = time.perf_counter() - start_time
+
+        endpoints = {endpoint: results.endpoint_report(endpoint, elapsed)
+                     for endpoint in ENDPOINTS if results.latencies.get(endpoint)}
+        total = sum(len(latencies) for latencies in results.latencies.values())
+        overall = summarize_timings([t for latencies in results.latencies.values() for t in latencies])
+        overall["throughput_rps"] = total / elapsed if elapsed else 0.0
+        overall["errors"] = sum(results.errors.values())
+        overall["error_rate"] = overall["errors"] / total if total else 0.0
+        if "upload" in endpoints:
+            endpoints["upload"]["outcomes"] = {kind: dict(counts) for kind, counts in results.outcomes.items()}
+            endpoints["upload"]["unexpected_outcomes"] = sum(
+                count for kind, counts in results.outcomes.items()
+                for outcome, count in counts.items()
+                if outcome not in (EXPECTED_OUTCOMES[kind], "error")
+            )
+
+        meta["elapsed_seconds"] = elapsed
+        return {"meta": meta, "endpoints": endpoints, "overall": overall}
+
+    def _compare(self, report, baseline_paths, threshold):
+        regressions = []
+        for position, path in enumerate(baseline_paths):
+            with open(path) as f:
+                baseline = json.load(f)
+            label = baseline.get("meta", {}).get("label") or path
+            self.stdout.write(f"Comparison against {label}:")
+            current_sections = dict(report["endpoints"], overall=report["overall"])
+            baseline_sections = dict(baseline.get("endpoints", {}), overall=baseline.get("overall", {}))
+            for name, current in current_sections.items():
+                previous = baseline_sections.get(name)
+                if not previous:
+                    self.stdout.write(f"  {name}: not in baseline")
+                    continue
+                for metric, higher_is_better in COMPARED_METRICS:
+                    if metric not in current or metric not in previous:
+                        continue
+                    before, after = previous[metric], current[metric]
+                    if metric == "error_rate":
+                        worse = after - before
+                        line = f"  {name}.{metric}: {before:.2%} -> {after:.2%}"
+                    else:
+                        if not before:
+                            continue
+                        change = after / before - 1
+                        worse = -change if higher_is_better else change
+                        line = f"  {name}.{metric}: {before:.2f} -> {after:.2f} ({change:+.1%})"
+                    # Only the first baseline gates; the others are for side-by-side reading
+                    if position == 0 and threshold is not None and worse > threshold:
+                        regressions.append(f"{name}.{metric}")
+                        self.stdout.write(self.style.ERROR(line + " REGRESSION"))
+                    else:
+                        self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} regressions: {', '.join(regressions)}")
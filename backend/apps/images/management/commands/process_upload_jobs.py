@@ -0,0 +1,38 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.images.services.config import UPLOAD_JOB_POLL_INTERVAL
+from apps.images.services.upload_jobs import claim_next_job, run_upload_job
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Process queued asynchronous upload jobs (use with UPLOAD_JOB_MODE=external)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+        parser.add_argument(
+            "--poll-interval", type=float, default=UPLOAD_JOB_POLL_INTERVAL,
+            help="Seconds to wait between polls when the queue is empty"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Waiting for upload jobs...")
+        while True:
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            try:
+                run_upload_job(job.id)
+            except Exception as e:
+                logger.error(f"Upload job {job.id} crashed: {str(e)}")
+            self.stdout.write(f"Processed upload job {job.id}")
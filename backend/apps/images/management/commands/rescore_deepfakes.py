@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from apps.images.models import Image
+from apps.images.services.blockchain_service import update_image_on_blockchain
+from apps.images.services.config import BASE_DIR, DEEPFAKE_BACKEND
+from apps.images.services.cpu_pool import preprocess_for_xception
+from apps.images.services.embedding_index import embedding_to_bytes
+from apps.images.services.inference import interpret_prediction, load_inference_backend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT = os.path.join(BASE_DIR, "rescore_deepfakes.checkpoint.json")
+
+RESCORE_FIELDS = ["deepfake_label", "deepfake_confidence", "deepfake_model_version"]
+
+
+def _load_image(image):
+    """Read an image from storage and preprocess it (runs on the reader pool)."""
+    try:
+        with image.image_file.open("rb") as f:
+            return preprocess_for_xception(f.read())
+    except Exception as e:
+        logger.error(f"Failed to read image {image.id} ({image.image_file.name}): {str(e)}")
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-score stored images with the current deepfake model, in batches, with resumable checkpoints; "
+        "also backfills the Xception embeddings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", default=DEEPFAKE_BACKEND, help="Inference backend (keras, tflite or onnx)")
+        parser.add_argument("--model-path", help="Model file, defaults to the backend's configured model")
+        parser.add_argument("--batch-size", type=int, default=64, help="Images per inference batch")
+        parser.add_argument("--readers", type=int, default=os.cpu_count() or 4,
+                            help="Threads reading and preprocessing images from storage")
+        parser.add_argument("--prefetch", type=int, default=4,
+                            help="Batches read ahead of the batch being scored")
+        parser.add_argument("--limit", type=int, help="Stop after this many images")
+        parser.add_argument("--force", action="store_true",
+                            help="Re-score images already scored by this model version")
+        parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Progress file")
+        parser.add_argument("--resume", action="store_true", help="Continue after the last checkpointed image")
+        parser.add_argument("--queue-chain-updates", action="store_true",
+                            help="Call update_image_on_blockchain for images whose label changed")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1 or options["readers"] < 1 or options["prefetch"] < 1:
+            raise CommandError("--batch-size, --readers and --prefetch must be at least 1")
+
+        try:
+            backend = load_inference_backend(options["backend"], options["model_path"])
+        except Exception as e:
+            raise CommandError(str(e))
+        version = backend.version
+
+        last_id = 0
+        if options["resume"]:
+            checkpoint = self._read_checkpoint(options["checkpoint"])
+            if checkpoint:
+                if checkpoint.get("model_version") != version:
+                    raise CommandError(
+                        f"Checkpoint was written for model {checkpoint.get('model_version')}, "
+                        f"current model is {version}"
+                    )
+                last_id = checkpoint["last_id"]
+        self.stdout.write(f"Re-scoring with {version}, starting after image id {last_id}")
+        if not backend.has_embeddings:
+            self.stdout.write("The model exposes no embeddings, only scores are updated")
+
+        self.stats = {"scored": 0, "changed": 0, "unreadable": 0, "chain_queued": 0, "chain_failed": 0}
+        chain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rescore-chain") \
+            if options["queue_chain_updates"] else None
+        self.chain_futures = []
+
+        start_time = time.time()
+        batches = self._iter_batches(last_id, version, backend.has_embeddings, options)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=options["readers"], thread_name_prefix="rescore-reader") as readers:
+            # Keep a window of batches loading while the current one is scored
+            for batch in batches:
+                pending.append((batch, [readers.submit(_load_image, image) for image in batch]))
+                if len(pending) > options["prefetch"]:
+                    self._score_batch(backend, version, *pending.popleft(), chain_executor, options)
+                    self._report(start_time)
+            while pending:
+                self._score_batch(backend, version, *pending.popleft(), chain_executor, options)
+                self._report(start_time)
+
+        if chain_executor is not None:
+            self.stdout.write(f"Waiting for {len(self.chain_futures)} blockchain updates...")
+            for future in self.chain_futures:
+                try:
+                    future.result()
+                except Exception:
+                    self.stats["chain_failed"] += 1
+            chain_executor.shutdown()
+
+        elapsed = time.time() - start_time
+        summary = dict(self.stats, model_version=version, elapsed_seconds=round(elapsed, 1))
+        summary["images_per_second"] = round(self.stats["scored"] / elapsed, 1) if elapsed else None
+        self.stdout.write(json.dumps(summary, indent=2))
+
+    def _iter_batches(self, last_id, version, has_embeddings, options):
+        """Yield batches of images in id order using keyset pagination."""
+        queryset = Image.objects.exclude(Q(image_file="") | Q(image_file__isnull=True))
+        if not options["force"]:
+            outdated = ~Q(deepfake_model_version=version)
+            if has_embeddings:
+                # Also pick up images scored by this version before embeddings were stored
+                outdated |= Q(embedding__isnull=True)
+            queryset = queryset.filter(outdated)
+        queryset = queryset.only("id", "sha256_hash", "image_file", *RESCORE_FIELDS).order_by("id")
+
+        remaining = options["limit"]
+        while remaining is None or remaining > 0:
+            size = options["batch_size"] if remaining is None else min(options["batch_size"], remaining)
+            batch = list(queryset.filter(id__gt=last_id)[:size])
+            if not batch:
+                return
+            last_id = batch[-1].id
+            if remaining is not None:
+                remaining -= len(batch)
+            yield batch
+
+    def _score_batch(self, backend, version, batch, futures, chain_executor, options):
+        arrays = [future.result() for future in futures]
+        loaded = [(image, array) for image, array in zip(batch, arrays) if array is not None]
+        self.stats["unreadable"] += len(batch) - len(loaded)
+
+        updated = []
+        embeddings = None
+        if loaded:
+            predictions, embeddings = backend.predict_with_embeddings(np.stack([array for _, array in loaded]))
+            for i, ((image, _), prediction) in enumerate(zip(loaded, predictions)):
+                result = interpret_prediction(prediction)
+                if result["label"] != image.deepfake_label:
+                    self.stats["changed"] += 1
+                    if chain_executor is not None:
+                        self.chain_futures.append(chain_executor.submit(
+                            update_image_on_blockchain, image.sha256_hash, result["label"], result["confidence"]
+                        ))
+                        self.stats["chain_queued"] += 1
+                image.deepfake_label = result["label"]
+                image.deepfake_confidence = result["confidence"]
+                image.deepfake_model_version = version
+                if embeddings is not None:
+                    image.embedding = embedding_to_bytes(embeddings[i])
+                updated.append(image)
+
+        with transaction.atomic():
+            Image.objects.bulk_update(updated, RESCORE_FIELDS + (["embedding"] if embeddings is not None else []))
+        self.stats["scored"] += len(updated)
+        # Only checkpoint once the batch is committed
+        self._write_checkpoint(options["checkpoint"], {"model_version": version, "last_id": batch[-1].id})
+
+    def _report(self, start_time):
+        elapsed = time.time() - start_time
+        rate = self.stats["scored"] / elapsed if elapsed else 0.0
+        self.stdout.write(f"Scored {self.stats['scored']} images ({rate:.1f}/s), {self.stats['changed']} labels changed")
+
+    def _read_checkpoint(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_checkpoint(self, path, checkpoint):
+        # Write then rename so an interrupted run never leaves a truncated checkpoint
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
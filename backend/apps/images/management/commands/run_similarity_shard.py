@@ -0,0 +1,38 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.images.services.shard_server import ShardIndex, serve_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve similarity queries for one partition of the images (see services/shards.py); "
+        "list the shards' URLs in partition order in SIMILARITY_SHARDS on the application servers"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shard", type=int, required=True, help="Partition served by this node, from 0")
+        parser.add_argument("--shards", type=int, required=True, help="Total number of partitions")
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8100)
+
+    def handle(self, *args, **options):
+        if not 0 <= options["shard"] < options["shards"]:
+            raise CommandError("--shard must be between 0 and --shards - 1")
+
+        index = ShardIndex(options["shard"], options["shards"])
+        start_time = time.time()
+        index.sync()
+        connection.close()
+        self.stdout.write(json.dumps(index.stats(), indent=2))
+        self.stdout.write(
+            f"Loaded shard {options['shard']} of {options['shards']} in {time.time() - start_time:.1f}s; "
+            f"serving on http://{options['host']}:{options['port']}/"
+        )
+        try:
+            serve_shard(index, options["host"], options["port"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.images.models import Image
+from apps.images.services.bovw_index import descriptors_from_features, save_vocabulary, train_vocabulary
+from apps.images.services.config import BOVW_VOCABULARY_PATH, BOVW_VOCABULARY_SIZE, ORB_DECODE_TARGET_LONG_SIDE
+from apps.images.services.cpu_pool import extract_orb_features
+from ._common import list_image_files
+
+
+class Command(BaseCommand):
+    help = "Train the binary visual-word vocabulary for the BoVW index from stored ORB descriptors"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--words", type=int, default=BOVW_VOCABULARY_SIZE)
+        parser.add_argument("--sample-images", type=int, default=5000, help="Images sampled from the corpus")
+        parser.add_argument("--descriptors-per-image", type=int, default=200)
+        parser.add_argument("--iterations", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--images", help="Train from image files in this directory instead of the database")
+        parser.add_argument("--output", default=BOVW_VOCABULARY_PATH)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        samples = []
+        for descriptors in self._iter_descriptors(options):
+            if descriptors is None:
+                continue
+            take = min(len(descriptors), options["descriptors_per_image"])
+            samples.append(descriptors[rng.choice(len(descriptors), take, replace=False)])
+        if not samples:
+            raise CommandError("No ORB descriptors found to train on")
+
+        descriptors = np.concatenate(samples)
+        self.stdout.write(f"Training {options['words']} words on {len(descriptors)} descriptors from {len(samples)} images")
+        start_time = time.time()
+        try:
+            vocabulary = train_vocabulary(descriptors, options["words"], options["iterations"], options["seed"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        save_vocabulary(options["output"], vocabulary, meta={
+            "words": options["words"],
+            "training_descriptors": len(descriptors),
+            "training_images": len(samples),
+            "trained_at": time.time(),
+        })
+        self.stdout.write(f"Vocabulary trained in {time.time() - start_time:.1f}s and saved to {options['output']}")
+        self.stdout.write("Run build_bovw_index to index the corpus with it")
+
+    def _iter_descriptors(self, options):
+        if options["images"]:
+            for path in list_image_files(options["images"], limit=options["sample_images"]):
+                with open(path, "rb") as f:
+                    _, descriptors, _ = extract_orb_features(f.read(), 1000, ORB_DECODE_TARGET_LONG_SIDE)
+                yield descriptors
+            return
+
+        images = Image.objects.filter(orb_features__isnull=False).order_by("?")[:options["sample_images"]]
+        for img in images.only("id", "orb_features").iterator():
+            yield descriptors_from_features(img.orb_features)
@@ -0,0 +1,159 @@
+"""
+Request middleware for the images app.
+
+Both middlewares are sync and async capable, so under ASGI requests to
+async views never pass through a thread on their account.
+"""
+
+import contextvars
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+
+from .services.config import MEMORY_PROFILE_PATHS, MEMORY_PROFILING_ENABLED, TRACING_ENABLED
+from .services.memory_profiler import start_memory_profile
+from .services.tracing import Trace
+
+
+class _HybridMiddleware:
+    """Runs __acall__ when Django hands it an async get_response, __call__ otherwise."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._async = iscoroutinefunction(get_response)
+        if self._async:
+            markcoroutinefunction(self)
+
+
+class TracingMiddleware(_HybridMiddleware):
+    """
+    Open a trace around each request (see services/tracing.py).
+
+    The trace id is returned in the X-Trace-Id header so a slow response can
+    be looked up in the exported traces.
+    """
+
+    def __init__(self, get_response):
+        if not TRACING_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self._async:
+            return self.__acall__(request)
+        trace = self._start(request)
+        try:
+            response = self.get_response(request)
+        except Exception as e:
+            trace.deactivate()
+            trace.finish(e)
+            raise
+        return self._respond(trace, response)
+
+    async def __acall__(self, request):
+        trace = self._start(request)
+        try:
+            response = await self.get_response(request)
+        except Exception as e:
+            trace.deactivate()
+            trace.finish(e)
+            raise
+        return self._respond(trace, response)
+
+    def _start(self, request):
+        trace = Trace(
+            f"{request.method} {request.path}",
+            traceparent=request.META.get("HTTP_TRACEPARENT"),
+            **{"http.method": request.method, "http.target": request.path}
+        )
+        trace.activate()
+        return trace
+
+    def _respond(self, trace, response):
+        response["X-Trace-Id"] = trace.trace_id
+        trace.root.set_attribute("http.status_code", response.status_code)
+        if response.streaming:
+            # The body is produced while the server iterates it, after this returns
+            response.streaming_content = _iterate_in_context(
+                response.streaming_content, contextvars.copy_context(), trace.finish
+            )
+            trace.deactivate()
+        else:
+            trace.deactivate()
+            trace.finish()
+        return response
+
+
+class MemoryProfilingMiddleware(_HybridMiddleware):
+    """
+    Profile the memory of requests under MEMORY_PROFILE_PATHS (see services/memory_profiler.py).
+    """
+
+    def __init__(self, get_response):
+        if not MEMORY_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self._async:
+            return self.__acall__(request)
+        profile = self._start(request)
+        if profile is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        except Exception as e:
+            profile.deactivate()
+            profile.finish(error=type(e).__name__)
+            raise
+        return self._respond(profile, response)
+
+    async def __acall__(self, request):
+        profile = self._start(request)
+        if profile is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        except Exception as e:
+            profile.deactivate()
+            profile.finish(error=type(e).__name__)
+            raise
+        return self._respond(profile, response)
+
+    def _start(self, request):
+        if not request.path.startswith(tuple(MEMORY_PROFILE_PATHS)):
+            return None
+        profile = start_memory_profile(f"{request.method} {request.path}")
+        if profile is not None:
+            profile.activate()
+        return profile
+
+    def _respond(self, profile, response):
+        if response.streaming:
+            response.streaming_content = _iterate_in_context(
+                response.streaming_content,
+                contextvars.copy_context(),
+                lambda: profile.finish(status_code=response.status_code)
+            )
+            profile.deactivate()
+        else:
+            profile.deactivate()
+            profile.finish(status_code=response.status_code)
+        return response
+
+
+def _iterate_in_context(content, context, finish):
+    """Produce a streaming body inside the request's context, then call finish."""
+    iterator = iter(content)
+    try:
+        while True:
+            try:
+                chunk = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield chunk
+    finally:
+        finish()
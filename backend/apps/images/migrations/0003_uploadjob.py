@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.core.serializers.json
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('images', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(db_index=True, default='queued', max_length=20)),
+                ('stage', models.CharField(blank=True, max_length=20, null=True)),
+                ('stages', models.JSONField(default=list)),
+                ('file', models.FileField(blank=True, null=True, upload_to='upload_jobs/')),
+                ('file_name', models.CharField(max_length=255)),
+                ('sha256_hash', models.CharField(max_length=64)),
+                ('result', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_jobs', to='images.image')),
+                ('uploader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
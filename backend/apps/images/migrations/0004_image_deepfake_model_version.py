@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0003_uploadjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='deepfake_model_version',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
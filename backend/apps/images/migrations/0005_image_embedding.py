@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0004_image_deepfake_model_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
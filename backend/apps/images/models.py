@@ -1,4 +1,7 @@
 # apps/images/models.py
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.conf import settings
 
@@ -18,6 +21,8 @@ class Image(models.Model):
     # Deepfake results
     deepfake_label = models.CharField(max_length=10, null=True, blank=True)  # "Real" or "Fake"
     deepfake_confidence = models.FloatField(null=True, blank=True)
+    deepfake_model_version = models.CharField(max_length=64, null=True, blank=True)  # Model that produced the score
+    embedding = models.BinaryField(null=True, blank=True)  # Pooled Xception embedding, L2-normalized float16
     
     # Verification status
     is_verified = models.BooleanField(default=False)
@@ -51,4 +56,46 @@ class AuditLog(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"[{self.timestamp}] user={self.user_id}, action={self.action}"
\ No newline at end of file
+        return f"[{self.timestamp}] user={self.user_id}, action={self.action}"
+
+class UploadJob(models.Model):
+    """An upload processed asynchronously by a worker."""
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"  # Image stored
+    STATUS_REJECTED = "rejected"  # Exact duplicate or similar image found
+    STATUS_FAILED = "failed"
+    TERMINAL_STATUSES = (STATUS_COMPLETED, STATUS_REJECTED, STATUS_FAILED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploader = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="upload_jobs"
+    )
+    status = models.CharField(max_length=20, default=STATUS_QUEUED, db_index=True)
+    stage = models.CharField(max_length=20, null=True, blank=True)  # Stage currently running
+    stages = models.JSONField(default=list)  # [{"name", "status", "started_at", "elapsed_ms"}, ...]
+
+    # Upload staged in storage until the worker has processed it
+    file = models.FileField(upload_to="upload_jobs/", null=True, blank=True)
+    file_name = models.CharField(max_length=255)
+    sha256_hash = models.CharField(max_length=64)
+
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(null=True, blank=True)
+    image = models.ForeignKey(
+        Image,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name="upload_jobs"
+    )
+
+    # Renewed by the worker running the job; once it lapses another worker may take the job over
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"UploadJob {self.id} - {self.status}"
@@ -0,0 +1,12 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets DRF content negotiation accept ``text/event-stream`` requests."""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Event streams are returned as StreamingHttpResponse; this only renders errors
+        return f"event: error\ndata: {data}\n\n".encode(self.charset)
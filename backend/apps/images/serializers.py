@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Image
+from .models import Image, UploadJob
 
 class ImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
@@ -22,4 +22,14 @@ class ImageSerializer(serializers.ModelSerializer):
         return None
     
     def get_uploader_username(self, obj):
-        return obj.uploader.username if obj.uploader else None
\ No newline at end of file
+        return obj.uploader.username if obj.uploader else None
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+    
+    class Meta:
+        model = UploadJob
+        fields = [
+            'job_id', 'status', 'stage', 'stages', 'file_name', 'sha256_hash',
+            'result', 'error', 'image', 'created_at', 'updated_at'
+        ]
@@ -0,0 +1,295 @@
+"""
+Admission control for uploads, with per-user weighted fair queuing.
+
+Each process runs at most ADMISSION_MAX_CONCURRENCY uploads at a time.
+Further uploads wait in a bounded queue: at most ADMISSION_QUEUE_SIZE in
+total and ADMISSION_USER_QUEUE_SIZE per user. An upload that finds the queue
+full, or waits longer than ADMISSION_MAX_WAIT_SECONDS, is rejected with
+AdmissionRejected, which the views turn into 429 with Retry-After.
+
+Waiting uploads are admitted in start-time fair queuing order. Each one is
+tagged with a virtual start time
+
+    start = max(virtual time, finish of the user's previous upload)
+    finish = start + 1 / weight
+
+and the smallest start goes next, advancing the virtual time to it. A
+burst from one user gets increasing tags, so another user's upload waits
+behind at most one of the burst's instead of all of them. Staff users have
+ADMISSION_STAFF_WEIGHT and get proportionally more of the slots while
+others are waiting.
+
+When a slot is released it is handed straight to the next waiter, so a new
+arrival cannot overtake the queue.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import nullcontext
+
+from .config import (
+    ADMISSION_CONTROL_ENABLED,
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_WAIT_SECONDS,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_STAFF_WEIGHT,
+    ADMISSION_USER_QUEUE_SIZE
+)
+from .exceptions import AdmissionRejected
+from .metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+
+# Smoothing of the service time estimate behind Retry-After
+SERVICE_TIME_ALPHA = 0.2
+
+
+class _Waiter:
+    """A queued request, woken through an Event (threads) or a future (event loop)."""
+
+    __slots__ = ("user_key", "granted", "cancelled", "event", "loop", "future")
+
+    def __init__(self, user_key, loop=None):
+        self.user_key = user_key
+        self.granted = False
+        self.cancelled = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def grant(self):
+        self.granted = True
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Admission:
+    """A granted slot; release it (or leave the with block) when the request is done."""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._start_time = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(time.monotonic() - self._start_time)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded, weighted fair wait queue.
+
+    Args:
+        name: Endpoint label of the metrics
+        max_concurrency: Requests admitted at once
+        queue_size: Requests allowed to wait
+        user_queue_size: Requests one user may have waiting
+        max_wait: Seconds a request may wait before it is rejected
+    """
+
+    def __init__(self, name, max_concurrency, queue_size, user_queue_size, max_wait):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.user_queue_size = user_queue_size
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._queued_by_user = {}
+        # (virtual start, arrival order, waiter)
+        self._heap = []
+        self._order = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        self._service_seconds = 1.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "max_concurrency": self.max_concurrency,
+                "queue_size": self.queue_size,
+                "service_seconds": round(self._service_seconds, 3),
+            }
+
+    def _retry_after(self):
+        # Time for the queue ahead to drain through the slots, at least a second
+        return max(1, math.ceil(self._service_seconds * (self._queued + 1) / self.max_concurrency))
+
+    def _reject(self, reason, message):
+        ADMISSION_REJECTIONS.labels(endpoint=self.name, reason=reason).inc()
+        return AdmissionRejected(message, reason=reason, retry_after=self._retry_after())
+
+    def _tag(self, user_key, weight):
+        start = max(self._virtual_time, self._last_finish.get(user_key, 0.0))
+        self._last_finish[user_key] = start + 1.0 / weight
+        return start
+
+    def _enter(self, user_key, weight, loop=None):
+        """Admit immediately (returns None) or queue a waiter; raises AdmissionRejected when full."""
+        with self._lock:
+            if self._in_flight < self.max_concurrency and not self._queued:
+                self._in_flight += 1
+                self._virtual_time = self._tag(user_key, weight)
+                ADMISSION_IN_FLIGHT.labels(endpoint=self.name).inc()
+                return None
+            if self._queued >= self.queue_size:
+                raise self._reject("queue_full", "Too many uploads waiting, retry later")
+            if self._queued_by_user.get(user_key, 0) >= self.user_queue_size:
+                raise self._reject("user_queue_full", "Too many of your uploads are waiting, retry later")
+            waiter = _Waiter(user_key, loop)
+            heapq.heappush(self._heap, (self._tag(user_key, weight), next(self._order), waiter))
+            self._queued += 1
+            self._queued_by_user[user_key] = self._queued_by_user.get(user_key, 0) + 1
+            ADMISSION_QUEUED.labels(endpoint=self.name).inc()
+            return waiter
+
+    def _dequeued(self, waiter):
+        # Caller holds the lock
+        self._queued -= 1
+        remaining = self._queued_by_user[waiter.user_key] - 1
+        if remaining:
+            self._queued_by_user[waiter.user_key] = remaining
+        else:
+            del self._queued_by_user[waiter.user_key]
+        ADMISSION_QUEUED.labels(endpoint=self.name).dec()
+
+    def _withdraw(self, waiter):
+        """Take a waiter out of the queue; returns True if it was granted a slot in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self._dequeued(waiter)
+            return False
+
+    def _timed_out(self, waiter):
+        if not self._withdraw(waiter):
+            with self._lock:
+                raise self._reject("timeout", "Timed out waiting for an upload slot, retry later")
+
+    def _release(self, service_seconds=None):
+        with self._lock:
+            if service_seconds is not None:
+                self._service_seconds += SERVICE_TIME_ALPHA * (service_seconds - self._service_seconds)
+            while self._heap:
+                start, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                # The slot passes to the waiter; in-flight stays the same
+                self._virtual_time = start
+                self._dequeued(waiter)
+                waiter.grant()
+                return
+            self._in_flight -= 1
+            ADMISSION_IN_FLIGHT.labels(endpoint=self.name).dec()
+            if not self._queued and not self._in_flight:
+                # Tags only order waiting requests; idle users need not be remembered
+                self._last_finish.clear()
+
+    def _admitted(self, wait_start):
+        ADMISSION_WAIT_SECONDS.labels(endpoint=self.name).observe(time.monotonic() - wait_start)
+        return Admission(self)
+
+    def acquire(self, user_key, weight=1.0):
+        """
+        Wait for a slot, blocking the calling thread.
+
+        Returns:
+            Admission: The slot, to be released when the request is done
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out
+        """
+        wait_start = time.monotonic()
+        waiter = self._enter(user_key, weight)
+        if waiter is not None and not waiter.event.wait(self.max_wait):
+            self._timed_out(waiter)
+        return self._admitted(wait_start)
+
+    async def acquire_async(self, user_key, weight=1.0):
+        """Wait for a slot without blocking the event loop; see acquire."""
+        wait_start = time.monotonic()
+        waiter = self._enter(user_key, weight, loop=asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+            except asyncio.TimeoutError:
+                self._timed_out(waiter)
+            except asyncio.CancelledError:
+                # The client went away; hand back a slot granted in the meantime
+                if self._withdraw(waiter):
+                    self._release()
+                raise
+        return self._admitted(wait_start)
+
+
+def user_weight(user):
+    """Share of admission slots a user gets relative to others."""
+    return ADMISSION_STAFF_WEIGHT if getattr(user, "is_staff", False) else 1.0
+
+
+_upload_admission = None
+_upload_admission_lock = threading.Lock()
+
+
+def get_upload_admission():
+    """
+    Get the process-wide admission controller of the upload endpoint.
+
+    Returns:
+        AdmissionController or None: None if ADMISSION_CONTROL_ENABLED is off
+    """
+    global _upload_admission
+    if not ADMISSION_CONTROL_ENABLED:
+        return None
+    with _upload_admission_lock:
+        if _upload_admission is None:
+            _upload_admission = AdmissionController(
+                "upload", ADMISSION_MAX_CONCURRENCY, ADMISSION_QUEUE_SIZE,
+                ADMISSION_USER_QUEUE_SIZE, ADMISSION_MAX_WAIT_SECONDS
+            )
+        return _upload_admission
+
+
+def admit_upload(user):
+    """
+    Wait for an upload slot for a user; blocks the calling thread.
+
+    Returns:
+        Context manager holding the slot (a no-op one when admission control is off)
+
+    Raises:
+        AdmissionRejected: If the upload is not admitted
+    """
+    controller = get_upload_admission()
+    if controller is None:
+        return nullcontext()
+    return controller.acquire(user.pk, user_weight(user))
+
+
+async def admit_upload_async(user):
+    """Wait for an upload slot without blocking the event loop; see admit_upload."""
+    controller = get_upload_admission()
+    if controller is None:
+        return nullcontext()
+    return await controller.acquire_async(user.pk, user_weight(user))
@@ -1,5 +1,6 @@
 import threading
 from web3 import Web3
+from web3.middleware import Web3Middleware
 import json
 import logging
 import time
@@ -23,10 +24,23 @@ logger = logging.getLogger(__name__)
 
 # Import the BlockchainError exception
 from .exceptions import BlockchainError
+from .metrics import CHAIN_SECONDS, record_chain_tx
+from .tracing import bind, span, traced
 
 # Initialize Web3 connection
 w3 = None
 
+
+class TracingMiddleware(Web3Middleware):
+    """Record every JSON-RPC request as a span of the current trace."""
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            with span(f"rpc.{method}"):
+                return make_request(method, params)
+        return middleware
+
+
 def get_web3_connection():
     """
     Get or initialize the Web3 connection with timeout.
@@ -50,6 +64,7 @@ def get_web3_connection():
             
             # Initialize Web3 with the provider
             w3 = Web3(provider)
+            w3.middleware_onion.add(TracingMiddleware, "tracing")
             
             # Check connection with timeout
             def check_connection():
@@ -652,6 +667,43 @@ def check_image_exists_on_blockchain(sha256_hash):
         logger.error(f"Error checking if image exists on blockchain: {str(e)}")
         raise BlockchainError(f"Failed to check if image exists on blockchain: {str(e)}")
 
+# Serializes nonce allocation for every transaction sent from this process
+_nonce_lock = threading.Lock()
+
+def send_contract_transaction(web3, function_call, gas, gas_price):
+    """
+    Sign and submit a contract call from the default account.
+    
+    Every transaction of this process goes through here: the nonce is read
+    from the pending transaction count and the transaction submitted under
+    one lock, so concurrent uploads, batches and admin calls never sign two
+    transactions with the same nonce. Separate processes signing for the
+    same account are not coordinated.
+    
+    Args:
+        web3: Web3 connection
+        function_call: Contract function call, e.g. contract.functions.pauseContract()
+        gas: Gas limit
+        gas_price: Gas price in wei
+        
+    Returns:
+        Transaction hash
+    """
+    with _nonce_lock:
+        nonce = web3.eth.get_transaction_count(web3.eth.default_account, 'pending')
+        tx = function_call.build_transaction({
+            'from': web3.eth.default_account,
+            'nonce': nonce,
+            'gas': gas,
+            'gasPrice': gas_price
+        })
+        signed_tx = web3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
+        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+    logger.info(f"Transaction sent with nonce {nonce}: {tx_hash.hex()}")
+    return tx_hash
+
+@traced("chain.store")
+@CHAIN_SECONDS.labels(operation="store").time()
 def store_image_on_blockchain(sha256_hash, deepfake_label="Unknown", deepfake_confidence=0, max_retries=3, retry_delay=2):
     """
     Store image features on the blockchain with enhanced error handling and retry mechanism.
@@ -673,6 +725,7 @@ def store_image_on_blockchain(sha256_hash, deepfake_label="Unknown", deepfake_co
     try:
         if check_image_exists_on_blockchain(sha256_hash):
             logger.info(f"Image with hash {sha256_hash} already exists on blockchain. Skipping storage.")
+            record_chain_tx("store", "exists")
             return "IMAGE_EXISTS"
     except Exception as e:
         logger.warning(f"Error checking if image exists on blockchain: {str(e)}. Will attempt to store anyway.")
@@ -688,6 +741,7 @@ def store_image_on_blockchain(sha256_hash, deepfake_label="Unknown", deepfake_co
     conn_status = check_blockchain_connection()
     if conn_status["status"] == "error":
         logger.error(f"Blockchain connection check failed: {conn_status['message']}")
+        record_chain_tx("store", "failed")
         raise BlockchainError(f"Blockchain connection failed: {conn_status['message']}")
     else:
         logger.info(f"Blockchain connection OK: Chain ID {conn_status['chain_id']}, Gas Price {conn_status['gas_price_gwei']} Gwei")
@@ -751,62 +805,34 @@ def store_image_on_blockchain(sha256_hash, deepfake_label="Unknown", deepfake_co
                 recommended_gas_price = web3.eth.gas_price
                 logger.info(f"Using current gas price: {web3.from_wei(recommended_gas_price, 'gwei')} Gwei")
             
-            # Get nonce with retry mechanism
-            nonce = None
-            nonce_retries = 3
-            for i in range(nonce_retries):
-                try:
-                    nonce = web3.eth.get_transaction_count(web3.eth.default_account)
-                    break
-                except Exception as nonce_err:
-                    if i == nonce_retries - 1:
-                        raise
-                    logger.warning(f"Error getting nonce (attempt {i+1}/{nonce_retries}): {str(nonce_err)}")
-                    time.sleep(1)
-            
-            logger.info(f"Using nonce: {nonce}")
-            
-            # Build transaction
-            logger.info("Step 4: Building transaction...")
-            tx = contract.functions.storeImageFeatures(
-                sha256_hash,
-                deepfake_label,
-                confidence_uint
-            ).build_transaction({
-                'from': web3.eth.default_account,
-                'nonce': nonce,
-                'gas': GAS_LIMIT,
-                'gasPrice': recommended_gas_price
-            })
-            
-            # Sign transaction
-            logger.info("Step 5: Signing transaction...")
-            signed_tx = web3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-            
-            # Send transaction with timeout
-            logger.info("Step 6: Sending transaction...")
+            # Sign and send transaction with timeout
+            logger.info("Step 4: Signing and sending transaction...")
             def send_transaction():
-                tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-                logger.info(f"Transaction sent: {tx_hash.hex()}")
-                return tx_hash
+                return send_contract_transaction(
+                    web3,
+                    contract.functions.storeImageFeatures(sha256_hash, deepfake_label, confidence_uint),
+                    GAS_LIMIT,
+                    recommended_gas_price
+                )
                 
             with ThreadPoolExecutor() as executor:
-                future = executor.submit(send_transaction)
+                future = executor.submit(bind(send_transaction))
                 try:
                     tx_hash = future.result(timeout=TRANSACTION_TIMEOUT)
                     logger.info(f"Transaction hash: {tx_hash.hex()}")
                 except FutureTimeoutError:
                     elapsed = time.time() - start_time
                     logger.error(f"Transaction submission timed out after {elapsed:.2f} seconds")
+                    record_chain_tx("store", "timeout")
                     raise BlockchainError(f"Transaction submission timed out after {elapsed:.2f} seconds")
             
             # Wait for transaction receipt with timeout
-            logger.info("Step 7: Waiting for transaction confirmation...")
+            logger.info("Step 5: Waiting for transaction confirmation...")
             def wait_for_receipt():
                 return web3.eth.wait_for_transaction_receipt(tx_hash)
                 
             with ThreadPoolExecutor() as executor:
-                future = executor.submit(wait_for_receipt)
+                future = executor.submit(bind(wait_for_receipt))
                 try:
                     remaining_timeout = max(1, TRANSACTION_TIMEOUT - (time.time() - start_time))
                     logger.info(f"Waiting up to {remaining_timeout:.2f} seconds for confirmation...")
@@ -815,12 +841,14 @@ def store_image_on_blockchain(sha256_hash, deepfake_label="Unknown", deepfake_co
                     elapsed = time.time() - start_time
                     logger.warning(f"Transaction confirmation timed out after {elapsed:.2f} seconds")
                     logger.warning(f"Transaction may still be pending. Transaction hash: {tx_hash.hex()}")
+                    record_chain_tx("store", "timeout")
                     # Return the transaction hash even if confirmation times out
                     return tx_hash.hex()
             
             if tx_receipt.status == 1:
                 elapsed = time.time() - start_time
                 logger.info(f"Success! Image features stored on blockchain: {sha256_hash} (took {elapsed:.2f} seconds)")
+                record_chain_tx("store", "success")
                 return tx_receipt.transactionHash.hex()
             else:
                 logger.error(f"Transaction failed with status: {tx_receipt.status}")
@@ -837,6 +865,7 @@ def store_image_on_blockchain(sha256_hash, deepfake_label="Unknown", deepfake_co
             # Calculate exponential backoff delay
             delay = retry_delay * (2 ** current_retry)
             logger.warning(f"Attempt {current_retry} failed: {str(e)}. Retrying in {delay} seconds...")
+            record_chain_tx("store", "retry")
             time.sleep(delay)
     
     # If we get here, all retries failed
@@ -844,14 +873,119 @@ def store_image_on_blockchain(sha256_hash, deepfake_label="Unknown", deepfake_co
         # Check if the error is due to the image already existing
         if "Image with this hash already exists" in str(last_error):
             logger.info(f"Image with hash {sha256_hash} already exists on blockchain. This is not an error.")
+            record_chain_tx("store", "exists")
             return "IMAGE_EXISTS"
         else:
             logger.error(f"All {max_retries} retry attempts failed. Last error: {str(last_error)}")
+            record_chain_tx("store", "failed")
             raise BlockchainError(f"Failed to store image on blockchain after {max_retries} attempts: {str(last_error)}")
     else:
         logger.error(f"All {max_retries} retry attempts failed with unknown errors")
+        record_chain_tx("store", "failed")
         raise BlockchainError(f"Failed to store image on blockchain after {max_retries} attempts")
 
+@traced("chain.store_batch")
+@CHAIN_SECONDS.labels(operation="store_batch").time()
+def store_images_on_blockchain(items):
+    """
+    Store several images on the blockchain in one pipelined pass.
+    
+    Connection checks and gas price lookup are done once for the whole batch.
+    Transactions take their nonces from send_contract_transaction and are
+    all submitted before waiting for any receipt, so the batch costs roughly one confirmation
+    interval instead of one per image.
+    
+    Args:
+        items: Iterable of (sha256_hash, deepfake_label, deepfake_confidence) tuples
+        
+    Returns:
+        dict: Mapping of sha256_hash to the transaction hash, "IMAGE_EXISTS",
+              or None if that image could not be stored
+        
+    Raises:
+        BlockchainError: If the blockchain is unreachable
+    """
+    items = list(items)
+    results = {sha256_hash: None for sha256_hash, _, _ in items}
+    if not items:
+        return results
+    
+    start_time = time.time()
+    
+    conn_status = check_blockchain_connection()
+    if conn_status["status"] == "error":
+        logger.error(f"Blockchain connection check failed: {conn_status['message']}")
+        record_chain_tx("store_batch", "failed", len(items))
+        raise BlockchainError(f"Blockchain connection failed: {conn_status['message']}")
+    
+    web3 = get_web3_connection()
+    contract = get_contract_instance()
+    
+    # Skip images that are already anchored
+    pending = []
+    for sha256_hash, deepfake_label, deepfake_confidence in items:
+        try:
+            if contract.functions.imageExists(sha256_hash).call():
+                logger.info(f"Image with hash {sha256_hash} already exists on blockchain. Skipping storage.")
+                results[sha256_hash] = "IMAGE_EXISTS"
+                record_chain_tx("store_batch", "exists")
+                continue
+        except Exception as e:
+            logger.warning(f"Error checking if image exists on blockchain: {str(e)}. Will attempt to store anyway.")
+        
+        if not isinstance(deepfake_confidence, (int, float)) or deepfake_confidence < 0 or deepfake_confidence > 1:
+            logger.warning(f"Unexpected deepfake_confidence: {deepfake_confidence}. Expected value between 0 and 1.")
+            deepfake_confidence = max(0, min(1, float(deepfake_confidence) if isinstance(deepfake_confidence, (int, float)) else 0))
+        pending.append((sha256_hash, deepfake_label, int(deepfake_confidence * 100)))
+    
+    if not pending:
+        return results
+    
+    gas_info = get_recommended_gas_price()
+    if gas_info["status"] == "success":
+        gas_price = web3.to_wei(gas_info["recommended"]["average_gwei"], 'gwei')
+    else:
+        gas_price = web3.eth.gas_price
+    
+    # Submit every transaction before waiting for receipts
+    submitted = []
+    for sha256_hash, deepfake_label, confidence_uint in pending:
+        try:
+            tx_hash = send_contract_transaction(
+                web3,
+                contract.functions.storeImageFeatures(sha256_hash, deepfake_label, confidence_uint),
+                GAS_LIMIT,
+                gas_price
+            )
+            submitted.append((sha256_hash, tx_hash))
+        except Exception as e:
+            # The nonce was not consumed, so the next transaction reuses it
+            logger.error(f"Failed to submit transaction for image {sha256_hash}: {str(e)}")
+            record_chain_tx("store_batch", "failed")
+    
+    logger.info(f"Submitted {len(submitted)}/{len(pending)} batch transactions in {time.time() - start_time:.2f}s")
+    
+    for sha256_hash, tx_hash in submitted:
+        remaining_timeout = max(1, TRANSACTION_TIMEOUT - (time.time() - start_time))
+        try:
+            tx_receipt = web3.eth.wait_for_transaction_receipt(tx_hash, timeout=remaining_timeout)
+        except Exception as e:
+            logger.warning(f"Transaction confirmation for {sha256_hash} not received: {str(e)}. Transaction hash: {tx_hash.hex()}")
+            # Return the transaction hash even if confirmation times out
+            results[sha256_hash] = tx_hash.hex()
+            record_chain_tx("store_batch", "timeout")
+            continue
+        
+        if tx_receipt.status == 1:
+            results[sha256_hash] = tx_receipt.transactionHash.hex()
+            record_chain_tx("store_batch", "success")
+        else:
+            logger.error(f"Batch transaction for {sha256_hash} failed with status: {tx_receipt.status}")
+            record_chain_tx("store_batch", "failed")
+    
+    logger.info(f"Batch of {len(items)} images anchored on blockchain in {time.time() - start_time:.2f}s")
+    return results
+
 def get_image_from_blockchain(sha256_hash):
     """
     Get image features from the blockchain.
@@ -915,6 +1049,8 @@ def image_exists_on_blockchain(sha256_hash):
         logger.error(f"Error checking if image exists on blockchain: {str(e)}")
         raise BlockchainError(f"Failed to check if image exists on blockchain: {str(e)}")
 
+@traced("chain.update")
+@CHAIN_SECONDS.labels(operation="update").time()
 def update_image_on_blockchain(sha256_hash, deepfake_label, deepfake_confidence):
     """
     Update image features on the blockchain.
@@ -940,27 +1076,20 @@ def update_image_on_blockchain(sha256_hash, deepfake_label, deepfake_confidence)
         # Log the parameters being sent to the blockchain
         logger.info(f"Updating image on blockchain with parameters: sha256_hash={sha256_hash}, deepfake_label={deepfake_label}, deepfake_confidence={deepfake_confidence}")
         
-        # Build transaction
-        tx = contract.functions.updateImageFeatures(
-            sha256_hash,
-            deepfake_label,
-            confidence_uint
-        ).build_transaction({
-            'from': w3.eth.default_account,
-            'nonce': w3.eth.get_transaction_count(w3.eth.default_account),
-            'gas': 2000000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
         # Sign and send transaction
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = send_contract_transaction(
+            w3,
+            contract.functions.updateImageFeatures(sha256_hash, deepfake_label, confidence_uint),
+            2000000,
+            w3.eth.gas_price
+        )
         
         # Wait for transaction receipt
         tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
         
         if tx_receipt.status == 1:
             logger.info(f"Image features updated on blockchain: {sha256_hash}")
+            record_chain_tx("update", "success")
             return tx_receipt.transactionHash.hex()
         else:
             logger.error(f"Update transaction failed: {tx_receipt}")
@@ -968,6 +1097,7 @@ def update_image_on_blockchain(sha256_hash, deepfake_label, deepfake_confidence)
             
     except Exception as e:
         logger.error(f"Error updating image on blockchain: {str(e)}")
+        record_chain_tx("update", "failed")
         raise BlockchainError(f"Failed to update image on blockchain: {str(e)}")
 
 def delete_image_from_blockchain(sha256_hash):
@@ -987,17 +1117,8 @@ def delete_image_from_blockchain(sha256_hash):
         # Get contract instance
         contract = get_contract_instance()
         
-        # Build transaction
-        tx = contract.functions.deleteImageFeatures(sha256_hash).build_transaction({
-            'from': w3.eth.default_account,
-            'nonce': w3.eth.get_transaction_count(w3.eth.default_account),
-            'gas': 2000000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
         # Sign and send transaction
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = send_contract_transaction(w3, contract.functions.deleteImageFeatures(sha256_hash), 2000000, w3.eth.gas_price)
         
         # Wait for transaction receipt
         tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -1125,17 +1246,8 @@ def pause_contract():
         # Get contract instance
         contract = get_contract_instance()
         
-        # Build transaction
-        tx = contract.functions.pauseContract().build_transaction({
-            'from': w3.eth.default_account,
-            'nonce': w3.eth.get_transaction_count(w3.eth.default_account),
-            'gas': 2000000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
         # Sign and send transaction
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = send_contract_transaction(w3, contract.functions.pauseContract(), 2000000, w3.eth.gas_price)
         
         # Wait for transaction receipt
         tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -1165,17 +1277,8 @@ def unpause_contract():
         # Get contract instance
         contract = get_contract_instance()
         
-        # Build transaction
-        tx = contract.functions.unpauseContract().build_transaction({
-            'from': w3.eth.default_account,
-            'nonce': w3.eth.get_transaction_count(w3.eth.default_account),
-            'gas': 2000000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
         # Sign and send transaction
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = send_contract_transaction(w3, contract.functions.unpauseContract(), 2000000, w3.eth.gas_price)
         
         # Wait for transaction receipt
         tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -1211,17 +1314,8 @@ def add_authorized_user(user_address):
         # Convert address to checksum address
         checksum_address = Web3.to_checksum_address(user_address)
         
-        # Build transaction
-        tx = contract.functions.addAuthorizedUser(checksum_address).build_transaction({
-            'from': w3.eth.default_account,
-            'nonce': w3.eth.get_transaction_count(w3.eth.default_account),
-            'gas': 2000000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
         # Sign and send transaction
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = send_contract_transaction(w3, contract.functions.addAuthorizedUser(checksum_address), 2000000, w3.eth.gas_price)
         
         # Wait for transaction receipt
         tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -1257,17 +1351,8 @@ def remove_authorized_user(user_address):
         # Convert address to checksum address
         checksum_address = Web3.to_checksum_address(user_address)
         
-        # Build transaction
-        tx = contract.functions.removeAuthorizedUser(checksum_address).build_transaction({
-            'from': w3.eth.default_account,
-            'nonce': w3.eth.get_transaction_count(w3.eth.default_account),
-            'gas': 2000000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
         # Sign and send transaction
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = send_contract_transaction(w3, contract.functions.removeAuthorizedUser(checksum_address), 2000000, w3.eth.gas_price)
         
         # Wait for transaction receipt
         tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -1303,17 +1388,8 @@ def transfer_ownership(new_owner_address):
         # Convert address to checksum address
         checksum_address = Web3.to_checksum_address(new_owner_address)
         
-        # Build transaction
-        tx = contract.functions.transferOwnership(checksum_address).build_transaction({
-            'from': w3.eth.default_account,
-            'nonce': w3.eth.get_transaction_count(w3.eth.default_account),
-            'gas': 2000000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
         # Sign and send transaction
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = send_contract_transaction(w3, contract.functions.transferOwnership(checksum_address), 2000000, w3.eth.gas_price)
         
         # Wait for transaction receipt
         tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -1350,17 +1426,8 @@ def verify_image(sha256_hash, verified):
         # Log the verification attempt
         logger.info(f"Setting verification status for image: sha256_hash={sha256_hash}, verified={verified}")
         
-        # Build transaction
-        tx = contract.functions.verifyImage(sha256_hash, verified).build_transaction({
-            'from': w3.eth.default_account,
-            'nonce': w3.eth.get_transaction_count(w3.eth.default_account),
-            'gas': 2000000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
         # Sign and send transaction
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = send_contract_transaction(w3, contract.functions.verifyImage(sha256_hash, verified), 2000000, w3.eth.gas_price)
         
         # Wait for transaction receipt
         tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -0,0 +1,453 @@
+"""
+Bag-of-visual-words index over ORB descriptors.
+
+A binary vocabulary is trained offline with k-majority clustering (k-means
+under Hamming distance, where each centroid is the bitwise majority of its
+members). Each image is quantized into a sparse visual-word histogram and
+stored in an inverted file: one posting list per word holding the images
+that contain it and their term frequency. Scoring a query walks only the
+posting lists of the query's words, so candidate retrieval costs time
+proportional to posting-list lengths rather than corpus size.
+
+Scores are TF-IDF cosine similarities. They only rank candidates; the
+shortlist is still verified with compare_orb_features.
+
+On-disk format (numpy .npz, written atomically):
+
+- vocabulary: (k, 32) uint8 binary words
+- word_ptr: (k + 1,) int64 offsets into the posting arrays (CSR layout)
+- posting_docs: int32 document index of each posting
+- posting_tf: float32 term frequency of each posting
+- doc_ids: int64 Image id of each document
+- high_water: largest Image id the index has caught up to
+- meta: JSON string (format version, decode policy, build time)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+
+import cv2
+import numpy as np
+
+from apps.images.models import Image
+from .config import (
+    BOVW_ENABLED,
+    BOVW_INDEX_PATH,
+    BOVW_MAX_DF_RATIO,
+    BOVW_VOCABULARY_PATH
+)
+from .index_storage import save_npz_atomic
+from .index_sync import IndexSyncMixin
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+# Below this many images every word is kept, however common
+MIN_DOCS_FOR_DF_FILTER = 100
+
+# ORB descriptors are 256-bit binary strings
+DESCRIPTOR_BYTES = 32
+
+
+def descriptors_from_features(features):
+    """
+    Get the ORB descriptors of a stored feature set as a uint8 array.
+
+    Returns:
+        numpy.ndarray or None: (n, 32) descriptors, None if there are none
+    """
+    if isinstance(features, str):
+        features = json.loads(features)
+    if not isinstance(features, dict) or not features.get("descriptors"):
+        return None
+    descriptors = np.asarray(features["descriptors"], dtype=np.uint8)
+    if descriptors.ndim != 2 or descriptors.shape[1] != DESCRIPTOR_BYTES:
+        return None
+    return descriptors
+
+
+def assign_words(descriptors, vocabulary):
+    """
+    Map each descriptor to its nearest word by Hamming distance.
+
+    Returns:
+        numpy.ndarray: Word index per descriptor
+    """
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    matches = matcher.match(np.ascontiguousarray(descriptors), np.ascontiguousarray(vocabulary))
+    words = np.empty(len(matches), dtype=np.int64)
+    for match in matches:
+        words[match.queryIdx] = match.trainIdx
+    return words
+
+
+def train_vocabulary(descriptors, num_words, iterations=10, seed=0):
+    """
+    Train a binary vocabulary with k-majority clustering.
+
+    Args:
+        descriptors: (n, 32) uint8 ORB descriptors sampled from the corpus
+        num_words: Vocabulary size
+        iterations: Maximum number of assign/update rounds
+        seed: Random seed for initialization and reseeding empty clusters
+
+    Returns:
+        numpy.ndarray: (num_words, 32) uint8 vocabulary
+    """
+    descriptors = np.ascontiguousarray(descriptors, dtype=np.uint8)
+    if len(descriptors) < num_words:
+        raise ValueError(f"Need at least {num_words} descriptors to train {num_words} words, got {len(descriptors)}")
+
+    rng = np.random.default_rng(seed)
+    vocabulary = descriptors[rng.choice(len(descriptors), num_words, replace=False)].copy()
+    bits = np.unpackbits(descriptors, axis=1)
+    labels = None
+
+    for iteration in range(iterations):
+        start_time = time.time()
+        new_labels = assign_words(descriptors, vocabulary)
+        changed = len(descriptors) if labels is None else int(np.count_nonzero(new_labels != labels))
+        labels = new_labels
+
+        # Bitwise majority vote per cluster, summed over contiguous runs of sorted labels
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        ones = np.add.reduceat(bits[order].astype(np.int32), starts, axis=0)
+        sizes = np.diff(np.r_[starts, len(order)])
+        clusters = sorted_labels[starts]
+        vocabulary[clusters] = np.packbits(ones * 2 > sizes[:, None], axis=1)
+
+        # Reseed empty clusters from random descriptors
+        empty = np.setdiff1d(np.arange(num_words), clusters)
+        if len(empty):
+            vocabulary[empty] = descriptors[rng.choice(len(descriptors), len(empty), replace=False)]
+
+        logger.info(
+            f"k-majority iteration {iteration + 1}: {changed} assignments changed, "
+            f"{len(empty)} empty clusters reseeded ({time.time() - start_time:.1f}s)"
+        )
+        if changed == 0 and not len(empty):
+            break
+
+    return vocabulary
+
+
+def save_vocabulary(path, vocabulary, meta=None):
+    save_npz_atomic(path, vocabulary=vocabulary, meta=json.dumps(meta or {}))
+
+
+def load_vocabulary(path):
+    with np.load(path) as data:
+        return data["vocabulary"]
+
+
+def _smoothed_idf(num_docs, df):
+    # Never zero, so every document keeps a non-zero norm
+    return (1.0 + np.log((num_docs + 1) / (np.asarray(df, dtype=np.float32) + 1))).astype(np.float32)
+
+
+class BovwIndex(IndexSyncMixin):
+    """
+    Inverted file of TF-IDF visual-word vectors.
+
+    Postings hold raw term frequencies and IDF is applied at query time, so
+    documents can be added and removed without rewriting other postings.
+    Document norms use the IDF at the time they were added and are
+    recomputed when the index is saved or loaded, and whenever the corpus
+    doubles in size.
+    """
+
+    sync_name = "BoVW index"
+    sync_fields = ("orb_features",)
+
+    def __init__(self, vocabulary, meta=None):
+        self.vocabulary = np.ascontiguousarray(vocabulary, dtype=np.uint8)
+        self.num_words = len(self.vocabulary)
+        self.meta = meta or {}
+        self.high_water = 0
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        # Per-word posting lists, appendable without reallocating numpy arrays
+        self._posting_docs = [array("i") for _ in range(self.num_words)]
+        self._posting_tf = [array("f") for _ in range(self.num_words)]
+        self._doc_ids = array("q")
+        self._doc_norms = array("f")
+        self._doc_index = {}
+        # Document count the norms were last recomputed for
+        self._norms_doc_count = 0
+
+    def __len__(self):
+        return len(self._doc_index)
+
+    def __contains__(self, image_id):
+        return image_id in self._doc_index
+
+    def ids(self):
+        with self._lock:
+            return list(self._doc_index)
+
+    def stats(self):
+        """Summarize the index size and posting-list lengths."""
+        with self._lock:
+            lengths = np.array([len(p) for p in self._posting_docs])
+        return {
+            "images": len(self),
+            "words": self.num_words,
+            "high_water": self.high_water,
+            "postings": int(lengths.sum()),
+            "mean_posting_length": float(lengths.mean()),
+            "max_posting_length": int(lengths.max()),
+            "empty_words": int(np.count_nonzero(lengths == 0)),
+        }
+
+    def _idf(self, df):
+        return _smoothed_idf(len(self._doc_index), df)
+
+    def quantize(self, descriptors):
+        """
+        Quantize descriptors into visual-word term frequencies.
+
+        Returns:
+            tuple: (word indices, term frequencies) for the words present
+        """
+        counts = np.bincount(assign_words(descriptors, self.vocabulary), minlength=self.num_words)
+        words = np.flatnonzero(counts)
+        return words, (counts[words] / len(descriptors)).astype(np.float32)
+
+    def add(self, image_id, descriptors):
+        """Add or replace an image in the index."""
+        if descriptors is None or not len(descriptors):
+            return
+        self.add_quantized(image_id, *self.quantize(descriptors))
+
+    def add_quantized(self, image_id, words, tf):
+        """Add or replace an image given its visual-word term frequencies."""
+        with self._lock:
+            self.remove(image_id)
+            doc = len(self._doc_ids)
+            idf = self._idf([len(self._posting_docs[w]) + 1 for w in words])
+            for word, value in zip(words, tf):
+                self._posting_docs[word].append(doc)
+                self._posting_tf[word].append(value)
+            self._doc_ids.append(image_id)
+            self._doc_norms.append(float(np.linalg.norm(tf * idf)))
+            self._doc_index[image_id] = doc
+
+    def remove(self, image_id):
+        """
+        Remove an image from the index.
+
+        Its postings are left in place and skipped at query time until the
+        index is compacted by save().
+        """
+        with self._lock:
+            doc = self._doc_index.pop(image_id, None)
+            if doc is not None:
+                self._doc_norms[doc] = 0.0
+
+    def query(self, descriptors, top_n):
+        """
+        Rank indexed images by TF-IDF cosine similarity to a query.
+
+        Args:
+            descriptors: (n, 32) uint8 query descriptors
+            top_n: Number of candidates to return
+
+        Returns:
+            list: (image_id, score) tuples, best first
+        """
+        if descriptors is None or not len(descriptors):
+            return []
+        words, tf = self.quantize(descriptors)
+        with self._lock:
+            if not self._doc_index:
+                return []
+            num_docs = len(self._doc_ids)
+            df = np.array([len(self._posting_docs[w]) for w in words])
+            # Words present in most images carry almost no information and
+            # have the longest posting lists
+            keep = df > 0
+            if len(self._doc_index) >= MIN_DOCS_FOR_DF_FILTER:
+                keep &= df <= BOVW_MAX_DF_RATIO * len(self._doc_index)
+            words, tf, df = words[keep], tf[keep], df[keep]
+            if not len(words):
+                return []
+            idf = self._idf(df)
+            query_weights = tf * idf
+            query_norm = float(np.linalg.norm(query_weights))
+
+            docs = np.concatenate([np.frombuffer(self._posting_docs[w], dtype=np.int32) for w in words])
+            contributions = np.concatenate([
+                np.frombuffer(self._posting_tf[w], dtype=np.float32) * (weight * w_idf)
+                for w, weight, w_idf in zip(words, query_weights, idf)
+            ])
+            scores = np.bincount(docs, weights=contributions, minlength=num_docs)
+            # Copies, since arrays exporting a buffer cannot be appended to
+            norms = np.array(self._doc_norms, dtype=np.float32)
+            doc_ids = np.array(self._doc_ids, dtype=np.int64)
+
+        live = norms > 0
+        scores = np.where(live, scores / np.where(live, norms, 1.0) / (query_norm or 1.0), 0.0)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_n:
+            candidates = candidates[np.argpartition(-scores[candidates], top_n - 1)[:top_n]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(doc_ids[doc]), float(scores[doc])) for doc in candidates]
+
+    def _compact(self):
+        """Build CSR arrays of the live postings and recompute document norms."""
+        with self._lock:
+            live_docs = sorted(self._doc_index.values())
+            remap = np.full(len(self._doc_ids), -1, dtype=np.int64)
+            remap[live_docs] = np.arange(len(live_docs))
+
+            word_ptr = np.zeros(self.num_words + 1, dtype=np.int64)
+            docs_parts, tf_parts = [], []
+            for word in range(self.num_words):
+                docs = remap[np.frombuffer(self._posting_docs[word], dtype=np.int32)]
+                mask = docs >= 0
+                docs_parts.append(docs[mask].astype(np.int32))
+                tf_parts.append(np.frombuffer(self._posting_tf[word], dtype=np.float32)[mask])
+                word_ptr[word + 1] = word_ptr[word] + int(mask.sum())
+            doc_ids = np.frombuffer(self._doc_ids, dtype=np.int64)[live_docs]
+
+        posting_docs = np.concatenate(docs_parts) if docs_parts else np.zeros(0, dtype=np.int32)
+        posting_tf = np.concatenate(tf_parts) if tf_parts else np.zeros(0, dtype=np.float32)
+        return word_ptr, posting_docs, posting_tf, doc_ids
+
+    def _load_postings(self, word_ptr, posting_docs, posting_tf, doc_ids):
+        num_docs = len(doc_ids)
+        df = np.diff(word_ptr)
+        idf = _smoothed_idf(num_docs, df)
+        word_of_posting = np.repeat(np.arange(self.num_words), df)
+        squared = np.bincount(
+            posting_docs, weights=(posting_tf * idf[word_of_posting]) ** 2, minlength=num_docs
+        )
+
+        self._posting_docs = [array("i", posting_docs[word_ptr[w]:word_ptr[w + 1]].tobytes())
+                              for w in range(self.num_words)]
+        self._posting_tf = [array("f", posting_tf[word_ptr[w]:word_ptr[w + 1]].tobytes())
+                            for w in range(self.num_words)]
+        self._doc_ids = array("q", doc_ids.astype(np.int64).tobytes())
+        self._doc_norms = array("f", np.sqrt(squared).astype(np.float32).tobytes())
+        self._doc_index = {int(image_id): doc for doc, image_id in enumerate(doc_ids)}
+        self._norms_doc_count = num_docs
+
+    def refresh_norms(self):
+        """Compact the postings and recompute document norms with the current IDF."""
+        with self._lock:
+            self._load_postings(*self._compact())
+
+    def save(self, path):
+        """Compact the index and write it to disk."""
+        with self._lock:
+            word_ptr, posting_docs, posting_tf, doc_ids = self._compact()
+            high_water = self.high_water
+            # Continue from the compacted postings so norms use the current IDF
+            self._load_postings(word_ptr, posting_docs, posting_tf, doc_ids)
+        meta = dict(self.meta, format_version=INDEX_FORMAT_VERSION, saved_at=time.time())
+        save_npz_atomic(
+            path,
+            vocabulary=self.vocabulary,
+            word_ptr=word_ptr,
+            posting_docs=posting_docs,
+            posting_tf=posting_tf,
+            doc_ids=doc_ids,
+            high_water=np.int64(high_water),
+            meta=json.dumps(meta),
+        )
+        logger.info(f"Saved BoVW index with {len(doc_ids)} images and {len(posting_docs)} postings to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by save()."""
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format_version") != INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported BoVW index format: {meta.get('format_version')}")
+            return cls.from_postings(
+                data["vocabulary"], data["word_ptr"], data["posting_docs"], data["posting_tf"], data["doc_ids"],
+                high_water=int(data["high_water"]), meta=meta
+            )
+
+    @classmethod
+    def from_postings(cls, vocabulary, word_ptr, posting_docs, posting_tf, doc_ids, high_water=0, meta=None):
+        """Create an index from postings in the CSR layout used on disk."""
+        index = cls(vocabulary, meta=meta)
+        index._load_postings(word_ptr, posting_docs, posting_tf, doc_ids)
+        index.high_water = high_water
+        return index
+
+    def sync_queryset(self):
+        return Image.objects.filter(orb_features__isnull=False)
+
+    def load_row(self, img):
+        self.add(img.id, descriptors_from_features(img.orb_features))
+        return img.id in self
+
+    def sync(self):
+        """
+        Index images this process has not seen (see services/index_sync.py).
+
+        Other processes add images that this process's signal handlers never
+        see; catching up before each query keeps every image reachable.
+        """
+        with self._sync_lock:
+            added = self._catch_up()
+            # Norms drift as IDF changes; recompute them whenever the corpus doubles
+            if len(self) > 2 * self._norms_doc_count:
+                self.refresh_norms()
+            return added
+
+
+_index = None
+_index_lock = threading.Lock()
+_missing_index_logged = False
+
+
+def get_bovw_index(load=True):
+    """
+    Get the process-wide BoVW index.
+
+    The index is loaded from BOVW_INDEX_PATH. A vocabulary alone is not
+    enough: indexing the whole corpus on the first sync would hold the sync
+    lock inside a request (or every worker's startup) while uploads wait, so
+    until build_bovw_index has written the index, BoVW retrieval is off.
+
+    Args:
+        load: Load the index if it is not loaded yet
+
+    Returns:
+        BovwIndex or None: None if disabled, not built, or not loaded and load is False
+    """
+    global _index, _missing_index_logged
+    if not BOVW_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None and load:
+            try:
+                if os.path.exists(BOVW_INDEX_PATH):
+                    _index = BovwIndex.load(BOVW_INDEX_PATH)
+                    logger.info(f"Loaded BoVW index with {len(_index)} images from {BOVW_INDEX_PATH}")
+                elif os.path.exists(BOVW_VOCABULARY_PATH) and not _missing_index_logged:
+                    _missing_index_logged = True
+                    logger.warning(
+                        f"BoVW vocabulary found but no index at {BOVW_INDEX_PATH}; "
+                        "run build_bovw_index to enable BoVW retrieval"
+                    )
+            except Exception as e:
+                logger.error(f"Failed to load BoVW index: {str(e)}")
+        return _index
+
+
+def reset_bovw_index():
+    """Drop the process-wide index so the next use reloads it from disk."""
+    global _index
+    with _index_lock:
+        _index = None
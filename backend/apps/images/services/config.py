@@ -19,5 +19,111 @@ GAS_PRICE_GWEI = int(os.environ.get("GAS_PRICE_GWEI", "1"))
 BLOCKCHAIN_TX_TIMEOUT = int(os.environ.get("BLOCKCHAIN_TX_TIMEOUT", "30"))  # 30 seconds default timeout
 BLOCKCHAIN_CONN_TIMEOUT = int(os.environ.get("BLOCKCHAIN_CONN_TIMEOUT", "10"))  # 10 seconds default connection timeout
 
+# Upload configuration
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))  # 50 MB per image
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(100 * 1000 * 1000)))  # 100 MP per image
+UPLOAD_HEADER_PROBE_BYTES = int(os.environ.get("UPLOAD_HEADER_PROBE_BYTES", str(256 * 1024)))  # Bytes buffered to read image dimensions
+PRECHECK_MAX_HASHES = int(os.environ.get("PRECHECK_MAX_HASHES", "1000"))  # SHA256 hashes accepted per pre-check request
 
+# Batch upload configuration
+BATCH_UPLOAD_MAX_ITEMS = int(os.environ.get("BATCH_UPLOAD_MAX_ITEMS", "500"))  # Images accepted per batch request
+BATCH_UPLOAD_MAX_ARCHIVE_BYTES = int(os.environ.get("BATCH_UPLOAD_MAX_ARCHIVE_BYTES", str(1024 * 1024 * 1024)))  # Decompressed size of the images in a batch archive, 1 GB
+BATCH_UPLOAD_WORKERS = int(os.environ.get("BATCH_UPLOAD_WORKERS", "4"))  # Items analyzed in parallel per batch
 
+# Async (ASGI) upload configuration
+ASYNC_UPLOAD_STAGE_WORKERS = int(os.environ.get("ASYNC_UPLOAD_STAGE_WORKERS", str(2 * (os.cpu_count() or 2))))  # Threads running detection stages; they mostly wait on the CPU pool and inference
+ASYNC_UPLOAD_IO_WORKERS = int(os.environ.get("ASYNC_UPLOAD_IO_WORKERS", "16"))  # Threads for blockchain, database and storage calls
+
+# Upload admission control configuration
+ADMISSION_CONTROL_ENABLED = os.environ.get("ADMISSION_CONTROL_ENABLED", "True") == "True"  # Limit and fairly queue uploads, see services/admission.py
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get("ADMISSION_MAX_CONCURRENCY", str(2 * (os.cpu_count() or 2))))  # Uploads processed at once per process
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "32"))  # Uploads waiting per process before new ones get 429
+ADMISSION_USER_QUEUE_SIZE = int(os.environ.get("ADMISSION_USER_QUEUE_SIZE", "4"))  # Uploads one user may have waiting per process
+ADMISSION_MAX_WAIT_SECONDS = float(os.environ.get("ADMISSION_MAX_WAIT_SECONDS", "30"))  # Longest an upload waits for a slot before 429
+ADMISSION_STAFF_WEIGHT = float(os.environ.get("ADMISSION_STAFF_WEIGHT", "2"))  # Share of slots a staff user gets relative to other users
+
+# Search-by-image
+SEARCH_DEFAULT_TOP_K = int(os.environ.get("SEARCH_DEFAULT_TOP_K", "10"))  # Results returned when top_k is omitted
+SEARCH_MAX_TOP_K = int(os.environ.get("SEARCH_MAX_TOP_K", "100"))  # Upper bound on the requested top_k
+SEARCH_MAX_BUDGET_MS = int(os.environ.get("SEARCH_MAX_BUDGET_MS", "30000"))  # Upper bound on the requested latency budget
+
+# Asynchronous upload job configuration
+UPLOAD_JOB_MODE = os.environ.get("UPLOAD_JOB_MODE", "thread")  # "thread" (in-process workers) or "external" (process_upload_jobs command)
+UPLOAD_JOB_WORKERS = int(os.environ.get("UPLOAD_JOB_WORKERS", "2"))  # In-process worker threads
+UPLOAD_JOB_POLL_INTERVAL = float(os.environ.get("UPLOAD_JOB_POLL_INTERVAL", "0.5"))  # Seconds between job status polls
+UPLOAD_JOB_EVENTS_TIMEOUT = int(os.environ.get("UPLOAD_JOB_EVENTS_TIMEOUT", "300"))  # Maximum lifetime of an event stream in seconds
+UPLOAD_JOB_EVENTS_DB_INTERVAL = float(os.environ.get("UPLOAD_JOB_EVENTS_DB_INTERVAL", "5"))  # Seconds between database reads of a followed job whose cache marker has not changed
+UPLOAD_JOB_WAIT_TIMEOUT = int(os.environ.get("UPLOAD_JOB_WAIT_TIMEOUT", "30"))  # Longest a long-poll for job changes waits in seconds
+UPLOAD_JOB_LEASE_SECONDS = int(os.environ.get("UPLOAD_JOB_LEASE_SECONDS", "120"))  # A running job whose worker stops renewing it for this long is taken over
+UPLOAD_JOB_MAX_ATTEMPTS = int(os.environ.get("UPLOAD_JOB_MAX_ATTEMPTS", "3"))  # Runs of a job whose workers died before it is failed
+
+# CPU pool configuration (decode, ORB extraction, image preprocessing)
+CPU_POOL_KIND = os.environ.get("CPU_POOL_KIND", "thread")  # "thread", "process" or "inline"
+CPU_POOL_WORKERS = int(os.environ.get("CPU_POOL_WORKERS", str(os.cpu_count() or 2)))
+CPU_POOL_START_METHOD = os.environ.get("CPU_POOL_START_METHOD", "spawn")  # Process start method; avoid forking a loaded TensorFlow
+CPU_TASK_TIMEOUT = float(os.environ.get("CPU_TASK_TIMEOUT", "30"))  # Seconds before a CPU task is abandoned
+
+# Deepfake inference configuration
+DEEPFAKE_BACKEND = os.environ.get("DEEPFAKE_BACKEND", "keras")  # "keras", "tflite" or "onnx"
+DEEPFAKE_MODEL_DIR = os.environ.get("DEEPFAKE_MODEL_DIR", os.path.join(BASE_DIR, "apps", "images", "models"))
+DEEPFAKE_MODEL_PATH = os.environ.get("DEEPFAKE_MODEL_PATH", "")  # Overrides the default model file for the backend
+DEEPFAKE_NUM_THREADS = int(os.environ.get("DEEPFAKE_NUM_THREADS", "0"))  # Intra-op threads for TFLite/ONNX, 0 = runtime default
+DEEPFAKE_MODEL_VERSION = os.environ.get("DEEPFAKE_MODEL_VERSION", "")  # Recorded with each score, defaults to a digest of the model file
+
+# Decode configuration
+ORB_DECODE_TARGET_LONG_SIDE = int(os.environ.get("ORB_DECODE_TARGET_LONG_SIDE", "1024"))  # Longest side (px) images are normalized to before ORB, 0 = full resolution
+DEEPFAKE_DRAFT_DECODE = os.environ.get("DEEPFAKE_DRAFT_DECODE", "True") == "True"  # Let JPEG decoding downscale in the DCT domain before resizing to 299x299
+
+# Similarity index configuration
+INDEX_DIR = os.environ.get("INDEX_DIR", os.path.join(BASE_DIR, "indexes"))  # Trained vocabularies and index files
+BOVW_ENABLED = os.environ.get("BOVW_ENABLED", "True") == "True"  # Use the BoVW index for candidate retrieval once build_bovw_index has written it
+BOVW_VOCABULARY_PATH = os.environ.get("BOVW_VOCABULARY_PATH", os.path.join(INDEX_DIR, "bovw_vocabulary.npz"))
+BOVW_INDEX_PATH = os.environ.get("BOVW_INDEX_PATH", os.path.join(INDEX_DIR, "bovw_index.npz"))
+BOVW_VOCABULARY_SIZE = int(os.environ.get("BOVW_VOCABULARY_SIZE", "4096"))  # Visual words trained by default
+BOVW_SHORTLIST_SIZE = int(os.environ.get("BOVW_SHORTLIST_SIZE", "50"))  # Candidates verified with full ORB matching
+BOVW_MAX_DF_RATIO = float(os.environ.get("BOVW_MAX_DF_RATIO", "0.5"))  # Query words in more than this share of images are ignored
+EMBEDDING_INDEX_ENABLED = os.environ.get("EMBEDDING_INDEX_ENABLED", "True") == "True"  # Use Xception embeddings for candidate retrieval once the index is built
+EMBEDDING_INDEX_PATH = os.environ.get("EMBEDDING_INDEX_PATH", os.path.join(INDEX_DIR, "embedding_ivf.npz"))
+EMBEDDING_IVF_LISTS = int(os.environ.get("EMBEDDING_IVF_LISTS", "1024"))  # Upper bound on inverted lists trained by build_embedding_index
+EMBEDDING_IVF_NPROBE = int(os.environ.get("EMBEDDING_IVF_NPROBE", "8"))  # Inverted lists scanned per query
+EMBEDDING_SHORTLIST_SIZE = int(os.environ.get("EMBEDDING_SHORTLIST_SIZE", "20"))  # Nearest neighbours added to the ORB candidates
+DESCRIPTOR_STORE_ENABLED = os.environ.get("DESCRIPTOR_STORE_ENABLED", "True") == "True"  # Verify candidates against the shared memory-mapped descriptor store instead of ORB JSON from the database
+DESCRIPTOR_STORE_DIR = os.environ.get("DESCRIPTOR_STORE_DIR", os.path.join(INDEX_DIR, "descriptors"))  # Directory shared by all workers on a host
+DESCRIPTOR_STORE_COMPACT_RATIO = float(os.environ.get("DESCRIPTOR_STORE_COMPACT_RATIO", "0.3"))  # Share of dead rows at which a delete compacts the store
+INDEX_RESYNC_IDS = int(os.environ.get("INDEX_RESYNC_IDS", "1000"))  # Ids below the high-water mark the BoVW and embedding indexes re-check on each sync, for rows committed out of id order
+INDEX_RECONCILE_SECONDS = int(os.environ.get("INDEX_RECONCILE_SECONDS", "300"))  # How often the BoVW and embedding indexes reconcile with the database (drop deleted images, load missed or rescored ones)
+INDEX_WARM_START = os.environ.get("INDEX_WARM_START", "True") == "True"  # Load index snapshots and replay newer images when a worker starts, not on its first request
+INDEX_SNAPSHOT_REPLAY_LIMIT = int(os.environ.get("INDEX_SNAPSHOT_REPLAY_LIMIT", "5000"))  # Images replayed on warm start above which the worker rewrites the snapshot, 0 = never
+
+# Similarity shard configuration
+SIMILARITY_SHARDS = [u.strip().rstrip("/") for u in os.environ.get("SIMILARITY_SHARDS", "").split(",") if u.strip()]  # Shard node URLs in partition order, see services/shards.py; empty = verify against the local corpus
+SIMILARITY_SHARD_TIMEOUT_MS = int(os.environ.get("SIMILARITY_SHARD_TIMEOUT_MS", "2000"))  # Per-shard deadline, after which the coordinator scans that partition itself
+SIMILARITY_SHARD_PRUNE_SECONDS = int(os.environ.get("SIMILARITY_SHARD_PRUNE_SECONDS", "60"))  # How often a shard node reconciles its partition with the database (drops deleted images, loads missed ones)
+SIMILARITY_SHARD_RESYNC_IDS = int(os.environ.get("SIMILARITY_SHARD_RESYNC_IDS", "1000"))  # Ids below the high-water mark a shard node re-checks before each query, for rows committed out of id order
+
+# Metrics configuration
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "True") == "True"  # Serve Prometheus metrics on /metrics
+METRICS_AUTH_TOKEN = os.environ.get("METRICS_AUTH_TOKEN", "")  # Bearer token required to scrape /metrics, empty = no token
+METRICS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")  # Shared sample directory when serving from several gunicorn workers
+
+# Logging configuration
+LOG_MODE = os.environ.get("LOG_MODE", "verbose")  # "verbose" or "production", see settings.LOGGING
+LOG_SAMPLE_EVERY = int(os.environ.get("LOG_SAMPLE_EVERY", "100"))  # In production mode, one in N per-image debug events is logged
+
+# Tracing configuration
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "False") == "True"  # Collect request-scoped spans, see services/tracing.py
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))  # Share of traces exported regardless of duration
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", "2000"))  # Traces at least this slow are always exported, 0 = off
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "jsonl")  # "jsonl" (local file) or "otlp" (OTLP/HTTP collector)
+TRACE_JSONL_PATH = os.environ.get("TRACE_JSONL_PATH", os.path.join(BASE_DIR, "logs", "traces.jsonl"))  # "{pid}" is replaced by the process id
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "honour-backend")  # service.name reported to the collector
+
+# Memory profiling configuration
+MEMORY_PROFILING_ENABLED = os.environ.get("MEMORY_PROFILING_ENABLED", "False") == "True"  # Profile requests with tracemalloc, see services/memory_profiler.py
+MEMORY_PROFILE_PATHS = [p for p in os.environ.get("MEMORY_PROFILE_PATHS", "/api/images/upload/,/api/images/search/").split(",") if p]  # Path prefixes of profiled requests
+MEMORY_PROFILE_SAMPLE_RATE = float(os.environ.get("MEMORY_PROFILE_SAMPLE_RATE", "1.0"))  # Share of matching requests profiled
+MEMORY_PROFILE_DIR = os.environ.get("MEMORY_PROFILE_DIR", os.path.join(BASE_DIR, "logs", "memory"))  # One JSON-lines file per process
+MEMORY_PROFILE_TOP = int(os.environ.get("MEMORY_PROFILE_TOP", "10"))  # Allocation sites listed per stage and request
+MEMORY_PROFILE_FRAMES = int(os.environ.get("MEMORY_PROFILE_FRAMES", "1"))  # Stack frames tracemalloc keeps per allocation
+MEMORY_PROFILE_KEEP = int(os.environ.get("MEMORY_PROFILE_KEEP", "50"))  # Recent reports served by the admin endpoint
@@ -0,0 +1,445 @@
+"""
+Bounded executor for the CPU-bound image stages.
+
+Image decoding, ORB extraction and the PIL preprocessing for the deepfake
+model run here instead of inline in the request thread. The pool kind is
+configurable (CPU_POOL_KIND):
+
+- "thread": shares memory-mapped uploads without copying; OpenCV releases
+  the GIL while decoding and extracting features. A task that times out
+  keeps running, and keeps its pool thread, until it finishes; only the
+  caller stops waiting for it
+- "process": isolates heavy images from the web worker entirely; data is
+  copied to the worker process. A task that times out while running is
+  stopped by replacing the pool and terminating its worker processes
+- "inline": runs tasks in the calling thread (debugging, tests)
+
+The task functions in this module only depend on NumPy, OpenCV and PIL so
+worker processes never import Django or TensorFlow.
+"""
+
+import io
+import logging
+import mmap
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+from PIL import Image as PILImage
+
+from .config import (
+    CPU_POOL_KIND,
+    CPU_POOL_WORKERS,
+    CPU_POOL_START_METHOD,
+    CPU_TASK_TIMEOUT,
+    DEEPFAKE_DRAFT_DECODE
+)
+from .exceptions import ProcessingTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Xception input size
+XCEPTION_INPUT_SIZE = (299, 299)
+
+# Per-worker cache of ORB detectors, keyed by nfeatures. Detector objects are
+# not thread-safe, so each thread (or process) gets its own.
+_worker_state = threading.local()
+
+
+def _get_orb_detector(nfeatures):
+    detectors = getattr(_worker_state, "orb_detectors", None)
+    if detectors is None:
+        detectors = _worker_state.orb_detectors = {}
+    if nfeatures not in detectors:
+        detectors[nfeatures] = cv2.ORB_create(nfeatures=nfeatures)
+    return detectors[nfeatures]
+
+
+# OpenCV flags that decode straight to grayscale at 1/1, 1/2, 1/4 or 1/8 scale.
+# For JPEG the reduction happens in the DCT domain, so the full-resolution
+# image is never materialized.
+_REDUCED_GRAYSCALE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+class _BufferReader(io.RawIOBase):
+    """
+    Read-only file over a buffer, with its own position.
+
+    Stages running at the same time share one upload mapping, so each
+    reader keeps its own offset instead of seeking the mmap itself.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._position))
+        b[:n] = self._view[self._position:self._position + n]
+        self._position += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            # Let the mapping be closed once the upload is done
+            self._view.release()
+        super().close()
+
+
+def _open_stream(file_bytes):
+    if isinstance(file_bytes, mmap.mmap):
+        return _BufferReader(file_bytes)
+    return io.BytesIO(file_bytes)
+
+
+def probe_image_size(file_bytes):
+    """
+    Read the (width, height) of an image from its header without decoding it.
+
+    Returns:
+        tuple or None: Image size, or None if the header cannot be parsed
+    """
+    try:
+        with _open_stream(file_bytes) as stream, PILImage.open(stream) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def decode_policy(target_long_side):
+    """
+    Describe how images are decoded before ORB extraction.
+
+    The policy is stored with the extracted features; features are only
+    comparable when they were extracted under the same policy.
+
+    Args:
+        target_long_side: Longest side images are normalized to, 0 for full resolution
+
+    Returns:
+        dict: The decode policy
+    """
+    if not target_long_side:
+        return {"mode": "full"}
+    return {"mode": "normalized", "target_long_side": int(target_long_side)}
+
+
+def decode_grayscale(file_bytes, target_long_side=0):
+    """
+    Decode image bytes to a grayscale array.
+
+    With a target size, JPEGs are decoded at the largest DCT reduction (1/2,
+    1/4 or 1/8) that keeps the longest side at or above the target, then
+    resized so the longest side equals the target. Smaller images are never
+    upscaled. Without a target the full-resolution image is decoded.
+
+    Args:
+        file_bytes: Bytes or buffer of the image file
+        target_long_side: Longest side in pixels, 0 for full resolution
+
+    Returns:
+        tuple: (grayscale array or None if decoding failed, decode info dict)
+    """
+    nparr = np.frombuffer(file_bytes, np.uint8)
+    info = {"image_size": None, "reduction": 1}
+
+    if not target_long_side:
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if img is None:
+            return None, info
+        info["image_size"] = (img.shape[1], img.shape[0])
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), info
+
+    flag = cv2.IMREAD_GRAYSCALE
+    size = probe_image_size(file_bytes)
+    if size:
+        info["image_size"] = size
+        long_side = max(size)
+        for reduction, reduced_flag in _REDUCED_GRAYSCALE_FLAGS:
+            if long_side // reduction >= target_long_side:
+                flag = reduced_flag
+                info["reduction"] = reduction
+                break
+
+    gray = cv2.imdecode(nparr, flag)
+    if gray is None:
+        return None, info
+    if info["image_size"] is None:
+        info["image_size"] = (gray.shape[1], gray.shape[0])
+
+    long_side = max(gray.shape[:2])
+    if long_side > target_long_side:
+        scale = target_long_side / long_side
+        new_size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+        gray = cv2.resize(gray, new_size, interpolation=cv2.INTER_AREA)
+    return gray, info
+
+
+def extract_orb_features(file_bytes, nfeatures=1000, target_long_side=0):
+    """
+    Decode an image and extract ORB keypoints and descriptors.
+
+    Args:
+        file_bytes: Bytes or buffer of the image file
+        nfeatures: Maximum number of features to retain
+        target_long_side: Longest side the image is normalized to, 0 for full resolution
+
+    Returns:
+        tuple: (keypoints, descriptors, decode_info) where keypoints is a list of
+               serializable dicts, descriptors a uint8 array (or None) and
+               decode_info describes the decode (None if decoding failed).
+    """
+    gray, info = decode_grayscale(file_bytes, target_long_side)
+    if gray is None:
+        return None, None, None
+
+    orb = _get_orb_detector(nfeatures)
+    keypoints, descriptors = orb.detectAndCompute(gray, None)
+
+    # Convert keypoints to serializable format
+    keypoints_list = []
+    for kp in keypoints or ():
+        keypoints_list.append({
+            'pt': (float(kp.pt[0]), float(kp.pt[1])),
+            'size': float(kp.size),
+            'angle': float(kp.angle),
+            'response': float(kp.response),
+            'octave': int(kp.octave),
+            'class_id': int(kp.class_id) if kp.class_id is not None else -1
+        })
+
+    info["decoded_size"] = (gray.shape[1], gray.shape[0])
+    return keypoints_list, descriptors, info
+
+
+def preprocess_for_xception(file_bytes, draft=DEEPFAKE_DRAFT_DECODE):
+    """
+    Decode and preprocess an image for the Xception deepfake model.
+
+    Args:
+        file_bytes: Bytes or buffer of the image file
+        draft: Let the JPEG decoder downscale in the DCT domain to no less
+               than 299x299 before the final resize
+
+    Returns:
+        numpy.ndarray: float32 array of shape (299, 299, 3) scaled to [0, 1]
+    """
+    with _open_stream(file_bytes) as stream:
+        img = PILImage.open(stream)
+        if draft:
+            img.draft('RGB', XCEPTION_INPUT_SIZE)
+        img = img.resize(XCEPTION_INPUT_SIZE)
+    img = img.convert('RGB')
+
+    # Convert to numpy array and normalize
+    img_array = np.array(img)
+    return img_array.astype('float32') / 255.0
+
+
+class CpuPool:
+    """
+    Executor wrapper that applies timeouts and records saturation metrics.
+    """
+
+    def __init__(self, kind=CPU_POOL_KIND, max_workers=CPU_POOL_WORKERS,
+                 start_method=CPU_POOL_START_METHOD, default_timeout=CPU_TASK_TIMEOUT):
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Unknown CPU pool kind: {kind}")
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.start_method = start_method
+        self.default_timeout = default_timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "timed_out": 0,
+            "cancelled": 0,
+            "recycled": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "total_wait_seconds": 0.0,
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context(self.start_method)
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="cpu-pool"
+                    )
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _recycle(self, executor):
+        """
+        Replace a process pool and terminate its workers, stopping a task stuck in one.
+
+        Tasks that were running on the other workers fail with
+        BrokenProcessPool and are run again on the new pool (see run).
+        """
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        self._record(recycled=1)
+
+    def _retired(self, executor):
+        with self._lock:
+            return self._executor is not executor
+
+    def _record(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+            self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._stats["in_flight"])
+
+    def run(self, fn, file_bytes, *args, timeout=None):
+        """
+        Run a task on the pool and wait for its result.
+
+        On timeout a queued task is cancelled. A running task is terminated
+        with its pool in process mode; in thread mode it runs to completion
+        in the background, holding its pool thread until then.
+
+        Args:
+            fn: Module-level task function taking the image data first
+            file_bytes: Bytes or buffer of the image file
+            *args: Extra arguments for the task
+            timeout: Seconds to wait, defaults to CPU_TASK_TIMEOUT
+
+        Returns:
+            The task result
+
+        Raises:
+            ProcessingTimeoutError: If the task does not finish in time
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+
+        if self.kind == "inline":
+            return fn(file_bytes, *args)
+
+        if self.kind == "process" and not isinstance(file_bytes, bytes):
+            # Memory maps cannot be pickled across process boundaries
+            file_bytes = bytes(file_bytes)
+
+        # Imported here so spawned worker processes never load the metrics module
+        from .metrics import CPU_POOL_IN_FLIGHT
+
+        start_time = time.time()
+        deadline = start_time + timeout
+        self._record(submitted=1, in_flight=1)
+        CPU_POOL_IN_FLIGHT.inc()
+        try:
+            retried = False
+            while True:
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(fn, file_bytes, *args)
+                    result = future.result(timeout=max(0.0, deadline - time.time()))
+                except FutureTimeoutError:
+                    if future.cancel():
+                        self._record(cancelled=1)
+                    elif self.kind == "process":
+                        logger.error(f"Terminating the CPU process pool to stop {fn.__name__}")
+                        self._recycle(executor)
+                    self._record(timed_out=1)
+                    logger.error(f"CPU task {fn.__name__} timed out after {timeout:.1f}s")
+                    raise ProcessingTimeoutError(f"{fn.__name__} timed out after {timeout:.1f}s")
+                except (BrokenProcessPool, RuntimeError) as e:
+                    if not retried and self._retired(executor) and time.time() < deadline:
+                        # Terminated with another task's pool (or submitted as it shut down); run it again
+                        retried = True
+                        continue
+                    if not isinstance(e, BrokenProcessPool):
+                        self._record(failed=1)
+                        raise
+                    logger.error("CPU process pool is broken, recreating it")
+                    self._reset_executor()
+                    self._record(failed=1)
+                    raise
+                except Exception:
+                    self._record(failed=1)
+                    raise
+                self._record(completed=1)
+                return result
+        finally:
+            self._record(in_flight=-1, total_wait_seconds=time.time() - start_time)
+            CPU_POOL_IN_FLIGHT.dec()
+
+    def stats(self):
+        """
+        Get pool saturation metrics.
+
+        Returns:
+            dict: Counters plus the configured size and current saturation
+                  (in-flight tasks per worker; above 1.0 means tasks are queuing)
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["kind"] = self.kind
+        stats["max_workers"] = self.max_workers
+        stats["saturation"] = stats["in_flight"] / self.max_workers
+        finished = stats["completed"] + stats["failed"] + stats["timed_out"]
+        stats["avg_wait_seconds"] = stats["total_wait_seconds"] / finished if finished else 0.0
+        return stats
+
+    def shutdown(self):
+        self._reset_executor()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_cpu_pool():
+    """Get the process-wide CPU pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CpuPool()
+            logger.info(f"CPU pool initialized: kind={_pool.kind}, workers={_pool.max_workers}")
+        return _pool
+
+
+def run_cpu_task(fn, file_bytes, *args, timeout=None):
+    """Run a task on the process-wide CPU pool."""
+    return get_cpu_pool().run(fn, file_bytes, *args, timeout=timeout)
@@ -0,0 +1,378 @@
+"""
+Append-only on-disk store of ORB descriptors shared by all worker processes.
+
+Without it every process running verify_image_similarity reads the whole
+feature corpus from the database and decodes its own copy of the JSON. The
+store keeps the descriptors as one contiguous uint8 matrix that processes
+``np.memmap`` read-only, so they share the page cache instead.
+
+On-disk format (in DESCRIPTOR_STORE_DIR):
+
+- CURRENT: the generation in use, replaced atomically by compaction
+- descriptors-<generation>.u8: (rows, 32) uint8 descriptor matrix
+- entries-<generation>.bin: fixed-size ENTRY_DTYPE records (image id,
+  first row, row count, decode target_long_side); the last record for an
+  image wins and a row count of -1 is a tombstone
+- store.lock: serializes writers across processes (flock)
+
+Both generation files are only ever appended to: descriptors first, then
+the entry pointing at them, so a reader never sees an entry whose rows are
+missing. Upload and delete signals append entries and tombstones, readers
+pick up new records on refresh(). When tombstoned and replaced rows make up
+more than DESCRIPTOR_STORE_COMPACT_RATIO of the matrix, the next writer
+rewrites the live rows into a new generation; readers switch over on their
+next refresh while their old mappings stay valid.
+"""
+
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from apps.images.models import Image
+from .bovw_index import DESCRIPTOR_BYTES, descriptors_from_features
+from .cpu_pool import decode_policy
+from .config import DESCRIPTOR_STORE_COMPACT_RATIO, DESCRIPTOR_STORE_DIR, DESCRIPTOR_STORE_ENABLED
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ENTRY_DTYPE = np.dtype([
+    ("image_id", "<i8"),
+    ("offset", "<i8"),
+    ("count", "<i4"),
+    ("target_long_side", "<i4"),
+])
+
+TOMBSTONE = -1
+
+# Dead rows tolerated before the compaction ratio is considered (~320 KB)
+COMPACT_MIN_DEAD_ROWS = 10000
+
+
+def _target_long_side(policy):
+    return int(policy.get("target_long_side", 0)) if policy and policy.get("mode") == "normalized" else 0
+
+
+class StoredDescriptors:
+    """Descriptors of one image, a read-only view into the shared mapping."""
+
+    __slots__ = ("id", "descriptors", "decode")
+
+    def __init__(self, image_id, descriptors, decode):
+        self.id = image_id
+        self.descriptors = descriptors
+        self.decode = decode
+
+
+class DescriptorStore:
+    """
+    Reader and writer for the on-disk descriptor store.
+
+    Readers keep the parsed entry table and the memory map of the current
+    generation; refresh() applies records appended since the last call.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._reset(None)
+
+    def _reset(self, generation):
+        self.generation = generation
+        self._entries_read = 0
+        self._live = {}
+        self._rows = 0
+        self._dead_rows = 0
+        self._descriptors = np.zeros((0, DESCRIPTOR_BYTES), dtype=np.uint8)
+        self.high_water = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _descriptors_path(self, generation):
+        return self._path(f"descriptors-{generation}.u8")
+
+    def _entries_path(self, generation):
+        return self._path(f"entries-{generation}.bin")
+
+    def _current_generation(self):
+        try:
+            with open(self._path("CURRENT")) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _set_current_generation(self, generation):
+        tmp_path = self._path("CURRENT.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(str(generation))
+        os.replace(tmp_path, self._path("CURRENT"))
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(self._path("store.lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                generation = self._current_generation()
+                if generation is None:
+                    generation = 1
+                    open(self._descriptors_path(generation), "ab").close()
+                    open(self._entries_path(generation), "ab").close()
+                    self._set_current_generation(generation)
+                self.refresh()
+                yield generation
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, image_id):
+        return image_id in self._live
+
+    def stats(self):
+        with self._lock:
+            return {
+                "generation": self.generation,
+                "images": len(self._live),
+                "rows": self._rows,
+                "dead_rows": self._dead_rows,
+                "bytes": self._rows * DESCRIPTOR_BYTES,
+                "high_water": self.high_water,
+            }
+
+    def refresh(self):
+        """Apply entries appended (or a compaction finished) since the last refresh."""
+        with self._lock:
+            generation = self._current_generation()
+            if generation is None:
+                return
+            if generation != self.generation:
+                self._reset(generation)
+            try:
+                with open(self._entries_path(generation), "rb") as f:
+                    f.seek(self._entries_read * ENTRY_DTYPE.itemsize)
+                    data = f.read()
+            except FileNotFoundError:
+                if self._current_generation() == generation:
+                    raise
+                # Compacted away between reading CURRENT and opening the file
+                return self.refresh()
+            # A record still being written is picked up by the next refresh
+            records = np.frombuffer(data[:len(data) - len(data) % ENTRY_DTYPE.itemsize], dtype=ENTRY_DTYPE)
+            if not len(records):
+                return
+            self._entries_read += len(records)
+            for image_id, offset, count, target_long_side in records.tolist():
+                previous = self._live.pop(image_id, None)
+                if previous is not None:
+                    self._dead_rows += previous[1]
+                self.high_water = max(self.high_water, image_id)
+                if count == TOMBSTONE:
+                    continue
+                self._live[image_id] = (offset, count, target_long_side)
+                self._rows = max(self._rows, offset + count)
+            if self._rows > len(self._descriptors):
+                self._descriptors = np.memmap(
+                    self._descriptors_path(generation), dtype=np.uint8, mode="r",
+                    shape=(self._rows, DESCRIPTOR_BYTES)
+                )
+
+    def get(self, image_id):
+        """Get the descriptors of an image, or None if it is not stored."""
+        with self._lock:
+            entry = self._live.get(image_id)
+            descriptors = self._descriptors
+        if entry is None:
+            return None
+        offset, count, target_long_side = entry
+        return StoredDescriptors(image_id, descriptors[offset:offset + count], decode_policy(target_long_side))
+
+    def entries(self):
+        """Yield the stored images with descriptors in id order, as of this call."""
+        with self._lock:
+            live = sorted(self._live.items())
+            descriptors = self._descriptors
+        for image_id, (offset, count, target_long_side) in live:
+            if count:
+                yield StoredDescriptors(image_id, descriptors[offset:offset + count], decode_policy(target_long_side))
+
+    def append(self, items):
+        """
+        Append images to the store, replacing earlier entries for the same ids.
+
+        Args:
+            items: Iterable of (image_id, descriptors or None, decode policy)
+        """
+        with self._write_lock() as generation:
+            self._write(generation, items)
+            self.refresh()
+
+    def _write(self, generation, items):
+        with open(self._descriptors_path(generation), "ab") as descriptors_file, \
+                open(self._entries_path(generation), "ab") as entries_file:
+            size = os.fstat(descriptors_file.fileno()).st_size
+            if size % DESCRIPTOR_BYTES:
+                # Realign after an interrupted write
+                descriptors_file.write(b"\0" * (DESCRIPTOR_BYTES - size % DESCRIPTOR_BYTES))
+                size += DESCRIPTOR_BYTES - size % DESCRIPTOR_BYTES
+            offset = size // DESCRIPTOR_BYTES
+            records = []
+            for image_id, descriptors, policy in items:
+                # Images without descriptors get an empty entry, which still advances the high-water mark
+                count = 0 if descriptors is None else len(descriptors)
+                if count:
+                    descriptors_file.write(np.ascontiguousarray(descriptors, dtype=np.uint8).tobytes())
+                records.append((image_id, offset, count, _target_long_side(policy)))
+                offset += count
+            descriptors_file.flush()
+            entries_file.write(np.array(records, dtype=ENTRY_DTYPE).tobytes())
+
+    def remove(self, image_id):
+        """Tombstone an image and compact the store once enough rows are dead."""
+        with self._write_lock() as generation:
+            if image_id not in self._live:
+                return
+            with open(self._entries_path(generation), "ab") as entries_file:
+                entries_file.write(np.array([(image_id, 0, TOMBSTONE, 0)], dtype=ENTRY_DTYPE).tobytes())
+            self.refresh()
+            if self._dead_rows >= COMPACT_MIN_DEAD_ROWS and self._dead_rows > DESCRIPTOR_STORE_COMPACT_RATIO * self._rows:
+                self._compact(generation)
+
+    def compact(self):
+        """Rewrite the live rows into a new generation."""
+        with self._write_lock() as generation:
+            self._compact(generation)
+
+    def _compact(self, generation):
+        new_generation = generation + 1
+        live = sorted(self._live.items())
+        rows = sum(count for _, (_, count, _) in live)
+        records = np.zeros(len(live), dtype=ENTRY_DTYPE)
+        matrix = np.empty((rows, DESCRIPTOR_BYTES), dtype=np.uint8)
+        offset = 0
+        for i, (image_id, (old_offset, count, target_long_side)) in enumerate(live):
+            matrix[offset:offset + count] = self._descriptors[old_offset:old_offset + count]
+            records[i] = (image_id, offset, count, target_long_side)
+            offset += count
+        matrix.tofile(self._descriptors_path(new_generation))
+        records.tofile(self._entries_path(new_generation))
+        self._set_current_generation(new_generation)
+        logger.info(
+            f"Compacted descriptor store to generation {new_generation}: "
+            f"{len(live)} images, {rows} rows ({self._dead_rows} dead rows dropped)"
+        )
+        self._retire(generation)
+
+    def rebuild(self, items):
+        """Replace the store with the given images as a new generation."""
+        with self._write_lock() as generation:
+            new_generation = generation + 1
+            open(self._descriptors_path(new_generation), "wb").close()
+            open(self._entries_path(new_generation), "wb").close()
+            self._write(new_generation, items)
+            self._set_current_generation(new_generation)
+            self._retire(generation)
+
+    def _retire(self, generation):
+        # Processes still mapping the old files keep them until they refresh
+        for path in (self._descriptors_path(generation), self._entries_path(generation)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.refresh()
+
+    def sync(self, batch_size=500):
+        """
+        Append images created since the high-water mark.
+
+        Covers images stored before the store existed and by processes with
+        the store disabled; it is a single indexed query once caught up.
+        """
+        self.refresh()
+        rows = (
+            Image.objects.filter(id__gt=self.high_water, orb_features__isnull=False)
+            .only("id", "orb_features").order_by("id")
+        )
+        added = 0
+        batch = []
+        for img in rows.iterator():
+            batch.append(descriptor_item(img.id, img.orb_features))
+            if len(batch) >= batch_size:
+                added += self._append_missing(batch)
+                batch = []
+        if batch:
+            added += self._append_missing(batch)
+        if added:
+            logger.info(f"Descriptor store caught up with {added} new images")
+        return added
+
+    def _append_missing(self, items):
+        with self._write_lock() as generation:
+            # Another process may have appended them while the rows were read
+            missing = [item for item in items if item[0] > self.high_water and item[0] not in self._live]
+            if missing:
+                self._write(generation, missing)
+                self.refresh()
+            return len(missing)
+
+
+def descriptor_item(image_id, features):
+    """Turn stored ORB features into an (image_id, descriptors, decode policy) item for append."""
+    if isinstance(features, str):
+        features = json.loads(features)
+    policy = features.get("decode") if isinstance(features, dict) else None
+    return image_id, descriptors_from_features(features), policy
+
+
+def store_image_features(image_id, features):
+    """Append (or replace) the descriptors of an image, if the store is enabled."""
+    store = get_descriptor_store()
+    if store is not None:
+        store.append([descriptor_item(image_id, features)])
+
+
+def remove_image_features(image_id):
+    store = get_descriptor_store()
+    if store is not None:
+        store.remove(image_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_descriptor_store():
+    """
+    Get the process-wide descriptor store.
+
+    Returns:
+        DescriptorStore or None: None if DESCRIPTOR_STORE_ENABLED is off
+    """
+    global _store
+    if not DESCRIPTOR_STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = DescriptorStore(DESCRIPTOR_STORE_DIR)
+            _store.refresh()
+        return _store
+
+
+def reset_descriptor_store():
+    """Drop the process-wide store so the next call reopens it."""
+    global _store
+    with _store_lock:
+        _store = None
@@ -1,5 +1,7 @@
 import hashlib
+import heapq
 import io
+import itertools
 import logging
 import numpy as np
 import cv2
@@ -7,134 +9,201 @@ import time
 from PIL import Image as PILImage
 from scipy.fftpack import dct
 
-import tensorflow as tf
 from django.conf import settings
 from django.db.models import Q
 from apps.images.models import Image
-from apps.images.services.exceptions import SimilarImageError, FeatureExtractionError
+from apps.images.services.exceptions import SimilarImageError, FeatureExtractionError, ProcessingTimeoutError
+from apps.images.services.config import (
+    ORB_DECODE_TARGET_LONG_SIDE,
+    BOVW_SHORTLIST_SIZE,
+    EMBEDDING_SHORTLIST_SIZE,
+    SIMILARITY_SHARDS,
+    LOG_MODE,
+    LOG_SAMPLE_EVERY
+)
+from apps.images.services.bovw_index import get_bovw_index, descriptors_from_features
+from apps.images.services.embedding_index import get_embedding_index
+from apps.images.services.descriptor_store import StoredDescriptors, get_descriptor_store
+from apps.images.services.shards import query_shards, shard_filter
+from apps.images.services.cpu_pool import run_cpu_task, extract_orb_features, preprocess_for_xception, decode_policy
+from apps.images.services.inference import load_inference_backend, interpret_prediction
+from apps.images.services.metrics import record_shard_request
+from apps.images.services.tracing import span, traced
 
-# Set up logging
+# Set up logging (handlers and level come from settings.LOGGING)
+# Hot paths use lazy %-style arguments so disabled levels cost no formatting
 logger = logging.getLogger(__name__)
 
-# Configure logging format if not already configured
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-    logger.setLevel(logging.INFO)
+# Counts per-image events (one per compared candidate) for sampling
+_item_events = itertools.count()
 
-# Load the deepfake detection model
+def _sample_item_event():
+    """Whether to log a per-image debug event: all in verbose mode, one in LOG_SAMPLE_EVERY otherwise."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    return LOG_MODE == "verbose" or next(_item_events) % LOG_SAMPLE_EVERY == 0
+
+def _debug_logging():
+    """Whether to log the other debug events, which production mode leaves out."""
+    return LOG_MODE == "verbose" and logger.isEnabledFor(logging.DEBUG)
+
+# 60% similarity threshold for ORB - adjusted for more accuracy without SIFT second pass
+ORB_SIMILARITY_THRESHOLD = 0.6
+
+# Hamming distance below which a descriptor match counts as good
+ORB_MATCH_MAX_DISTANCE = 50
+
+# Decode policy recorded with newly extracted ORB features
+ORB_DECODE_POLICY = decode_policy(ORB_DECODE_TARGET_LONG_SIDE)
+
+def _policy_key(policy):
+    return tuple(sorted(policy.items()))
+
+def get_feature_policy(features):
+    """
+    Get the decode policy stored with ORB features.
+    
+    Features stored before decode policies were recorded were extracted at full resolution.
+    """
+    if isinstance(features, dict) and features.get('decode'):
+        return features['decode']
+    return decode_policy(0)
+
+# Load the deepfake detection model with the configured inference backend
 try:
-    deepfake_model = tf.keras.models.load_model(
-        settings.BASE_DIR / 'apps' / 'images' / 'models' / 'xception_deepfake.h5'
-    )
-    logger.info("Deepfake detection model loaded successfully")
+    deepfake_backend = load_inference_backend()
+    logger.info(f"Deepfake detection model loaded successfully ({deepfake_backend.name} backend)")
 except Exception as e:
     logger.error(f"Failed to load deepfake detection model: {str(e)}")
-    deepfake_model = None
+    deepfake_backend = None
 
 
+@traced("detection.sha256")
 def get_sha256(file_bytes):
     """
     Calculate SHA256 hash of file bytes.
     
     Args:
-        file_bytes: Bytes of the file
+        file_bytes: Bytes (or any buffer, e.g. a memory map) of the file
         
     Returns:
         str: SHA256 hash as hexadecimal string
     """
-    logger.info("Starting SHA256 hash calculation")
     start_time = time.time()
     
     try:
         hash_result = hashlib.sha256(file_bytes).hexdigest()
-        elapsed_time = time.time() - start_time
-        logger.info(f"SHA256 hash calculation completed in {elapsed_time:.3f}s: {hash_result[:10]}...")
+        if _debug_logging():
+            logger.debug("SHA256 hash calculation completed in %.3fs: %.10s...", time.time() - start_time, hash_result)
         return hash_result
     except Exception as e:
         logger.error(f"Error calculating SHA256 hash: {str(e)}")
         raise
 
-def get_orb_features(file_bytes):
+@traced("detection.orb_features")
+def get_orb_features(file_bytes, policy=None):
     """
     Extract ORB features from an image.
     
     Args:
         file_bytes: Bytes of the image file
+        policy: Decode policy (see cpu_pool.decode_policy), defaults to the configured one
         
     Returns:
-        dict: Dictionary containing keypoints and descriptors
+        dict: Dictionary containing keypoints, descriptors and the decode policy used
     """
-    logger.info("Starting ORB feature extraction")
     start_time = time.time()
+    policy = policy or ORB_DECODE_POLICY
     
     try:
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(file_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Decode (at reduced resolution where possible) and detect keypoints on the CPU pool
+        keypoints_list, descriptors, decode_info = run_cpu_task(
+            extract_orb_features, file_bytes, 1000, policy.get("target_long_side", 0)
+        )
         
-        if img is None:
+        if decode_info is None:
             logger.error("Failed to decode image for ORB feature extraction")
             raise FeatureExtractionError("Failed to decode image")
         
-        logger.debug(f"Image decoded successfully: shape={img.shape}")
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Initialize ORB detector
-        orb = cv2.ORB_create(nfeatures=1000)
-        logger.debug("ORB detector initialized with nfeatures=1000")
+        if _debug_logging():
+            logger.debug("Image decoded successfully: %s", decode_info)
         
-        # Detect keypoints and compute descriptors
-        keypoints, descriptors = orb.detectAndCompute(gray, None)
-        
-        if keypoints is None or len(keypoints) == 0 or descriptors is None:
+        if not keypoints_list or descriptors is None:
             logger.warning("No ORB features detected in image")
             return None
         
-        logger.debug(f"Detected {len(keypoints)} ORB keypoints")
-        
-        # Convert keypoints to serializable format
-        keypoints_list = []
-        for kp in keypoints:
-            keypoints_list.append({
-                'pt': (float(kp.pt[0]), float(kp.pt[1])),
-                'size': float(kp.size),
-                'angle': float(kp.angle),
-                'response': float(kp.response),
-                'octave': int(kp.octave),
-                'class_id': int(kp.class_id) if kp.class_id is not None else -1
-            })
-        
         # Convert descriptors to serializable format
         descriptors_list = descriptors.tolist() if descriptors is not None else []
         
-        elapsed_time = time.time() - start_time
-        logger.info(f"ORB feature extraction completed in {elapsed_time:.3f}s: {len(keypoints)} keypoints extracted")
+        logger.info(
+            "ORB feature extraction completed in %.3fs: %d keypoints extracted",
+            time.time() - start_time, len(keypoints_list)
+        )
         
         return {
             'keypoints': keypoints_list,
-            'descriptors': descriptors_list
+            'descriptors': descriptors_list,
+            'decode': policy,
+            'image_size': list(decode_info["image_size"]),
         }
+    except ProcessingTimeoutError as e:
+        # Not a bad image; the caller answers it as a temporary failure
+        raise ProcessingTimeoutError(f"ORB feature extraction timed out: {e.message}", stage="orb")
     except Exception as e:
         logger.error(f"Error extracting ORB features: {str(e)}")
         raise FeatureExtractionError(f"Failed to extract ORB features: {str(e)}")
 
-def compare_orb_features(features1, features2):
+def match_orb_descriptors(descriptors1, descriptors2):
+    """
+    Match two ORB descriptor arrays by brute force with cross-checking.
+    
+    Returns:
+        np.ndarray: Hamming distances of the matches
+    """
+    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+    return np.array([m.distance for m in bf.match(descriptors1, descriptors2)], dtype=np.float32)
+
+def orb_similarity(distances, count1, count2, max_distance=ORB_MATCH_MAX_DISTANCE):
+    """
+    Score descriptor matches as the share of the smaller descriptor set matched well.
+    
+    Args:
+        distances: Match distances from match_orb_descriptors
+        count1, count2: Number of descriptors on each side
+        max_distance: Distance below which a match counts as good
+        
+    Returns:
+        float: Similarity between 0 and 1
+    """
+    max_possible_matches = min(count1, count2)
+    if max_possible_matches <= 0:
+        return 0.0
+    return min(1.0, int(np.count_nonzero(distances < max_distance)) / max_possible_matches)
+
+def compare_orb_descriptors(descriptors1, descriptors2, max_distance=ORB_MATCH_MAX_DISTANCE):
+    """
+    Compare two ORB descriptor arrays, e.g. from the descriptor store.
+    
+    Returns:
+        float: Similarity score between 0 and 1, 0 if either side is empty
+    """
+    if descriptors1 is None or descriptors2 is None or not len(descriptors1) or not len(descriptors2):
+        return 0.0
+    distances = match_orb_descriptors(descriptors1, descriptors2)
+    return orb_similarity(distances, len(descriptors1), len(descriptors2), max_distance)
+
+def compare_orb_features(features1, features2, max_distance=ORB_MATCH_MAX_DISTANCE):
     """
     Compare two sets of ORB features and return similarity score.
     
     Args:
         features1: First set of ORB features
         features2: Second set of ORB features
+        max_distance: Hamming distance below which a match counts as good
         
     Returns:
         float: Similarity score between 0 and 1 (1 being identical)
     """
-    logger.info("Starting ORB feature comparison")
     start_time = time.time()
     
     try:
@@ -171,12 +240,6 @@ def compare_orb_features(features1, features2):
             logger.warning("Invalid ORB features: missing descriptors")
             return 0.0
             
-        # Log feature structure for debugging
-        logger.debug(f"Features1 keys: {features1.keys()}")
-        logger.debug(f"Features2 keys: {features2.keys()}")
-        logger.debug(f"Descriptors1 type: {type(features1['descriptors'])}")
-        logger.debug(f"Descriptors2 type: {type(features2['descriptors'])}")
-        
         # Deep copy to avoid modifying original data
         import copy
         features1_copy = copy.deepcopy(features1)
@@ -187,11 +250,13 @@ def compare_orb_features(features1, features2):
             if isinstance(features1_copy['descriptors'], str):
                 import json
                 features1_copy['descriptors'] = json.loads(features1_copy['descriptors'])
-                logger.debug("Successfully deserialized descriptors1 from JSON")
+                if _debug_logging():
+                    logger.debug("Successfully deserialized descriptors1 from JSON")
             if isinstance(features2_copy['descriptors'], str):
                 import json
                 features2_copy['descriptors'] = json.loads(features2_copy['descriptors'])
-                logger.debug("Successfully deserialized descriptors2 from JSON")
+                if _debug_logging():
+                    logger.debug("Successfully deserialized descriptors2 from JSON")
         except Exception as e:
             logger.error(f"Error deserializing descriptors: {str(e)}")
             return 0.0
@@ -210,7 +275,6 @@ def compare_orb_features(features1, features2):
         try:
             descriptors1 = np.array(features1_copy['descriptors'], dtype=np.uint8)
             descriptors2 = np.array(features2_copy['descriptors'], dtype=np.uint8)
-            logger.debug(f"Successfully converted descriptors to numpy arrays: shapes={descriptors1.shape}, {descriptors2.shape}")
         except Exception as e:
             logger.error(f"Error converting descriptors to numpy arrays: {str(e)}")
             return 0.0
@@ -219,134 +283,402 @@ def compare_orb_features(features1, features2):
             logger.warning("Empty descriptors in ORB features")
             return 0.0
         
-        logger.debug(f"Comparing ORB features: {len(descriptors1)} vs {len(descriptors2)} descriptors")
-        
-        # Create BFMatcher object
-        bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-        
         # Match descriptors
-        matches = bf.match(descriptors1, descriptors2)
-        
-        # Sort them in order of distance
-        matches = sorted(matches, key=lambda x: x.distance)
+        distances = match_orb_descriptors(descriptors1, descriptors2)
         
-        # Calculate similarity score based on number of good matches
-        # and their average distance
-        if len(matches) == 0:
+        if len(distances) == 0:
             logger.warning("No matches found between ORB features")
             return 0.0
         
-        # Use only good matches (lower distance is better)
-        good_matches = [m for m in matches if m.distance < 50]
-        logger.debug(f"Found {len(good_matches)} good matches out of {len(matches)} total matches")
-        
         # Calculate similarity based on number of good matches relative to total features
-        max_possible_matches = min(len(descriptors1), len(descriptors2))
-        similarity = len(good_matches) / max_possible_matches if max_possible_matches > 0 else 0.0
+        similarity = orb_similarity(distances, len(descriptors1), len(descriptors2), max_distance)
         
-        elapsed_time = time.time() - start_time
-        logger.info(f"ORB comparison completed in {elapsed_time:.3f}s: similarity={similarity:.4f}")
+        if _sample_item_event():
+            logger.debug(
+                "ORB comparison completed in %.3fs: %d matches, similarity=%.4f",
+                time.time() - start_time, len(distances), similarity
+            )
         
-        return min(1.0, similarity)  # Cap at 1.0
+        return similarity
     except Exception as e:
         logger.error(f"Error comparing ORB features: {str(e)}")
         return 0.0
 
-def verify_image_similarity(file_bytes):
+def query_features_resolver(file_bytes, query_orb_features, query_policy=None):
+    """
+    Build a function returning the query features comparable with a stored feature set.
+    
+    Stored features are only comparable with query features decoded under the
+    same policy; the query is re-extracted lazily for each other policy encountered.
+    
+    Args:
+        file_bytes: Bytes of the query image
+        query_orb_features: Query features already extracted
+        query_policy: Decode policy they were extracted under, ORB_DECODE_POLICY if omitted
+    """
+    query_features_by_policy = {_policy_key(query_policy or ORB_DECODE_POLICY): query_orb_features}
+    
+    def query_features_for(stored_features):
+        policy = get_feature_policy(stored_features)
+        key = _policy_key(policy)
+        if key not in query_features_by_policy:
+            logger.info("Extracting query ORB features for stored decode policy %s", policy)
+            query_features_by_policy[key] = get_orb_features(file_bytes, policy=policy)
+        return query_features_by_policy[key]
+    
+    return query_features_for
+
+def _candidate_scorer(query_features_for):
+    """
+    Build a function scoring a candidate against the query.
+    
+    Candidates are either images with ``orb_features`` or StoredDescriptors
+    from the descriptor store; for the latter the query descriptors are
+    converted once per decode policy instead of once per comparison.
+    """
+    query_descriptors_by_policy = {}
+    
+    def score(candidate):
+        if isinstance(candidate, StoredDescriptors):
+            key = _policy_key(candidate.decode)
+            if key not in query_descriptors_by_policy:
+                query_descriptors_by_policy[key] = descriptors_from_features(
+                    query_features_for({"decode": candidate.decode})
+                )
+            return compare_orb_descriptors(query_descriptors_by_policy[key], candidate.descriptors)
+        return compare_orb_features(query_features_for(candidate.orb_features), candidate.orb_features)
+    
+    return score
+
+@traced("detection.candidates")
+def _similarity_candidates(query_orb_features, query_embedding=None):
+    """
+    Get the stored images to verify a query against.
+    
+    With a trained BoVW index only the shortlist it retrieves is verified,
+    and with an embedding index the nearest neighbours of the query's
+    Xception embedding are added to it. Without either, every image with
+    ORB features is verified.
+    
+    Candidates come from the shared descriptor store when it is enabled,
+    falling back to the database for images it does not hold yet.
+    """
+    store = get_descriptor_store()
+    shortlists = []
+    
+    bovw_index = get_bovw_index()
+    if bovw_index is not None:
+        bovw_index.sync()
+        shortlists.append(bovw_index.query(descriptors_from_features(query_orb_features), BOVW_SHORTLIST_SIZE))
+    
+    embedding_index = get_embedding_index() if query_embedding is not None else None
+    if embedding_index is not None and deepfake_backend is not None \
+            and embedding_index.model_version == deepfake_backend.version:
+        embedding_index.sync()
+        shortlists.append(embedding_index.search(query_embedding, EMBEDDING_SHORTLIST_SIZE))
+    
+    if not shortlists:
+        if store is not None:
+            store.sync()
+            if _debug_logging():
+                logger.debug("Comparing against %d images in the descriptor store", len(store))
+            return store.entries()
+        images = Image.objects.filter(orb_features__isnull=False)
+        if _debug_logging():
+            # Counting is a query of its own, only worth it when diagnosing
+            logger.debug("Comparing against %d images with ORB features", images.count())
+        return images
+    
+    # Interleave the shortlists so the best candidates of each are verified first
+    rank = {}
+    for position in range(max(len(shortlist) for shortlist in shortlists)):
+        for shortlist in shortlists:
+            if position < len(shortlist):
+                rank.setdefault(shortlist[position][0], len(rank))
+    images = []
+    missing = rank
+    if store is not None:
+        store.refresh()
+        stored = [store.get(image_id) for image_id in rank]
+        images = [entry for entry in stored if entry is not None]
+        missing = [image_id for image_id in rank if image_id not in store]
+    # Images deleted since they were indexed simply drop out here
+    if missing:
+        images.extend(Image.objects.filter(id__in=missing, orb_features__isnull=False))
+    images.sort(key=lambda img: rank[img.id])
+    if _debug_logging():
+        logger.debug("Comparing against %d index candidates", len(images))
+    return images
+
+@traced("detection.scan_candidates")
+def scan_candidates(images, query_features_for, threshold=ORB_SIMILARITY_THRESHOLD, keep_top=0):
+    """
+    Compare a query against candidate images until one is similar enough.
+    
+    Args:
+        images: Iterable of objects with ``id`` and ``orb_features``, or
+                StoredDescriptors
+        query_features_for: Function returning the query features comparable
+                            with a stored feature set
+        threshold: ORB similarity at which a candidate counts as similar
+        keep_top: Number of best (similarity, image_id) pairs to keep for
+                  diagnostics, 0 to keep none
+        
+    Returns:
+        tuple: ((image_id, similarity) of the first similar candidate or None,
+                list of up to keep_top (similarity, image_id) pairs, best first)
+    """
+    # Bounded min-heap, so diagnostics never cost more than O(keep_top) memory
+    top = []
+    
+    def result(match):
+        return match, sorted(top, reverse=True)
+    
+    score = _candidate_scorer(query_features_for)
+    for img in images:
+        try:
+            # Skip images without ORB features
+            if not isinstance(img, StoredDescriptors) and not img.orb_features:
+                continue
+            
+            # Calculate ORB similarity
+            orb_similarity = score(img)
+            
+            if keep_top:
+                if len(top) < keep_top:
+                    heapq.heappush(top, (orb_similarity, img.id))
+                elif (orb_similarity, img.id) > top[0]:
+                    heapq.heappushpop(top, (orb_similarity, img.id))
+            
+            # If similarity is above threshold, consider it a similar image
+            if orb_similarity >= threshold:
+                return result((img.id, orb_similarity))
+        except Exception as e:
+            logger.error("Error comparing ORB features for image %s: %s", img.id, e)
+    
+    return result(None)
+
+@traced("detection.shards")
+def _scan_shards(file_bytes, query_orb_features, query_features_for, keep_top=0):
+    """
+    Scan the corpus on the shard nodes (see services/shards.py).
+    
+    Partitions whose shard failed, timed out or matched an image deleted
+    since it was loaded are scanned here from the database instead, so a
+    slow or missing shard costs latency rather than hiding its partition.
+    A shard only misses images committed more than SIMILARITY_SHARD_RESYNC_IDS
+    ids out of order, until its next reconciliation (see ShardIndex).
+    
+    Returns:
+        tuple: Same as scan_candidates, with the best match of all shards
+    """
+    answers = query_shards(
+        file_bytes, descriptors_from_features(query_orb_features), ORB_DECODE_POLICY,
+        ORB_SIMILARITY_THRESHOLD, keep_top
+    )
+    matches = {}
+    top = []
+    rescan = []
+    for answer in answers:
+        if answer.response is None:
+            logger.warning("Similarity shard %d failed, scanning its partition locally: %s", answer.shard, answer.error)
+            rescan.append(answer.shard)
+            continue
+        top.extend(tuple(pair) for pair in answer.response["top"])
+        if answer.response["match"] is not None:
+            matches[answer.shard] = tuple(answer.response["match"])
+    
+    live = set(Image.objects.filter(id__in=[image_id for image_id, _ in matches.values()]).values_list("id", flat=True))
+    for shard, (image_id, _) in list(matches.items()):
+        if image_id not in live:
+            logger.warning("Similarity shard %d matched deleted image %s, scanning its partition locally", shard, image_id)
+            record_shard_request(shard, "stale")
+            del matches[shard]
+            rescan.append(shard)
+    
+    for shard in rescan:
+        images = Image.objects.filter(orb_features__isnull=False, **shard_filter(shard, len(answers)))
+        match, shard_top = scan_candidates(
+            images.only("id", "orb_features").order_by("id").iterator(), query_features_for,
+            threshold=ORB_SIMILARITY_THRESHOLD, keep_top=keep_top
+        )
+        top.extend(shard_top)
+        if match is not None:
+            matches[shard] = match
+    
+    match = max(matches.values(), key=lambda m: m[1]) if matches else None
+    return match, sorted(top, reverse=True)[:keep_top]
+
+@traced("detection.verify_similarity")
+def verify_image_similarity(file_bytes, sha256_hash=None, query_embedding=None, check_exact=True):
     """
     Verify if an image is similar to any existing image using SHA256 hash and ORB features.
     The function only uses ORB features without SIFT verification.
     
     Args:
         file_bytes: Bytes of the image file
+        sha256_hash: Precomputed SHA256 hash (e.g. from the upload handler), computed if omitted
+        query_embedding: Xception embedding of the image, used to retrieve extra candidates
+        check_exact: Look up exact duplicates by hash first; False when the
+                     caller already has (the upload pipeline's hash stage)
         
     Returns:
-        None if no similar image is found
+        The query image's ORB features (see get_orb_features) if no similar
+        image is found, so callers need not extract them again
         
     Raises:
         SimilarImageError: If a similar image is found
     """
-    logger.info("Starting image similarity verification")
     total_start_time = time.time()
     
-    # Calculate SHA256 hash for exact duplicate check
-    file_hash = get_sha256(file_bytes)
-    logger.info(f"Image hash: {file_hash[:10]}...")
-    
-    # Check for exact duplicates by hash
-    exact_match = Image.objects.filter(sha256_hash=file_hash).first()
-    if exact_match:
-        logger.warning(f"Exact duplicate image found: ID={exact_match.id}, Hash={file_hash[:10]}...")
-        raise SimilarImageError(
-            message="Exact duplicate image found",
-            image_id=exact_match.id,
-            duplicate_type="exact",
-            similarity=1.0,
-            stage="sha256"
-        )
+    if check_exact:
+        # Calculate SHA256 hash for exact duplicate check
+        file_hash = sha256_hash or get_sha256(file_bytes)
+        
+        # Check for exact duplicates by hash
+        exact_match_id = Image.objects.filter(sha256_hash=file_hash).values_list("id", flat=True).first()
+        if exact_match_id is not None:
+            logger.warning("Exact duplicate image found: ID=%s, Hash=%.10s...", exact_match_id, file_hash)
+            raise SimilarImageError(
+                message="Exact duplicate image found",
+                image_id=exact_match_id,
+                duplicate_type="exact",
+                similarity=1.0,
+                stage="sha256"
+            )
     
     # Extract ORB features from the query image
     query_orb_features = get_orb_features(file_bytes)
     
     if not query_orb_features:
         logger.warning("Could not extract ORB features from query image")
-        return None
+        return query_orb_features
     
-    # Get all images with ORB features
-    images = Image.objects.filter(orb_features__isnull=False)
-    logger.info(f"Comparing against {images.count()} images with ORB features")
+    query_features_for = query_features_resolver(file_bytes, query_orb_features)
     
-    # ORB similarity check
-    orb_threshold = 0.6  # 60% similarity threshold for ORB - adjusted for more accuracy without SIFT second pass
+    # The best scores are only collected when someone will read them
+    keep_top = 10 if _debug_logging() else 0
+    if SIMILARITY_SHARDS:
+        match, top_similarities = _scan_shards(file_bytes, query_orb_features, query_features_for, keep_top)
+    else:
+        images = _similarity_candidates(query_orb_features, query_embedding)
+        match, top_similarities = scan_candidates(images, query_features_for, keep_top=keep_top)
+    if match is not None:
+        image_id, orb_similarity = match
+        logger.warning(
+            "Similar image found: ID=%s with ORB similarity %.4f (verification took %.3fs)",
+            image_id, orb_similarity, time.time() - total_start_time
+        )
+        
+        raise SimilarImageError(
+            message=f"Similar image found with {orb_similarity:.2%} similarity",
+            image_id=image_id,
+            duplicate_type="similar",
+            similarity=orb_similarity,
+            stage="orb"
+        )
     
-    # Track all similarities for debugging
-    all_similarities = []
+    if keep_top:
+        logger.debug("Top ORB similarities: %s", [
+            {"image_id": image_id, "similarity": similarity} for similarity, image_id in top_similarities
+        ])
     
-    for img in images:
-        try:
-            # Skip images without ORB features
-            if not img.orb_features:
+    logger.info(
+        "Image similarity verification completed in %.3fs: No similar images found",
+        time.time() - total_start_time
+    )
+    return query_orb_features
+
+@traced("detection.search")
+def search_similar_images(file_bytes, top_k=10, budget_ms=None, min_similarity=0.0, sha256_hash=None):
+    """
+    Find the stored images most similar to a query image.
+    
+    Unlike verify_image_similarity, the whole corpus (the descriptor store
+    when it is enabled) is scanned and the best matches are kept in a bounded
+    min-heap, so memory stays O(top_k). Nothing is written to the database.
+    
+    Args:
+        file_bytes: Bytes of the query image
+        top_k: Number of matches to return
+        budget_ms: Optional latency budget; the scan stops once it is spent
+                   and the matches found so far are returned
+        min_similarity: Ignore matches below this ORB similarity
+        sha256_hash: Precomputed SHA256 hash of the query, computed if omitted
+        
+    Returns:
+        dict: matches (image_id and similarity, best first), scanned,
+              candidates, partial and elapsed_ms
+    """
+    start_time = time.time()
+    deadline = start_time + budget_ms / 1000.0 if budget_ms else None
+    
+    file_hash = sha256_hash or get_sha256(file_bytes)
+    exact_match_id = Image.objects.filter(sha256_hash=file_hash).values_list("id", flat=True).first()
+    
+    # (similarity, -image_id) so that ties keep the older image
+    heap = []
+    if exact_match_id is not None:
+        heap.append((1.0, -exact_match_id))
+    
+    query_orb_features = get_orb_features(file_bytes)
+    store = get_descriptor_store()
+    if store is not None:
+        store.sync()
+        images = (entry for entry in store.entries() if entry.id != exact_match_id)
+        candidates = len(store) - (exact_match_id in store)
+    else:
+        images = Image.objects.filter(orb_features__isnull=False)
+        if exact_match_id is not None:
+            images = images.exclude(id=exact_match_id)
+        candidates = images.count()
+        images = images.only("id", "orb_features").order_by("id").iterator()
+    scanned = 0
+    partial = False
+    
+    if query_orb_features:
+        score = _candidate_scorer(query_features_resolver(file_bytes, query_orb_features))
+        for img in images:
+            if deadline is not None and time.time() >= deadline:
+                partial = True
+                break
+            scanned += 1
+            if not isinstance(img, StoredDescriptors) and not img.orb_features:
                 continue
-            
-            # Calculate ORB similarity
-            orb_similarity = compare_orb_features(query_orb_features, img.orb_features)
-            
-            # Store all similarities for debugging
-            all_similarities.append({
-                'image_id': img.id,
-                'similarity': orb_similarity
-            })
-            
-            # If similarity is above threshold, consider it a similar image
-            if orb_similarity >= orb_threshold:
-                logger.warning(f"Similar image found: ID={img.id} with ORB similarity {orb_similarity:.4f}")
-                
-                total_elapsed_time = time.time() - total_start_time
-                logger.info(f"Image similarity verification completed in {total_elapsed_time:.3f}s: Similar image found")
-                
-                raise SimilarImageError(
-                    message=f"Similar image found with {orb_similarity:.2%} similarity",
-                    image_id=img.id,
-                    duplicate_type="similar",
-                    similarity=orb_similarity,
-                    stage="orb"
-                )
-        except SimilarImageError:
-            # Re-raise the exception
-            raise
-        except Exception as e:
-            logger.error(f"Error comparing ORB features for image {img.id}: {str(e)}")
+            try:
+                similarity = score(img)
+            except Exception as e:
+                logger.error("Error comparing ORB features for image %s: %s", img.id, e)
+                continue
+            if similarity < min_similarity:
+                continue
+            entry = (similarity, -img.id)
+            if len(heap) < top_k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heappushpop(heap, entry)
+    else:
+        logger.warning("Could not extract ORB features from query image")
     
-    # Log top similarities for debugging
-    all_similarities.sort(key=lambda x: x['similarity'], reverse=True)
-    top_similarities = all_similarities[:10] if len(all_similarities) >= 10 else all_similarities
-    logger.info(f"Top ORB similarities: {top_similarities}")
+    matches = [
+        {"image_id": -neg_id, "similarity": similarity}
+        for similarity, neg_id in sorted(heap, reverse=True)
+    ][:top_k]
+    elapsed_ms = (time.time() - start_time) * 1000
+    logger.info(
+        "Image search (top_k=%d) completed in %.1fms: scanned %d/%d, partial=%s",
+        top_k, elapsed_ms, scanned, candidates, partial
+    )
     
-    # If no candidates pass the ORB threshold, return None
-    total_elapsed_time = time.time() - total_start_time
-    logger.info(f"Image similarity verification completed in {total_elapsed_time:.3f}s: No similar images found")
-    return None
+    return {
+        "matches": matches,
+        "scanned": scanned,
+        "candidates": candidates,
+        "partial": partial,
+        "elapsed_ms": round(elapsed_ms, 1),
+    }
 
+@traced("detection.deepfake")
 def deepfake_check(file_bytes):
     """
     Perform deepfake detection on an image.
@@ -355,35 +687,28 @@ def deepfake_check(file_bytes):
         file_bytes: Bytes of the image file
         
     Returns:
-        dict: Dictionary with detection results
+        dict: Dictionary with detection results (label, confidence, model_version
+              and the pooled embedding, or None if the model does not expose it)
     """
     try:
-        if deepfake_model is None:
+        if deepfake_backend is None:
             logger.warning("Deepfake detection model not loaded")
             return {"label": "Unknown", "confidence": 0.0}
         
-        # Preprocess image for the model
-        img = PILImage.open(io.BytesIO(file_bytes))
-        img = img.resize((299, 299))  # Xception input size
-        img = img.convert('RGB')
-        
-        # Convert to numpy array and normalize
-        img_array = np.array(img)
-        img_array = img_array.astype('float32') / 255.0
+        # Preprocess image for the model on the CPU pool
+        with span("detection.deepfake.preprocess"):
+            img_array = run_cpu_task(preprocess_for_xception, file_bytes)
         img_array = np.expand_dims(img_array, axis=0)
         
-        # Make prediction
-        prediction = deepfake_model.predict(img_array)[0][0]
+        # Make prediction, capturing the pooled embedding from the same pass
+        with span("detection.deepfake.inference", backend=deepfake_backend.name):
+            predictions, embeddings = deepfake_backend.predict_with_embeddings(img_array)
         
         # Interpret prediction (assuming 0 = real, 1 = fake)
-        # Adjust threshold as needed
-        label = "Fake" if prediction > 0.5 else "Real"
-        confidence = float(prediction) if label == "Fake" else 1.0 - float(prediction)
-        
-        return {
-            "label": label,
-            "confidence": confidence
-        }
+        result = interpret_prediction(predictions[0])
+        result["model_version"] = deepfake_backend.version
+        result["embedding"] = embeddings[0] if embeddings is not None else None
+        return result
     except Exception as e:
         logger.error(f"Error in deepfake detection: {str(e)}")
         return {"label": "Unknown", "confidence": 0.0}
@@ -0,0 +1,326 @@
+"""
+IVF-flat index over the pooled Xception embeddings.
+
+deepfake_check captures the penultimate-layer embedding in the same forward
+pass that produces the deepfake score and stores it L2-normalized as
+float16. This index serves cosine nearest-neighbour retrieval over those
+embeddings as a second candidate generator next to the BoVW index:
+
+- A coarse quantizer (spherical k-means centroids) partitions the corpus
+  into inverted lists
+- A query is compared against the centroids and only the nprobe closest
+  lists are scanned exhaustively
+
+Embeddings are only comparable when produced by the same model, so the
+index records the model version it was built for and ignores images scored
+by any other version.
+
+On-disk format (numpy .npz, written atomically):
+
+- centroids: (nlist, d) float32 unit vectors
+- list_ptr: (nlist + 1,) int64 offsets into ids/vectors
+- ids: int64 Image id of each entry, grouped by list
+- vectors: (n, d) float16 embeddings, grouped by list
+- high_water: largest Image id the index has caught up to
+- meta: JSON string (format version, model version, build time)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from apps.images.models import Image
+from .config import EMBEDDING_INDEX_ENABLED, EMBEDDING_INDEX_PATH, EMBEDDING_IVF_NPROBE
+from .index_storage import save_npz_atomic
+from .index_sync import IndexSyncMixin
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+EMBEDDING_DTYPE = np.float16
+
+
+def normalize_embedding(embedding):
+    """
+    L2-normalize an embedding and convert it to the storage dtype.
+
+    Returns:
+        numpy.ndarray: float16 unit vector
+    """
+    embedding = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(embedding)
+    if norm > 0:
+        embedding = embedding / norm
+    return embedding.astype(EMBEDDING_DTYPE)
+
+
+def embedding_to_bytes(embedding):
+    return normalize_embedding(embedding).tobytes()
+
+
+def embedding_from_bytes(data):
+    """Decode an embedding stored in Image.embedding, or None."""
+    if not data:
+        return None
+    return np.frombuffer(bytes(data), dtype=EMBEDDING_DTYPE)
+
+
+def _assign(vectors, centroids, chunk_size=8192):
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        labels[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(vectors, nlist, iterations=20, seed=0):
+    """
+    Train the coarse quantizer with spherical k-means.
+
+    Args:
+        vectors: (n, d) unit embeddings
+        nlist: Number of inverted lists
+        iterations: Maximum number of assign/update rounds
+        seed: Random seed for initialization and reseeding empty lists
+
+    Returns:
+        numpy.ndarray: (nlist, d) float32 unit centroids
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) < nlist:
+        raise ValueError(f"Need at least {nlist} embeddings to train {nlist} lists, got {len(vectors)}")
+
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    labels = None
+    for iteration in range(iterations):
+        new_labels = _assign(vectors, centroids)
+        changed = len(vectors) if labels is None else int(np.count_nonzero(new_labels != labels))
+        labels = new_labels
+
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        clusters = sorted_labels[starts]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids[clusters] = sums / np.where(norms > 0, norms, 1.0)
+
+        empty = np.setdiff1d(np.arange(nlist), clusters)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+        logger.info(f"IVF k-means iteration {iteration + 1}: {changed} assignments changed, {len(empty)} empty lists")
+        if changed == 0 and not len(empty):
+            break
+    return centroids
+
+
+class _InvertedList:
+    """Growable block of (id, vector) rows with tombstones for removals."""
+
+    def __init__(self, dim, ids=None, vectors=None):
+        count = 0 if ids is None else len(ids)
+        capacity = max(16, count)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.vectors = np.zeros((capacity, dim), dtype=EMBEDDING_DTYPE)
+        self.alive = np.zeros(capacity, dtype=bool)
+        if count:
+            self.ids[:count] = ids
+            self.vectors[:count] = vectors
+            self.alive[:count] = True
+        self.count = count
+
+    def append(self, image_id, vector):
+        if self.count == len(self.ids):
+            # Grow by reallocating; views held by in-flight queries stay valid
+            capacity = 2 * len(self.ids)
+            self.ids = np.resize(self.ids, capacity)
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.alive = np.concatenate([self.alive, np.zeros_like(self.alive)])
+        row = self.count
+        self.ids[row] = image_id
+        self.vectors[row] = vector
+        self.alive[row] = True
+        self.count += 1
+        return row
+
+    def live(self):
+        mask = self.alive[:self.count]
+        return self.ids[:self.count][mask], self.vectors[:self.count][mask]
+
+
+class IvfFlatIndex(IndexSyncMixin):
+    """Inverted-file index with exact (flat) scoring inside the probed lists."""
+
+    sync_name = "Embedding index"
+    sync_fields = ("embedding",)
+
+    def __init__(self, centroids, meta=None):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nlist, self.dim = self.centroids.shape
+        self.meta = meta or {}
+        self.high_water = 0
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._lists = [_InvertedList(self.dim) for _ in range(self.nlist)]
+        self._location = {}
+
+    @property
+    def model_version(self):
+        return self.meta.get("model_version")
+
+    def __len__(self):
+        return len(self._location)
+
+    def __contains__(self, image_id):
+        return image_id in self._location
+
+    def ids(self):
+        with self._lock:
+            return list(self._location)
+
+    def stats(self):
+        with self._lock:
+            sizes = np.array([int(lst.alive[:lst.count].sum()) for lst in self._lists])
+        return {
+            "images": len(self),
+            "lists": self.nlist,
+            "dim": self.dim,
+            "high_water": self.high_water,
+            "model_version": self.model_version,
+            "mean_list_size": float(sizes.mean()),
+            "max_list_size": int(sizes.max()),
+            "empty_lists": int(np.count_nonzero(sizes == 0)),
+        }
+
+    def add(self, image_id, embedding):
+        """Add or replace an image in the index."""
+        if embedding is None or len(embedding) != self.dim:
+            return
+        vector = normalize_embedding(embedding)
+        list_no = int(np.argmax(self.centroids @ vector.astype(np.float32)))
+        with self._lock:
+            self.remove(image_id)
+            row = self._lists[list_no].append(image_id, vector)
+            self._location[image_id] = (list_no, row)
+
+    def remove(self, image_id):
+        with self._lock:
+            location = self._location.pop(image_id, None)
+            if location is not None:
+                list_no, row = location
+                self._lists[list_no].alive[row] = False
+
+    def search(self, embedding, top_n, nprobe=EMBEDDING_IVF_NPROBE):
+        """
+        Find the indexed images closest to an embedding by cosine similarity.
+
+        Args:
+            embedding: Query embedding
+            top_n: Number of neighbours to return
+            nprobe: Number of inverted lists to scan
+
+        Returns:
+            list: (image_id, cosine similarity) tuples, best first
+        """
+        if embedding is None or len(embedding) != self.dim:
+            return []
+        query = normalize_embedding(embedding).astype(np.float32)
+        probe = np.argsort(-(self.centroids @ query))[:max(1, nprobe)]
+
+        with self._lock:
+            parts = [self._lists[list_no].live() for list_no in probe]
+        ids = np.concatenate([p[0] for p in parts])
+        if not len(ids):
+            return []
+        scores = np.concatenate([p[1].astype(np.float32) @ query for p in parts])
+
+        if len(ids) > top_n:
+            keep = np.argpartition(-scores, top_n - 1)[:top_n]
+            ids, scores = ids[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def save(self, path):
+        with self._lock:
+            parts = [lst.live() for lst in self._lists]
+            high_water = self.high_water
+        list_ptr = np.zeros(self.nlist + 1, dtype=np.int64)
+        list_ptr[1:] = np.cumsum([len(ids) for ids, _ in parts])
+        meta = dict(self.meta, format_version=INDEX_FORMAT_VERSION, saved_at=time.time())
+        save_npz_atomic(
+            path,
+            centroids=self.centroids,
+            list_ptr=list_ptr,
+            ids=np.concatenate([ids for ids, _ in parts]),
+            vectors=np.concatenate([vectors for _, vectors in parts]),
+            high_water=np.int64(high_water),
+            meta=json.dumps(meta),
+        )
+        logger.info(f"Saved embedding index with {list_ptr[-1]} images to {path}")
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format_version") != INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported embedding index format: {meta.get('format_version')}")
+            index = cls(data["centroids"], meta=meta)
+            list_ptr, ids, vectors = data["list_ptr"], data["ids"], data["vectors"]
+            for list_no in range(index.nlist):
+                start, end = list_ptr[list_no], list_ptr[list_no + 1]
+                index._lists[list_no] = _InvertedList(index.dim, ids[start:end], vectors[start:end])
+                for row, image_id in enumerate(ids[start:end]):
+                    index._location[int(image_id)] = (list_no, row)
+            index.high_water = int(data["high_water"])
+        return index
+
+    def sync_queryset(self):
+        return Image.objects.filter(embedding__isnull=False, deepfake_model_version=self.model_version)
+
+    def load_row(self, img):
+        self.add(img.id, embedding_from_bytes(img.embedding))
+        return img.id in self
+
+    def sync(self):
+        """
+        Index images scored by the index's model (see services/index_sync.py).
+
+        Reconciling also picks up rows rescore_deepfakes rewrote in place and
+        drops rows it rescored with another model.
+        """
+        with self._sync_lock:
+            return self._catch_up()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_embedding_index(load=True):
+    """
+    Get the process-wide embedding index.
+
+    Args:
+        load: Load the index from EMBEDDING_INDEX_PATH if it is not loaded yet
+
+    Returns:
+        IvfFlatIndex or None: None if disabled, not built, or not loaded and load is False
+    """
+    global _index
+    if not EMBEDDING_INDEX_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None and load and os.path.exists(EMBEDDING_INDEX_PATH):
+            try:
+                _index = IvfFlatIndex.load(EMBEDDING_INDEX_PATH)
+                logger.info(f"Loaded embedding index with {len(_index)} images from {EMBEDDING_INDEX_PATH}")
+            except Exception as e:
+                logger.error(f"Failed to load embedding index: {str(e)}")
+        return _index
@@ -27,6 +27,12 @@ class FileValidationError(ImageProcessingError):
         self.message = message
         super().__init__(self.message)
 
+class BatchTooLargeError(FileValidationError):
+    """Exception raised when a batch upload exceeds its item or size limits."""
+    
+    def __init__(self, message="Batch upload too large"):
+        super().__init__(message)
+
 class HashingError(ImageProcessingError):
     """Exception raised when hash calculation fails."""
     
@@ -58,3 +64,20 @@ class SimilarImageError(Exception):
         self.similarity = similarity  # Similarity score (0.0 to 1.0)
         self.stage = stage  # Which stage detected the similarity: "sha256", "orb", or "sift"
         super().__init__(self.message)
+
+class ProcessingTimeoutError(ImageProcessingError):
+    """Exception raised when a CPU-bound processing task times out."""
+    
+    def __init__(self, message="Image processing timed out", stage="processing"):
+        self.message = message
+        self.stage = stage  # Upload stage that timed out, e.g. "orb"
+        super().__init__(self.message)
+
+class AdmissionRejected(Exception):
+    """Exception raised when an upload is not admitted for processing."""
+    
+    def __init__(self, message="Too many uploads in progress", reason="queue_full", retry_after=1):
+        self.message = message
+        self.reason = reason  # "queue_full", "user_queue_full" or "timeout"
+        self.retry_after = retry_after  # Seconds the client should wait before retrying
+        super().__init__(self.message)
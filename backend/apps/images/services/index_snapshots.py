@@ -0,0 +1,139 @@
+"""
+Warm start and refresh of the similarity index snapshots.
+
+The BoVW and embedding indexes are saved as .npz snapshots that carry a
+high-water mark (the largest Image id they have caught up to); the
+descriptor store lives on disk already. A starting worker loads each
+snapshot in one read and replays only the images added after its
+high-water mark, instead of rebuilding from every row on its first request.
+
+Replay grows with the snapshot's age, so snapshot_similarity_indexes (the
+snapshot_indexes command, run from cron or a deploy step) brings the
+snapshots up to date offline. A worker that still had to replay more than
+INDEX_SNAPSHOT_REPLAY_LIMIT images rewrites the snapshot itself so the next
+one starts faster.
+"""
+
+import logging
+import time
+
+from django.db import connections
+
+from apps.images.models import Image
+from .bovw_index import get_bovw_index
+from .config import BOVW_INDEX_PATH, EMBEDDING_INDEX_PATH, INDEX_SNAPSHOT_REPLAY_LIMIT, INDEX_WARM_START
+from .descriptor_store import get_descriptor_store
+from .embedding_index import get_embedding_index
+
+logger = logging.getLogger(__name__)
+
+# Indexes saved as snapshots: name, process-wide getter, snapshot path
+SNAPSHOT_INDEXES = (
+    ("bovw", get_bovw_index, BOVW_INDEX_PATH),
+    ("embedding", get_embedding_index, EMBEDDING_INDEX_PATH),
+)
+
+# Ids checked per query when pruning deleted images
+PRUNE_BATCH_SIZE = 1000
+
+
+def warm_similarity_indexes():
+    """
+    Load the index snapshots and replay the images added since they were saved.
+
+    Called once per worker process at startup (see django_backend/wsgi.py and
+    asgi.py); a no-op unless INDEX_WARM_START is set. Failures are logged and
+    leave the index to be loaded on first use as before.
+
+    Returns:
+        dict: Per index: images, replayed and seconds
+    """
+    report = {}
+    if not INDEX_WARM_START:
+        return report
+    for name, get_index, path in SNAPSHOT_INDEXES:
+        start_time = time.perf_counter()
+        try:
+            index = get_index()
+            if index is None:
+                continue
+            replayed = index.sync()
+            if INDEX_SNAPSHOT_REPLAY_LIMIT and replayed > INDEX_SNAPSHOT_REPLAY_LIMIT:
+                index.save(path)
+        except Exception as e:
+            logger.error(f"Failed to warm the {name} index: {str(e)}")
+            continue
+        report[name] = {"images": len(index), "replayed": replayed, "seconds": round(time.perf_counter() - start_time, 3)}
+
+    start_time = time.perf_counter()
+    try:
+        store = get_descriptor_store()
+        if store is not None:
+            replayed = store.sync()
+            report["descriptors"] = {
+                "images": len(store), "replayed": replayed, "seconds": round(time.perf_counter() - start_time, 3)
+            }
+    except Exception as e:
+        logger.error(f"Failed to warm the descriptor store: {str(e)}")
+
+    # Servers that preload the application fork workers after this; they must not share its connections
+    connections.close_all()
+    logger.info(f"Warmed similarity indexes: {report}")
+    return report
+
+
+def _prune_deleted(index):
+    """Remove images deleted since the snapshot was saved (deletes only reach loaded indexes)."""
+    ids = index.ids()
+    existing = set()
+    for start in range(0, len(ids), PRUNE_BATCH_SIZE):
+        existing.update(
+            Image.objects.filter(id__in=ids[start:start + PRUNE_BATCH_SIZE]).values_list("id", flat=True)
+        )
+    removed = [image_id for image_id in ids if image_id not in existing]
+    for image_id in removed:
+        index.remove(image_id)
+    return len(removed)
+
+
+def snapshot_similarity_indexes():
+    """
+    Bring every index snapshot up to date.
+
+    Each snapshot is loaded, pruned of deleted images, caught up with the
+    images added since it was saved and written back; the descriptor store
+    is caught up and compacted. Nothing is rebuilt from scratch.
+
+    Returns:
+        dict: Per index: images, pruned, replayed and seconds
+    """
+    report = {}
+    for name, get_index, path in SNAPSHOT_INDEXES:
+        start_time = time.perf_counter()
+        index = get_index()
+        if index is None:
+            continue
+        pruned = _prune_deleted(index)
+        replayed = index.sync()
+        index.save(path)
+        report[name] = {
+            "images": len(index),
+            "pruned": pruned,
+            "replayed": replayed,
+            "seconds": round(time.perf_counter() - start_time, 3),
+        }
+
+    store = get_descriptor_store()
+    if store is not None:
+        start_time = time.perf_counter()
+        replayed = store.sync()
+        pruned = store.stats()["dead_rows"]
+        if pruned:
+            store.compact()
+        report["descriptors"] = {
+            "images": len(store),
+            "pruned_rows": pruned,
+            "replayed": replayed,
+            "seconds": round(time.perf_counter() - start_time, 3),
+        }
+    return report
@@ -0,0 +1,23 @@
+"""
+On-disk storage helpers shared by the similarity indexes.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+
+def save_npz_atomic(path, **arrays):
+    """
+    Write arrays to an .npz file without ever exposing a partial file.
+
+    The arrays are written to a temporary file next to the target and then
+    renamed over it, so readers see either the old or the new index. The
+    temporary name is per writer, so concurrent snapshot writers (see
+    index_snapshots) each rename a complete file and the last one wins.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
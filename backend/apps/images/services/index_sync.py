@@ -0,0 +1,87 @@
+"""
+Catching in-memory similarity indexes up with the database.
+
+Ids are assigned when a row is inserted, so another worker's image can
+commit after a higher id was already indexed, and rescore_deepfakes rewrites
+embeddings of rows far below the high-water mark without sending signals.
+Loading only ids above the high-water mark would miss both for good, and
+snapshots carry the mark across restarts.
+
+Each sync therefore lists the ids of the last INDEX_RESYNC_IDS rows below
+the mark (an id-only query) and loads the ones the index lacks. Every
+INDEX_RECONCILE_SECONDS, and on the first sync of a loaded index, the full
+id list is compared instead: images that left the queryset are removed and
+any still missing are loaded.
+"""
+
+import logging
+import time
+
+from .config import INDEX_RECONCILE_SECONDS, INDEX_RESYNC_IDS
+
+logger = logging.getLogger(__name__)
+
+# Rows whose indexed fields are loaded per query
+LOAD_BATCH_SIZE = 500
+
+
+class IndexSyncMixin:
+    """
+    sync() support for an index holding a subset of Image rows.
+
+    Subclasses set sync_name and sync_fields, implement sync_queryset() and
+    load_row(img) (add a row, returning whether it was indexed), and have
+    high_water, _sync_lock, ids(), remove() and __contains__.
+    """
+
+    sync_name = None
+    sync_fields = ()
+
+    def sync_queryset(self):
+        raise NotImplementedError
+
+    def load_row(self, img):
+        raise NotImplementedError
+
+    def _catch_up(self):
+        """Load missed rows, reconciling when due; caller holds the sync lock. Returns the number added."""
+        if not hasattr(self, "_unindexable"):
+            # Rows load_row declined, so they are not fetched again
+            self._unindexable = set()
+            self._last_reconcile = None
+        queryset = self.sync_queryset()
+
+        removed = 0
+        if self._last_reconcile is None or time.monotonic() - self._last_reconcile >= INDEX_RECONCILE_SECONDS:
+            ids = set(queryset.values_list("id", flat=True))
+            for image_id in self.ids():
+                if image_id not in ids:
+                    self.remove(image_id)
+                    removed += 1
+            self._unindexable &= ids
+            self._last_reconcile = time.monotonic()
+        else:
+            ids = queryset.filter(id__gt=max(0, self.high_water - INDEX_RESYNC_IDS)).values_list("id", flat=True)
+
+        missing = sorted(image_id for image_id in ids if image_id not in self and image_id not in self._unindexable)
+        late = sum(1 for image_id in missing if image_id <= self.high_water)
+        added = 0
+        for start in range(0, len(missing), LOAD_BATCH_SIZE):
+            rows = (
+                queryset.filter(id__in=missing[start:start + LOAD_BATCH_SIZE])
+                .only("id", *self.sync_fields).order_by("id")
+            )
+            for img in rows.iterator():
+                if self.load_row(img):
+                    added += 1
+                else:
+                    self._unindexable.add(img.id)
+                self.high_water = max(self.high_water, img.id)
+
+        if removed:
+            logger.info(f"{self.sync_name} dropped {removed} images no longer in the database")
+        if late:
+            logger.info(f"{self.sync_name} picked up {late} images below its high-water mark")
+        if added:
+            logger.info(f"{self.sync_name} caught up with {added} new images")
+        return added
@@ -0,0 +1,321 @@
+"""
+Pluggable inference backends for the Xception deepfake model.
+
+All backends take a float32 batch of shape (n, 299, 299, 3) scaled to
+[0, 1] and return the fake probability for each image, optionally along
+with the pooled penultimate-layer embedding computed in the same forward
+pass. The backend is selected with DEEPFAKE_BACKEND:
+
+- "keras": the original xception_deepfake.h5 model
+- "tflite": a converted TFLite model (float32, float16 or int8 quantized)
+- "onnx": a converted ONNX model run with ONNX Runtime
+
+Converted models are produced by the convert_deepfake_model management
+command and can be validated against the Keras model with
+check_deepfake_parity.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from .config import (
+    DEEPFAKE_BACKEND,
+    DEEPFAKE_MODEL_DIR,
+    DEEPFAKE_MODEL_PATH,
+    DEEPFAKE_MODEL_VERSION,
+    DEEPFAKE_NUM_THREADS
+)
+from .exceptions import ModelError
+
+logger = logging.getLogger(__name__)
+
+# Default model file per backend, relative to DEEPFAKE_MODEL_DIR
+DEFAULT_MODEL_FILES = {
+    "keras": "xception_deepfake.h5",
+    "tflite": "xception_deepfake.tflite",
+    "onnx": "xception_deepfake.onnx",
+}
+
+
+class InferenceBackend(ABC):
+    """Base class for deepfake inference backends."""
+
+    name = None
+
+    def __init__(self, model_path):
+        if not os.path.exists(model_path):
+            raise ModelError(f"Model file not found: {model_path}")
+        self.model_path = model_path
+        self._version = DEEPFAKE_MODEL_VERSION or None
+
+    @property
+    def version(self):
+        """
+        Model version recorded with each score.
+
+        Defaults to the backend name plus a digest of the model file, so
+        swapping the model file changes the version.
+        """
+        if self._version is None:
+            digest = hashlib.sha256()
+            with open(self.model_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            self._version = f"{self.name}:{digest.hexdigest()[:12]}"
+        return self._version
+
+    @property
+    def has_embeddings(self):
+        """Whether predict_with_embeddings returns embeddings for this model."""
+        return False
+
+    def predict(self, batch):
+        """
+        Run the model on a batch of preprocessed images.
+
+        Args:
+            batch: float32 array of shape (n, 299, 299, 3)
+
+        Returns:
+            numpy.ndarray: Fake probability per image, shape (n,)
+        """
+        return self.predict_with_embeddings(batch)[0]
+
+    @abstractmethod
+    def predict_with_embeddings(self, batch):
+        """
+        Run the model and also return the pooled embedding of each image.
+
+        Args:
+            batch: float32 array of shape (n, 299, 299, 3)
+
+        Returns:
+            tuple: (fake probabilities of shape (n,), float32 embeddings of
+                   shape (n, d) or None if the model does not expose them)
+        """
+
+
+def find_embedding_layer(model):
+    """
+    Find the pooled penultimate layer of a Keras classifier.
+
+    Prefers the global pooling layer; otherwise falls back to the last
+    layer before the output producing a flat feature vector.
+
+    Returns:
+        Layer or None: The embedding layer
+    """
+    import tensorflow as tf
+
+    candidates = list(reversed(model.layers[:-1]))
+    for layer in candidates:
+        if isinstance(layer, (tf.keras.layers.GlobalAveragePooling2D, tf.keras.layers.GlobalMaxPooling2D)):
+            return layer
+    for layer in candidates:
+        shape = layer.output.shape
+        if len(shape) == 2 and (shape[-1] or 0) > 1:
+            return layer
+    return None
+
+
+def build_embedding_model(model):
+    """
+    Wrap a Keras classifier so it outputs [probability, embedding].
+
+    Returns:
+        Model or None: The two-output model, None if no embedding layer was found
+    """
+    import tensorflow as tf
+
+    layer = find_embedding_layer(model)
+    if layer is None:
+        return None
+    return tf.keras.Model(model.input, [model.output, layer.output])
+
+
+def _split_outputs(outputs, batch_size):
+    """
+    Split model outputs into probabilities and embeddings.
+
+    The probability is the output with a single value per image; converted
+    models may order their outputs either way.
+    """
+    outputs = [np.asarray(output).reshape(batch_size, -1) for output in outputs]
+    probabilities = next((o for o in outputs if o.shape[1] == 1), outputs[0])
+    embeddings = next((o for o in outputs if o is not probabilities), None)
+    if embeddings is not None:
+        embeddings = embeddings.astype(np.float32)
+    return probabilities[:, 0], embeddings
+
+
+class KerasBackend(InferenceBackend):
+    """Runs the original Keras model."""
+
+    name = "keras"
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        import tensorflow as tf
+
+        self.model = tf.keras.models.load_model(model_path)
+        try:
+            # Same forward pass, with the pooled features exposed as a second output
+            self.embedding_model = build_embedding_model(self.model)
+        except Exception as e:
+            logger.warning(f"Could not expose embeddings for {model_path}: {str(e)}")
+            self.embedding_model = None
+
+    @property
+    def has_embeddings(self):
+        return self.embedding_model is not None
+
+    def predict_with_embeddings(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        # Calling the model directly avoids the per-call setup cost of model.predict
+        if self.embedding_model is None:
+            return _split_outputs([self.model(batch, training=False)], len(batch))
+        return _split_outputs(self.embedding_model(batch, training=False), len(batch))
+
+
+class TFLiteBackend(InferenceBackend):
+    """Runs a TFLite model, dequantizing int8 inputs and outputs as needed."""
+
+    name = "tflite"
+
+    def __init__(self, model_path, num_threads=DEEPFAKE_NUM_THREADS):
+        super().__init__(model_path)
+        try:
+            # The standalone runtime is much smaller than full TensorFlow
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads or None)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        # Models converted with embeddings have a second output
+        self.output_details = self.interpreter.get_output_details()
+        self._batch_size = int(self.input_detail["shape"][0])
+        # Interpreters hold mutable tensor buffers and are not thread-safe
+        self._lock = threading.Lock()
+
+    @property
+    def has_embeddings(self):
+        return len(self.output_details) > 1
+
+    def _quantize(self, batch):
+        dtype = self.input_detail["dtype"]
+        if dtype == np.float32:
+            return batch
+        scale, zero_point = self.input_detail["quantization"]
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, detail, output):
+        if detail["dtype"] == np.float32:
+            return output
+        scale, zero_point = detail["quantization"]
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict_with_embeddings(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input_detail["index"], list(batch.shape))
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self.interpreter.set_tensor(self.input_detail["index"], self._quantize(batch))
+            self.interpreter.invoke()
+            outputs = [
+                self._dequantize(detail, self.interpreter.get_tensor(detail["index"]))
+                for detail in self.output_details
+            ]
+        return _split_outputs(outputs, len(batch))
+
+
+class OnnxBackend(InferenceBackend):
+    """Runs an ONNX model with ONNX Runtime on the CPU."""
+
+    name = "onnx"
+
+    def __init__(self, model_path, num_threads=DEEPFAKE_NUM_THREADS):
+        super().__init__(model_path)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ModelError("onnxruntime is required for the ONNX backend (pip install onnxruntime)")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    @property
+    def has_embeddings(self):
+        return len(self.session.get_outputs()) > 1
+
+    def predict_with_embeddings(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        return _split_outputs(self.session.run(None, {self.input_name: batch}), len(batch))
+
+
+def interpret_prediction(prediction):
+    """
+    Turn a fake probability into a label and confidence.
+
+    Args:
+        prediction: Model output (0 = real, 1 = fake)
+
+    Returns:
+        dict: label ("Real" or "Fake") and confidence in that label
+    """
+    # Adjust threshold as needed
+    label = "Fake" if prediction > 0.5 else "Real"
+    confidence = float(prediction) if label == "Fake" else 1.0 - float(prediction)
+    return {"label": label, "confidence": confidence}
+
+
+BACKENDS = {
+    "keras": KerasBackend,
+    "tflite": TFLiteBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def default_model_path(backend_name):
+    """Get the default model file for a backend."""
+    return os.path.join(DEEPFAKE_MODEL_DIR, DEFAULT_MODEL_FILES[backend_name])
+
+
+def load_inference_backend(backend_name=DEEPFAKE_BACKEND, model_path=None):
+    """
+    Load an inference backend.
+
+    Args:
+        backend_name: "keras", "tflite" or "onnx"
+        model_path: Model file, defaults to DEEPFAKE_MODEL_PATH or the backend's default file
+
+    Returns:
+        InferenceBackend: The loaded backend
+
+    Raises:
+        ModelError: If the backend is unknown or the model cannot be loaded
+    """
+    if backend_name not in BACKENDS:
+        raise ModelError(f"Unknown inference backend: {backend_name}")
+
+    model_path = model_path or DEEPFAKE_MODEL_PATH or default_model_path(backend_name)
+    try:
+        return BACKENDS[backend_name](model_path)
+    except ModelError:
+        raise
+    except Exception as e:
+        raise ModelError(f"Failed to load {backend_name} model from {model_path}: {str(e)}")
@@ -0,0 +1,267 @@
+"""
+Opt-in per-request memory profiling (MEMORY_PROFILING_ENABLED).
+
+MemoryProfilingMiddleware profiles requests under MEMORY_PROFILE_PATHS, and
+run_upload_job profiles queued jobs. Each report records:
+
+- RSS at the start and end of the request, and how much it raised the
+  process RSS high-water mark (what worker sizing has to cover)
+- current and peak memory traced by tracemalloc
+- for each upload stage (hash, similarity, deepfake, chain, store): how much
+  traced memory it added and peaked at above its start, RSS after it, its
+  RSS high-water growth and the allocation sites alive at its end
+- the allocation sites the request left allocated
+
+Reports are appended as JSON lines to MEMORY_PROFILE_DIR and the most
+recent are served on /api/images/admin/memory-profiles/.
+
+tracemalloc is process-wide: when profiled requests overlap, each report
+also counts the others' allocations (``concurrent_profiles`` says so).
+Tracing also slows allocation-heavy Python code down considerably, so
+profile a single-threaded worker outside production traffic. Allocation
+sites come from tracemalloc snapshots, which get slower as traced memory
+grows; MEMORY_PROFILE_TOP=0 skips them and keeps only the sizes.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+from .config import (
+    MEMORY_PROFILE_DIR,
+    MEMORY_PROFILE_FRAMES,
+    MEMORY_PROFILE_KEEP,
+    MEMORY_PROFILE_SAMPLE_RATE,
+    MEMORY_PROFILE_TOP,
+    MEMORY_PROFILING_ENABLED
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_current_profile = contextvars.ContextVar("honour_memory_profile", default=None)
+
+_lock = threading.Lock()
+_in_flight = 0
+_recent = deque(maxlen=MEMORY_PROFILE_KEEP)
+
+# Allocations made by the profiler itself are not interesting
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+def _kb(value):
+    return round(value / 1024, 1) if value is not None else None
+
+
+def _rss_bytes():
+    """Current resident set size, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _max_rss_bytes():
+    """Process RSS high-water mark, or None where getrusage is not available."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _snapshot():
+    if not MEMORY_PROFILE_TOP:
+        return None
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+def _top_allocations(snapshot, baseline):
+    """Allocation sites that grew the most since the baseline snapshot."""
+    top = []
+    if snapshot is None:
+        return top
+    for stat in snapshot.compare_to(baseline, "lineno"):
+        if len(top) >= MEMORY_PROFILE_TOP or stat.size_diff <= 0:
+            break
+        frame = stat.traceback[0]
+        top.append({
+            "location": f"{frame.filename}:{frame.lineno}",
+            "size_kb": _kb(stat.size_diff),
+            "count": stat.count_diff,
+        })
+    return top
+
+
+class MemoryProfile:
+    """
+    Memory measurements of one request or job.
+
+    Stages are recorded while the profile is active (see activate); finish
+    may be called later, e.g. once a streaming response has been consumed.
+    """
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.stages = []
+        self._peak = 0
+        self._token = None
+
+    def start(self):
+        global _in_flight
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(MEMORY_PROFILE_FRAMES)
+        with _lock:
+            _in_flight += 1
+            self._concurrent = _in_flight - 1
+        self._start_time = time.time()
+        self._baseline = _snapshot()
+        self._rss_start = _rss_bytes()
+        self._max_rss_start = _max_rss_bytes()
+        self._traced_start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        return self
+
+    def activate(self):
+        self._token = _current_profile.set(self)
+
+    def deactivate(self):
+        _current_profile.reset(self._token)
+        self._token = None
+
+    def _fold_peak(self):
+        # Stages reset the traced peak, so the request's peak is kept here
+        self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+
+    @contextmanager
+    def stage(self, name):
+        self._fold_peak()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        max_rss_before = _max_rss_bytes()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            traced_after, stage_peak = tracemalloc.get_traced_memory()
+            self._peak = max(self._peak, stage_peak)
+            max_rss_after = _max_rss_bytes()
+            self.stages.append({
+                "name": name,
+                "traced_growth_kb": _kb(traced_after - traced_before),
+                "traced_peak_kb": _kb(max(stage_peak - traced_before, 0)),
+                "rss_after_kb": _kb(_rss_bytes()),
+                "rss_high_water_growth_kb": _kb(
+                    max_rss_after - max_rss_before if max_rss_after is not None else None
+                ),
+                "top_allocations": _top_allocations(_snapshot(), self._baseline),
+            })
+
+    def finish(self, **attributes):
+        """Complete the report and record it."""
+        global _in_flight
+        self._fold_peak()
+        traced_end = tracemalloc.get_traced_memory()[0]
+        rss_end = _rss_bytes()
+        max_rss_end = _max_rss_bytes()
+        top_allocations = _top_allocations(_snapshot(), self._baseline)
+        with _lock:
+            concurrent = max(self._concurrent, _in_flight - 1)
+            _in_flight -= 1
+
+        self.attributes.update(attributes)
+        report = {
+            "name": self.name,
+            "pid": os.getpid(),
+            "started_at": self._start_time,
+            "duration_ms": round((time.time() - self._start_time) * 1000, 1),
+            "attributes": self.attributes,
+            "concurrent_profiles": concurrent,
+            "rss_start_kb": _kb(self._rss_start),
+            "rss_end_kb": _kb(rss_end),
+            "rss_high_water_kb": _kb(max_rss_end),
+            "rss_high_water_growth_kb": _kb(
+                max_rss_end - self._max_rss_start if max_rss_end is not None else None
+            ),
+            # Can undershoot when a concurrent profile reset the traced peak
+            "traced_peak_kb": _kb(max(self._peak - self._traced_start, 0)),
+            "traced_retained_kb": _kb(traced_end - self._traced_start),
+            "stages": self.stages,
+            "top_allocations": top_allocations,
+        }
+        _record(report)
+        return report
+
+
+def _record(report):
+    with _lock:
+        _recent.append(report)
+        try:
+            os.makedirs(MEMORY_PROFILE_DIR, exist_ok=True)
+            path = os.path.join(MEMORY_PROFILE_DIR, f"memory-{os.getpid()}.jsonl")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(report) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to write memory profile: {str(e)}")
+
+
+def start_memory_profile(name, **attributes):
+    """
+    Start profiling a request or job, subject to MEMORY_PROFILE_SAMPLE_RATE.
+
+    Returns:
+        MemoryProfile or None: The running profile, None when not profiled
+    """
+    if not MEMORY_PROFILING_ENABLED or random.random() >= MEMORY_PROFILE_SAMPLE_RATE:
+        return None
+    return MemoryProfile(name, **attributes).start()
+
+
+@contextmanager
+def memory_profile(name, **attributes):
+    """Profile a block as a whole request or job."""
+    profile = start_memory_profile(name, **attributes)
+    if profile is None:
+        yield None
+        return
+    profile.activate()
+    try:
+        yield profile
+    finally:
+        profile.deactivate()
+        profile.finish()
+
+
+@contextmanager
+def memory_stage(name):
+    """Record a block as a stage of the current profile; a no-op when not profiling."""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+
+def recent_memory_profiles():
+    """Most recent reports recorded by this process, newest first."""
+    with _lock:
+        return list(reversed(_recent))
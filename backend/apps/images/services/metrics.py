@@ -0,0 +1,184 @@
+"""
+Prometheus metrics for the upload pipeline and blockchain anchoring.
+
+Exposed in the Prometheus text format on /metrics:
+
+- honour_upload_stage_seconds{stage}: time spent in each upload stage
+  (hash, similarity, deepfake, chain, store)
+- honour_upload_seconds{mode}: end-to-end upload latency (single, batch, job)
+- honour_upload_outcomes_total{outcome}: created, exact_duplicate, similar
+- honour_deepfake_predictions_total{label}: Real, Fake, Unknown
+- honour_chain_seconds{operation} and
+  honour_chain_transactions_total{operation, result}: blockchain calls and
+  their outcome (success, exists, retry, timeout, failed)
+- honour_cpu_pool_in_flight: CPU pool tasks submitted and not finished
+- honour_upload_jobs{status} and honour_index_images{index}: queue depth and
+  similarity index sizes, read when the metrics are scraped
+
+Multi-process mode: when gunicorn runs several workers, set
+PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers (and
+clear it on every restart). Each worker then writes its samples there and
+/metrics aggregates all of them, whichever worker serves the scrape. Dead
+workers must be reported from the gunicorn config:
+
+    from apps.images.services.metrics import mark_worker_dead
+
+    def child_exit(server, worker):
+        mark_worker_dead(worker.pid)
+"""
+
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .config import METRICS_MULTIPROC_DIR
+
+# Upload stages range from milliseconds (hashing) to tens of seconds (confirmations)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+UPLOAD_STAGE_SECONDS = Histogram(
+    "honour_upload_stage_seconds", "Time spent in each upload stage", ["stage"], buckets=LATENCY_BUCKETS
+)
+UPLOAD_SECONDS = Histogram(
+    "honour_upload_seconds", "End-to-end upload latency", ["mode"], buckets=LATENCY_BUCKETS
+)
+UPLOAD_OUTCOMES = Counter(
+    "honour_upload_outcomes", "Uploads by outcome", ["outcome"]
+)
+DEEPFAKE_PREDICTIONS = Counter(
+    "honour_deepfake_predictions", "Deepfake predictions for uploaded images by label", ["label"]
+)
+CHAIN_SECONDS = Histogram(
+    "honour_chain_seconds", "Duration of blockchain operations, retries included", ["operation"],
+    buckets=LATENCY_BUCKETS
+)
+CHAIN_TRANSACTIONS = Counter(
+    "honour_chain_transactions", "Blockchain transactions by outcome", ["operation", "result"]
+)
+SHARD_SECONDS = Histogram(
+    "honour_similarity_shard_seconds", "Similarity shard query latency as seen by the coordinator", ["shard"],
+    buckets=LATENCY_BUCKETS
+)
+SHARD_REQUESTS = Counter(
+    "honour_similarity_shard_requests", "Similarity shard queries by outcome", ["shard", "result"]
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "honour_admission_wait_seconds", "Time admitted requests waited for a slot", ["endpoint"],
+    buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+ADMISSION_REJECTIONS = Counter(
+    "honour_admission_rejections", "Requests rejected with 429 by admission control", ["endpoint", "reason"]
+)
+ADMISSION_QUEUED = Gauge(
+    "honour_admission_queued", "Requests waiting for admission", ["endpoint"], multiprocess_mode="livesum"
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "honour_admission_in_flight", "Admitted requests still running", ["endpoint"], multiprocess_mode="livesum"
+)
+CPU_POOL_IN_FLIGHT = Gauge(
+    "honour_cpu_pool_in_flight", "CPU pool tasks submitted and not yet finished", multiprocess_mode="livesum"
+)
+
+
+@contextmanager
+def observe_stage(stage):
+    """Time a block as an upload stage."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        UPLOAD_STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start_time)
+
+
+def record_outcome(outcome):
+    UPLOAD_OUTCOMES.labels(outcome=outcome).inc()
+
+
+def record_duplicate(duplicate_type):
+    """Count a rejected upload from the duplicate_type of a SimilarImageError."""
+    record_outcome("exact_duplicate" if duplicate_type == "exact" else "similar")
+
+
+def record_deepfake_prediction(label):
+    DEEPFAKE_PREDICTIONS.labels(label=label).inc()
+
+
+def record_chain_tx(operation, result, count=1):
+    CHAIN_TRANSACTIONS.labels(operation=operation, result=result).inc(count)
+
+
+def record_shard_request(shard, result, seconds=None):
+    """Count a shard query; result is ok, needs_image (asked for the query image), error, timeout or stale (matched a deleted image)."""
+    SHARD_REQUESTS.labels(shard=shard, result=result).inc()
+    if seconds is not None:
+        SHARD_SECONDS.labels(shard=shard).observe(seconds)
+
+
+class _StateCollector:
+    """Gauges read from the database and the loaded indexes at scrape time."""
+
+    def describe(self):
+        # Registering must not query the database
+        return []
+
+    def collect(self):
+        # Imported here so the blockchain service can record metrics without Django
+        from django.db.models import Count
+        from apps.images.models import UploadJob
+        from .bovw_index import get_bovw_index
+        from .embedding_index import get_embedding_index
+
+        jobs = GaugeMetricFamily("honour_upload_jobs", "Upload jobs waiting or being processed", labels=["status"])
+        pending = (UploadJob.STATUS_QUEUED, UploadJob.STATUS_RUNNING)
+        counts = dict(
+            UploadJob.objects.filter(status__in=pending)
+            .values("status").order_by().annotate(count=Count("id")).values_list("status", "count")
+        )
+        for status in pending:
+            jobs.add_metric([status], counts.get(status, 0))
+        yield jobs
+
+        # Sizes as seen by the worker serving the scrape; indexes are not loaded just to be measured
+        indexes = GaugeMetricFamily("honour_index_images", "Images in the loaded similarity indexes", labels=["index"])
+        for name, index in (("bovw", get_bovw_index(load=False)), ("embedding", get_embedding_index(load=False))):
+            if index is not None:
+                indexes.add_metric([name], len(index))
+        yield indexes
+
+
+if not METRICS_MULTIPROC_DIR:
+    REGISTRY.register(_StateCollector())
+
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text format.
+
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    if METRICS_MULTIPROC_DIR:
+        # Aggregate the samples every worker wrote to the shared directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_StateCollector())
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead(pid):
+    """Drop the live gauges of an exited gunicorn worker (call from child_exit)."""
+    if METRICS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
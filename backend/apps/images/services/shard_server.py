@@ -0,0 +1,246 @@
+"""
+Similarity shard node: one partition of the corpus, answering over HTTP.
+
+Run with ``manage.py run_similarity_shard --shard N --shards M``; the
+protocol and partitioning are described in services/shards.py. Several
+shards can run on one machine on different ports.
+"""
+
+import base64
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from django.db import close_old_connections, connection
+
+from apps.images.models import Image
+from .bovw_index import DESCRIPTOR_BYTES
+from .config import SIMILARITY_SHARD_PRUNE_SECONDS, SIMILARITY_SHARD_RESYNC_IDS
+from .cpu_pool import decode_policy
+from .descriptor_store import StoredDescriptors, descriptor_item
+from .detection_service import query_features_resolver, scan_candidates
+from .shards import shard_filter, shard_prefix_range
+
+logger = logging.getLogger(__name__)
+
+# Images whose features are loaded per query while catching up
+LOAD_BATCH_SIZE = 1000
+
+
+def _policy_key(policy):
+    return frozenset(policy.items())
+
+
+class ShardIndex:
+    """
+    ORB descriptors of one partition, in memory and in id order.
+
+    Before every query the index loads the images created since the
+    high-water mark, re-checking the SIMILARITY_SHARD_RESYNC_IDS ids below
+    it: ids are assigned on insert, so a row can commit after a higher id
+    was loaded. Every SIMILARITY_SHARD_PRUNE_SECONDS it reconciles the whole
+    partition with the database, dropping deleted images and loading any
+    that committed further out of order than that.
+    """
+
+    def __init__(self, shard, shards):
+        self.shard = shard
+        self.shards = shards
+        self.high_water = 0
+        self._entries = {}
+        self._ordered = []
+        # Ids whose features hold no descriptors, so they are not loaded again
+        self._empty = set()
+        # Number of entries per decode policy
+        self._policies = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        low, high = shard_prefix_range(self.shard, self.shards)
+        return {
+            "shard": self.shard,
+            "shards": self.shards,
+            "prefix_range": [low, high],
+            "images": len(self._entries),
+            "descriptor_bytes": sum(len(e.descriptors) for e in self._ordered) * DESCRIPTOR_BYTES,
+            "decode_policies": len(self._policies),
+            "high_water": self.high_water,
+        }
+
+    def _partition(self):
+        return Image.objects.filter(orb_features__isnull=False, **shard_filter(self.shard, self.shards))
+
+    def _load(self, ids):
+        """Load images by id and rebuild the id order if any were added; caller holds the lock."""
+        ids = sorted(image_id for image_id in ids if image_id not in self._entries and image_id not in self._empty)
+        if not ids:
+            return 0
+        in_order = not self._entries or ids[0] > next(reversed(self._entries))
+        added = 0
+        for start in range(0, len(ids), LOAD_BATCH_SIZE):
+            rows = (
+                self._partition().filter(id__in=ids[start:start + LOAD_BATCH_SIZE])
+                .only("id", "orb_features").order_by("id")
+            )
+            for img in rows.iterator():
+                image_id, descriptors, policy = descriptor_item(img.id, img.orb_features)
+                self.high_water = max(self.high_water, image_id)
+                if descriptors is None:
+                    self._empty.add(image_id)
+                    continue
+                entry = StoredDescriptors(image_id, descriptors, policy or decode_policy(0))
+                self._entries[image_id] = entry
+                key = _policy_key(entry.decode)
+                self._policies[key] = self._policies.get(key, 0) + 1
+                added += 1
+        if added:
+            if not in_order:
+                self._entries = dict(sorted(self._entries.items()))
+            self._ordered = list(self._entries.values())
+        return added
+
+    def sync(self):
+        """Load the partition's images created since the high-water mark, or committed shortly behind it."""
+        with self._lock:
+            ids = self._partition().filter(
+                id__gt=max(0, self.high_water - SIMILARITY_SHARD_RESYNC_IDS)
+            ).values_list("id", flat=True)
+            added = self._load(list(ids))
+            if added:
+                logger.info(f"Shard {self.shard} caught up with {added} new images")
+            return added
+
+    def prune(self):
+        """Reconcile with the database: drop deleted images, load any still missing."""
+        with self._lock:
+            existing = set(self._partition().values_list("id", flat=True))
+            removed = [image_id for image_id in self._entries if image_id not in existing]
+            for image_id in removed:
+                key = _policy_key(self._entries.pop(image_id).decode)
+                self._policies[key] -= 1
+                if not self._policies[key]:
+                    del self._policies[key]
+            self._empty &= existing
+            added = self._load(existing)
+            if removed and not added:
+                self._ordered = list(self._entries.values())
+            if removed:
+                logger.info(f"Shard {self.shard} dropped {len(removed)} deleted images")
+            if added:
+                logger.warning(f"Shard {self.shard} loaded {added} images committed out of id order")
+            self._last_prune = time.monotonic()
+            return len(removed)
+
+    def needs_image(self, decode):
+        """Whether a query decoded under this policy must be re-extracted for some of the partition."""
+        query_key = _policy_key(decode)
+        with self._lock:
+            return any(key != query_key for key in self._policies)
+
+    def search(self, file_bytes, query_descriptors, decode, threshold, keep_top=0):
+        """
+        Scan the partition like verify_image_similarity scans the corpus.
+
+        Args:
+            file_bytes: Bytes of the query image, or None if the coordinator
+                        did not send them; only needed when the partition holds
+                        features extracted under another decode policy
+
+        Returns:
+            dict: The /search response body
+        """
+        start_time = time.perf_counter()
+        self.sync()
+        if time.monotonic() - self._last_prune >= SIMILARITY_SHARD_PRUNE_SECONDS:
+            self.prune()
+        if file_bytes is None and self.needs_image(decode):
+            return {"shard": self.shard, "shards": self.shards, "needs_image": True}
+        entries = self._ordered
+        query_features_for = query_features_resolver(
+            file_bytes, {"descriptors": query_descriptors.tolist(), "decode": decode}, query_policy=decode
+        )
+        match, top = scan_candidates(entries, query_features_for, threshold=threshold, keep_top=keep_top)
+        return {
+            "shard": self.shard,
+            "shards": self.shards,
+            "match": list(match) if match is not None else None,
+            "top": [list(pair) for pair in top],
+            "scanned": len(entries),
+            "elapsed_ms": round((time.perf_counter() - start_time) * 1000, 1),
+        }
+
+
+class _ShardRequestHandler(BaseHTTPRequestHandler):
+    # Set on the subclass made by serve_shard
+    index = None
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._reply(404, {"error": "Not found"})
+            return
+        self._reply(200, self.index.stats())
+
+    def do_POST(self):
+        if self.path != "/search":
+            self._reply(404, {"error": "Not found"})
+            return
+        close_old_connections()
+        try:
+            query = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if query.get("shard") != self.index.shard or query.get("shards") != self.index.shards:
+                self._reply(409, {
+                    "error": f"This node serves shard {self.index.shard} of {self.index.shards}",
+                    "shard": self.index.shard,
+                    "shards": self.index.shards,
+                })
+                return
+            query_descriptors = np.frombuffer(
+                base64.b64decode(query["descriptors"]), dtype=np.uint8
+            ).reshape(-1, DESCRIPTOR_BYTES)
+            image = query.get("image")
+            response = self.index.search(
+                base64.b64decode(image) if image is not None else None, query_descriptors, query["decode"],
+                float(query["threshold"]), int(query.get("keep_top", 0))
+            )
+        except (KeyError, ValueError, TypeError) as e:
+            self._reply(400, {"error": f"Invalid query: {str(e)}"})
+            return
+        except Exception as e:
+            logger.error(f"Shard {self.index.shard} failed to answer a query: {str(e)}")
+            self._reply(500, {"error": str(e)})
+            return
+        finally:
+            # Each request runs on its own thread, with its own connection
+            connection.close()
+        self._reply(200, response)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def serve_shard(index, host, port):
+    """
+    Serve a loaded ShardIndex until interrupted.
+    """
+    handler = type("ShardRequestHandler", (_ShardRequestHandler,), {"index": index})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
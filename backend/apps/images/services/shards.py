@@ -0,0 +1,177 @@
+"""
+Scatter-gather similarity search over shard nodes.
+
+With SIMILARITY_SHARDS set, verify_image_similarity no longer scans the
+whole corpus itself. Each shard node (``manage.py run_similarity_shard``)
+keeps the ORB descriptors of one partition of the images in memory and
+answers queries over HTTP; query_shards sends the query to every shard in
+parallel and returns their answers for the caller to merge.
+
+Images are partitioned by SHA256 prefix: the first PREFIX_DIGITS hex digits
+of the hash, read as a number, are split into one even range per shard.
+Those are string ranges of the indexed sha256_hash column, so a shard loads
+its partition with a range query, and the coordinator can scan a partition
+itself when its shard does not answer in time.
+
+Protocol (JSON over HTTP):
+
+- POST /search with descriptors (base64 (n, 32) uint8 query descriptors),
+  decode (their decode policy), threshold, keep_top, shard and shards, and
+  optionally image (base64 query bytes); answered with shard, match
+  ([image_id, similarity] of the first candidate at the threshold, or
+  null), top (best [similarity, image_id] pairs), scanned and elapsed_ms.
+  A shard holding features extracted under another decode policy needs the
+  image to re-extract the query; asked without it, it answers with just
+  shard, shards and needs_image, and the coordinator sends the query again
+  with the image.
+- GET /health: the shard's partition and index size
+"""
+
+import base64
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from .config import SIMILARITY_SHARD_TIMEOUT_MS, SIMILARITY_SHARDS
+from .metrics import record_shard_request
+from .tracing import bind, span
+
+# Leading hex digits of the hash that decide its shard (65536 buckets)
+PREFIX_DIGITS = 4
+
+
+def shard_prefix_range(shard, shards):
+    """
+    Get the sha256_hash range owned by a shard.
+
+    Returns:
+        tuple: (lowest prefix, inclusive; end prefix, exclusive, or None for the last shard)
+    """
+    space = 16 ** PREFIX_DIGITS
+    low = shard * space // shards
+    high = (shard + 1) * space // shards
+    return f"{low:0{PREFIX_DIGITS}x}", f"{high:0{PREFIX_DIGITS}x}" if high < space else None
+
+
+def shard_filter(shard, shards):
+    """Image queryset filter selecting a shard's partition."""
+    low, high = shard_prefix_range(shard, shards)
+    lookup = {"sha256_hash__gte": low}
+    if high is not None:
+        lookup["sha256_hash__lt"] = high
+    return lookup
+
+
+def shard_of(sha256_hash, shards):
+    """Get the shard owning an image hash."""
+    return int(sha256_hash[:PREFIX_DIGITS], 16) * shards // 16 ** PREFIX_DIGITS
+
+
+class ShardAnswer:
+    """A shard's answer to a query; response is None when it failed or timed out."""
+
+    def __init__(self, shard, response=None, error=None):
+        self.shard = shard
+        self.response = response
+        self.error = error
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Requests to shards that missed their deadline may still occupy a thread
+            _executor = ThreadPoolExecutor(max_workers=4 * len(SIMILARITY_SHARDS), thread_name_prefix="shard-query")
+        return _executor
+
+
+def _post(url, body, timeout):
+    request = urllib.request.Request(
+        f"{url}/search", data=body, headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _query_shard(shard, url, body, timeout):
+    start_time = time.perf_counter()
+    with span("shard.search", shard=shard):
+        try:
+            response = _post(url, body, timeout)
+        except Exception as e:
+            record_shard_request(shard, "error", time.perf_counter() - start_time)
+            return ShardAnswer(shard, error=str(e))
+    if response.get("shard") != shard or response.get("shards") != len(SIMILARITY_SHARDS):
+        # A node started for another partition would silently hide images
+        record_shard_request(shard, "error")
+        return ShardAnswer(shard, error=f"answered as shard {response.get('shard')}/{response.get('shards')}")
+    record_shard_request(
+        shard, "needs_image" if response.get("needs_image") else "ok", time.perf_counter() - start_time
+    )
+    return ShardAnswer(shard, response=response)
+
+
+def _gather(query, shards, deadline):
+    """Send a query to some shards in parallel; returns their ShardAnswers in the same order."""
+    executor = _get_executor()
+    timeout = max(0.0, deadline - time.monotonic())
+    futures = [
+        executor.submit(
+            bind(_query_shard), shard, SIMILARITY_SHARDS[shard], json.dumps(dict(query, shard=shard)).encode(), timeout
+        )
+        for shard in shards
+    ]
+    wait(futures, timeout=timeout)
+    answers = []
+    for shard, future in zip(shards, futures):
+        if future.done():
+            answers.append(future.result())
+        else:
+            record_shard_request(shard, "timeout")
+            answers.append(ShardAnswer(shard, error=f"no answer within {SIMILARITY_SHARD_TIMEOUT_MS}ms"))
+    return answers
+
+
+def query_shards(file_bytes, query_descriptors, decode, threshold, keep_top=0):
+    """
+    Send a similarity query to every shard in parallel.
+
+    The query image is only sent to the shards that ask for it (see the
+    protocol above); both rounds share the deadline.
+
+    Args:
+        file_bytes: Bytes of the query image, for shards holding features
+                    extracted under another decode policy
+        query_descriptors: (n, 32) uint8 ORB descriptors of the query
+        decode: Decode policy the query descriptors were extracted under
+        threshold: ORB similarity at which a candidate counts as similar
+        keep_top: Number of best (similarity, image_id) pairs each shard returns
+
+    Returns:
+        list: One ShardAnswer per shard, in shard order. Shards that did not
+              answer within SIMILARITY_SHARD_TIMEOUT_MS have no response.
+    """
+    deadline = time.monotonic() + SIMILARITY_SHARD_TIMEOUT_MS / 1000
+    query = {
+        "descriptors": base64.b64encode(np.ascontiguousarray(query_descriptors, dtype=np.uint8).tobytes()).decode(),
+        "decode": decode,
+        "threshold": threshold,
+        "keep_top": keep_top,
+        "shards": len(SIMILARITY_SHARDS),
+    }
+
+    answers = _gather(query, list(range(len(SIMILARITY_SHARDS))), deadline)
+    retry = [answer.shard for answer in answers if answer.response is not None and answer.response.get("needs_image")]
+    if retry:
+        query["image"] = base64.b64encode(file_bytes).decode()
+        for answer in _gather(query, retry, deadline):
+            answers[answer.shard] = answer
+    return answers
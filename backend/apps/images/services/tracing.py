@@ -0,0 +1,392 @@
+"""
+Request-scoped tracing for uploads, detection, blockchain calls and storage.
+
+TracingMiddleware opens a trace for every request (run_upload_job does the
+same for queued jobs). Code below it opens child spans with ``span(name)``
+or the ``@traced(name)`` decorator; outside a trace both cost one context
+variable lookup. Spans are collected for every traced request, but a trace
+is only exported when:
+
+- it was sampled (TRACE_SAMPLE_RATE, or a sampled W3C ``traceparent``
+  header from the caller), or
+- it took at least TRACE_SLOW_MS, so slow requests are always captured.
+
+Exported traces are written by a background thread, either as one JSON
+object per line (TRACE_EXPORTER="jsonl") or to an OTLP/HTTP collector in
+the OTLP JSON encoding (TRACE_EXPORTER="otlp", e.g. the OpenTelemetry
+Collector or Jaeger on port 4318).
+"""
+
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.request
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .config import (
+    TRACE_EXPORTER,
+    TRACE_JSONL_PATH,
+    TRACE_OTLP_ENDPOINT,
+    TRACE_SAMPLE_RATE,
+    TRACE_SERVICE_NAME,
+    TRACE_SLOW_MS,
+    TRACING_ENABLED
+)
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("honour_current_span", default=None)
+
+# version-trace_id-parent_id-flags, see https://www.w3.org/TR/trace-context/
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Statements recorded as spans by the database execute wrapper
+DB_WRITE_VERBS = ("INSERT", "UPDATE", "DELETE")
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self, exc=None):
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.error = f"{type(exc).__name__}: {exc}"
+        self.trace.spans.append(self)
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Returned by span() outside a trace, so callers can set attributes unconditionally."""
+
+    def set_attribute(self, key, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """
+    The spans of one request or job.
+
+    Use as a context manager, or call activate/deactivate and finish
+    separately when the work outlives the block (streaming responses).
+    """
+
+    def __init__(self, name, traceparent=None, **attributes):
+        parent_id = None
+        sampled = random.random() < TRACE_SAMPLE_RATE
+        match = TRACEPARENT_PATTERN.match(traceparent or "")
+        if match:
+            # Join the caller's trace and honour its sampling decision
+            self.trace_id, parent_id = match.group(1), match.group(2)
+            sampled = sampled or bool(int(match.group(3), 16) & 1)
+        else:
+            self.trace_id = secrets.token_hex(16)
+        self.sampled = sampled
+        self.spans = []
+        self.root = Span(self, name, parent_id, attributes)
+        self._token = None
+
+    def activate(self):
+        self._token = _current_span.set(self.root)
+
+    def deactivate(self):
+        _current_span.reset(self._token)
+        self._token = None
+
+    def finish(self, exc=None):
+        """End the root span and export the trace if it was sampled or slow."""
+        self.root.finish(exc)
+        if self.sampled:
+            capture = "sampled"
+        elif TRACE_SLOW_MS and self.root.duration_ms >= TRACE_SLOW_MS:
+            capture = "slow"
+        else:
+            return
+        exporter = get_exporter()
+        if exporter is not None:
+            exporter.submit(self, capture)
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.deactivate()
+        self.finish(exc)
+        return False
+
+
+class _NoopTrace:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def start_trace(name, traceparent=None, **attributes):
+    """
+    Open a trace for a unit of work outside a request (e.g. an upload job).
+
+    Returns:
+        Context manager yielding the Trace, or None when tracing is disabled
+    """
+    if not TRACING_ENABLED:
+        return _NoopTrace()
+    return Trace(name, traceparent, **attributes)
+
+
+class _SpanScope:
+    __slots__ = ("name", "attributes", "_span", "_token")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self._span = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        self._span = Span(parent.trace, self.name, parent.span_id, self.attributes)
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            _current_span.reset(self._token)
+            self._span.finish(exc)
+        return False
+
+
+def span(name, **attributes):
+    """
+    Time a block as a child of the current span.
+
+    Returns:
+        Context manager yielding the Span (or a no-op span outside a trace)
+    """
+    return _SpanScope(name, attributes)
+
+
+def traced(name):
+    """Decorator running a function inside span(name)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return fn(*args, **kwargs)
+            with _SpanScope(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_trace_id():
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+
+def bind(fn):
+    """
+    Bind a function to the current context before handing it to another thread.
+
+    Executor threads do not inherit context variables, so without this the
+    spans they open would not belong to the submitting request's trace (nor
+    their stages to its memory profile).
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def _db_write_span(execute, sql, params, many, context):
+    if _current_span.get() is None:
+        return execute(sql, params, many, context)
+    verb = sql.lstrip()[:6].upper()
+    if verb not in DB_WRITE_VERBS:
+        return execute(sql, params, many, context)
+    with _SpanScope(f"db.{verb.lower()}", {"db.table": _statement_table(sql, verb), "db.many": many}):
+        return execute(sql, params, many, context)
+
+
+def _statement_table(sql, verb):
+    # INSERT INTO "t" / UPDATE "t" / DELETE FROM "t"
+    words = sql.split(None, 3)
+    table = words[2] if verb in ("INSERT", "DELETE") and len(words) > 2 else words[1] if len(words) > 1 else ""
+    return table.strip('"`')
+
+
+@receiver(connection_created)
+def _trace_connection(sender, connection, **kwargs):
+    if TRACING_ENABLED and _db_write_span not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_write_span)
+
+
+class JsonLinesExporter:
+    """Appends one JSON object per trace to a file ("{pid}" in the path is replaced per process)."""
+
+    def __init__(self, path):
+        self.path = path.replace("{pid}", str(os.getpid()))
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+    def export(self, traces):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for trace, capture in traces:
+                f.write(json.dumps({
+                    "trace_id": trace.trace_id,
+                    "name": trace.root.name,
+                    "capture": capture,
+                    "duration_ms": round(trace.root.duration_ms, 3),
+                    "spans": [s.to_dict() for s in trace.spans],
+                }, default=str) + "\n")
+
+
+class OtlpHttpExporter:
+    """Posts traces to an OTLP/HTTP collector using the OTLP JSON encoding."""
+
+    def __init__(self, endpoint, service_name, timeout=5):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def export(self, traces):
+        spans = []
+        for trace, capture in traces:
+            trace.root.set_attribute("trace.capture", capture)
+            spans.extend(self._span(trace, s) for s in trace.spans)
+        body = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [self._attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }]
+        }).encode()
+        request = urllib.request.Request(
+            self.endpoint, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def _span(self, trace, s):
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            # SERVER for the request itself, INTERNAL below it
+            "kind": 2 if s is trace.root else 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [self._attribute(k, v) for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            otlp_span["parentSpanId"] = s.parent_id
+        return otlp_span
+
+    @staticmethod
+    def _attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class BackgroundExporter:
+    """Exports finished traces from a daemon thread so requests never wait on I/O."""
+
+    def __init__(self, exporter, max_batch=64):
+        self.exporter = exporter
+        self.max_batch = max_batch
+        self.queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, trace, capture):
+        self.queue.put((trace, capture))
+
+    def stop(self):
+        """Export what is queued and stop the thread."""
+        self.queue.put(None)
+        self._thread.join(timeout=10)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.max_batch or self.queue.empty():
+                    break
+                item = self.queue.get()
+            if batch:
+                try:
+                    self.exporter.export(batch)
+                except Exception as e:
+                    logger.warning(f"Failed to export {len(batch)} traces: {str(e)}")
+            if item is None:
+                return
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    """Get the process-wide trace exporter, or None when tracing is disabled."""
+    global _exporter
+    if not TRACING_ENABLED:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            if TRACE_EXPORTER == "otlp":
+                exporter = OtlpHttpExporter(TRACE_OTLP_ENDPOINT, TRACE_SERVICE_NAME)
+            elif TRACE_EXPORTER == "jsonl":
+                exporter = JsonLinesExporter(TRACE_JSONL_PATH)
+            else:
+                raise ValueError(f"Unknown TRACE_EXPORTER: {TRACE_EXPORTER}")
+            _exporter = BackgroundExporter(exporter)
+        return _exporter
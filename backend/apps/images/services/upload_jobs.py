@@ -0,0 +1,353 @@
+"""
+Asynchronous upload jobs.
+
+An upload submitted in job mode is staged in storage and recorded as an
+UploadJob. A worker (an in-process thread pool, or the process_upload_jobs
+management command when UPLOAD_JOB_MODE is "external") then runs the
+detection pipeline and records each stage with its timing so clients can
+poll the job or follow it as a server-sent event stream.
+
+Workers of either kind take jobs with claim_next_job and hold a lease on
+the job while they run it, renewed every third of UPLOAD_JOB_LEASE_SECONDS.
+A job whose lease lapses (its worker died, or the process was restarted)
+is claimed again, up to UPLOAD_JOB_MAX_ATTEMPTS runs, and then failed. In
+thread mode a sweeper thread also picks up jobs still queued when the
+process restarted.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files import File
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.images.models import Image, UploadJob
+from apps.images.serializers import ImageSerializer
+from apps.images.upload_handlers import map_upload
+from .blockchain_service import store_image_on_blockchain
+from .config import (
+    UPLOAD_JOB_EVENTS_TIMEOUT,
+    UPLOAD_JOB_LEASE_SECONDS,
+    UPLOAD_JOB_MAX_ATTEMPTS,
+    UPLOAD_JOB_MODE,
+    UPLOAD_JOB_WORKERS
+)
+from .exceptions import SimilarImageError
+from .memory_profiler import memory_profile
+from .metrics import UPLOAD_SECONDS
+from .tracing import start_trace
+from .upload_pipeline import analyze_upload, save_upload, upload_stage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        # A forked server worker inherits the pool but none of its threads
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=UPLOAD_JOB_WORKERS, thread_name_prefix="upload-job")
+            _executor_pid = os.getpid()
+            threading.Thread(target=_sweep, name="upload-job-sweeper", daemon=True).start()
+        return _executor
+
+
+def _reset_after_fork():
+    # The lock may have been held by a thread that does not exist in the child
+    global _executor_lock
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def start_upload_job_workers():
+    """
+    Start the in-process workers in thread mode, so jobs left over from a
+    previous process are resumed without waiting for a new upload.
+
+    Called once per process at startup (see django_backend/wsgi.py and asgi.py).
+    Under a server that forks workers after loading the application, the
+    sweeper runs in the parent; each worker starts its own pool on its
+    first job.
+    """
+    if UPLOAD_JOB_MODE == "thread":
+        _get_executor()
+
+
+def _wake_worker():
+    _get_executor().submit(_run_in_worker_thread)
+
+
+def _sweep():
+    """Hand jobs that no worker is running to the pool, every half lease."""
+    while True:
+        try:
+            if claimable_jobs().exists():
+                _wake_worker()
+        except Exception as e:
+            logger.error(f"Failed to check for abandoned upload jobs: {str(e)}")
+        finally:
+            connection.close()
+        time.sleep(UPLOAD_JOB_LEASE_SECONDS / 2)
+
+
+def _marker_key(job_id):
+    return f"images:upload-job:{job_id}"
+
+
+def publish_job_update(job):
+    """Set a job's update marker after it was saved (see signals.py)."""
+    try:
+        cache.set(_marker_key(job.id), job.updated_at.isoformat(), UPLOAD_JOB_EVENTS_TIMEOUT)
+    except Exception as e:
+        # Followers fall back to reading the job periodically
+        logger.warning(f"Failed to publish an update of upload job {job.id}: {str(e)}")
+
+
+def job_update_marker(job_id):
+    """Get a job's update marker; it changes whenever the job is saved."""
+    try:
+        return cache.get(_marker_key(job_id))
+    except Exception:
+        return None
+
+
+def create_upload_job(user, uploaded_file):
+    """
+    Stage an upload and queue it for processing.
+
+    Args:
+        user: Uploading user
+        uploaded_file: Django UploadedFile carrying ``sha256_hash``
+
+    Returns:
+        UploadJob: The queued job
+    """
+    job = UploadJob(
+        uploader=user,
+        file_name=uploaded_file.name,
+        sha256_hash=uploaded_file.sha256_hash,
+    )
+    ext = uploaded_file.name.split('.')[-1] if '.' in uploaded_file.name else 'jpg'
+    job.file.save(f"{job.id}.{ext}", uploaded_file, save=False)
+    job.save()
+
+    if UPLOAD_JOB_MODE == "thread":
+        # Only wake a worker once the row is visible to other connections
+        transaction.on_commit(_wake_worker)
+
+    logger.info(f"Queued upload job {job.id} for hash {job.sha256_hash[:10]}...")
+    return job
+
+
+def _run_in_worker_thread():
+    """Run jobs until none is left to claim."""
+    try:
+        while True:
+            job = claim_next_job()
+            if job is None:
+                return
+            try:
+                run_upload_job(job.id)
+            except Exception as e:
+                logger.error(f"Upload job {job.id} crashed: {str(e)}")
+    except Exception as e:
+        logger.error(f"Failed to claim an upload job: {str(e)}")
+    finally:
+        # Worker threads open their own database connections
+        connections.close_all()
+
+
+def claimable_jobs():
+    """Queued jobs, and running jobs whose worker stopped renewing the lease."""
+    return UploadJob.objects.filter(
+        Q(status=UploadJob.STATUS_QUEUED)
+        | Q(status=UploadJob.STATUS_RUNNING, lease_expires_at__lt=timezone.now())
+        | Q(status=UploadJob.STATUS_RUNNING, lease_expires_at__isnull=True)
+    )
+
+
+def _lease_deadline():
+    return timezone.now() + timedelta(seconds=UPLOAD_JOB_LEASE_SECONDS)
+
+
+def claim_next_job():
+    """
+    Atomically claim the oldest job no worker is running.
+
+    Jobs abandoned UPLOAD_JOB_MAX_ATTEMPTS times are failed instead of
+    claimed again.
+
+    Returns:
+        UploadJob or None: The claimed job, now marked running under a fresh lease
+    """
+    while True:
+        with transaction.atomic():
+            job = (
+                claimable_jobs().select_for_update(skip_locked=True)
+                .order_by("created_at")
+                .first()
+            )
+            if job is None:
+                return None
+            if job.attempts >= UPLOAD_JOB_MAX_ATTEMPTS:
+                logger.error(f"Upload job {job.id} abandoned by {job.attempts} workers, giving up")
+                job.status = UploadJob.STATUS_FAILED
+                job.stage = None
+                job.error = f"Processing was interrupted {job.attempts} times"
+                job.lease_expires_at = None
+                job.file.delete(save=False)
+                job.save()
+                continue
+            if job.status == UploadJob.STATUS_RUNNING:
+                logger.warning(f"Taking over upload job {job.id} from a worker that stopped")
+            job.status = UploadJob.STATUS_RUNNING
+            job.attempts += 1
+            job.lease_expires_at = _lease_deadline()
+            job.save(update_fields=["status", "attempts", "lease_expires_at", "updated_at"])
+            return job
+
+
+@contextmanager
+def _lease_heartbeat(job_id):
+    """Keep renewing a job's lease while the block runs."""
+    stopped = threading.Event()
+
+    def renew():
+        try:
+            while not stopped.wait(UPLOAD_JOB_LEASE_SECONDS / 3):
+                UploadJob.objects.filter(pk=job_id, status=UploadJob.STATUS_RUNNING).update(
+                    lease_expires_at=_lease_deadline()
+                )
+        except Exception as e:
+            logger.error(f"Failed to renew the lease of upload job {job_id}: {str(e)}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=renew, name=f"upload-job-lease-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+class _StageTracker:
+    """Records stage start/finish times on a job as the pipeline progresses."""
+
+    def __init__(self, job):
+        self.job = job
+
+    @contextmanager
+    def __call__(self, name):
+        entry = {
+            "name": name,
+            "status": "running",
+            "started_at": timezone.now().isoformat(),
+            "elapsed_ms": None,
+        }
+        self.job.stage = name
+        self.job.stages = [s for s in self.job.stages if s["name"] != name] + [entry]
+        self.job.save(update_fields=["stage", "stages", "updated_at"])
+
+        start_time = time.time()
+        try:
+            yield
+        except SimilarImageError:
+            entry["status"] = "rejected"
+            raise
+        except Exception:
+            entry["status"] = "failed"
+            raise
+        else:
+            entry["status"] = "done"
+        finally:
+            entry["elapsed_ms"] = round((time.time() - start_time) * 1000, 1)
+            self.job.save(update_fields=["stages", "updated_at"])
+
+
+def run_upload_job(job_id):
+    """
+    Run the detection pipeline for a job and record the outcome.
+
+    Args:
+        job_id: UUID of a job claimed with claim_next_job
+    """
+    close_old_connections()
+    with start_trace("upload_job", **{"job.id": str(job_id)}), memory_profile("upload_job", job_id=str(job_id)):
+        with _lease_heartbeat(job_id):
+            _run_upload_job(job_id)
+
+
+def _run_upload_job(job_id):
+    job = UploadJob.objects.select_related("uploader").get(pk=job_id)
+    if job.status in UploadJob.TERMINAL_STATUSES:
+        return
+
+    track_stage = _StageTracker(job)
+    logger.info(f"Processing upload job {job.id}")
+
+    start_time = time.perf_counter()
+    try:
+        # A worker that died after storing the image leaves nothing to redo
+        img = Image.objects.filter(sha256_hash=job.sha256_hash, uploader=job.uploader).first() if job.attempts > 1 else None
+        if img is None:
+            img = _process_upload_job(job, track_stage)
+        job.status = UploadJob.STATUS_COMPLETED
+        job.image = img
+        job.result = {"image": ImageSerializer(img).data}
+    except SimilarImageError as e:
+        job.status = UploadJob.STATUS_REJECTED
+        job.result = {
+            "error": e.message,
+            "image_id": e.image_id,
+            "stage": e.stage,
+            "duplicate_type": e.duplicate_type,
+            "similarity": e.similarity
+        }
+    except Exception as e:
+        logger.error(f"Upload job {job.id} failed: {str(e)}")
+        job.status = UploadJob.STATUS_FAILED
+        job.error = str(e)
+
+    job.stage = None
+    job.lease_expires_at = None
+    job.file.delete(save=False)
+    job.save()
+    UPLOAD_SECONDS.labels(mode="job").observe(time.perf_counter() - start_time)
+    logger.info(f"Upload job {job.id} finished with status {job.status}")
+
+
+def _process_upload_job(job, track_stage):
+    with map_upload(job.file) as file_bytes:
+        analysis = analyze_upload(file_bytes, job.sha256_hash, track_stage=track_stage)
+
+    with track_stage("chain"), upload_stage("chain"):
+        try:
+            blockchain_tx = store_image_on_blockchain(
+                job.sha256_hash,
+                analysis["deepfake_label"],
+                analysis["deepfake_confidence"],
+            )
+        except Exception as e:
+            logger.error(f"Failed to store on blockchain: {str(e)}")
+            blockchain_tx = None
+
+    with track_stage("stored"):
+        with job.file.open("rb"):
+            staged_file = File(job.file.file, name=job.file_name)
+            return save_upload(job.uploader, staged_file, analysis, blockchain_tx)
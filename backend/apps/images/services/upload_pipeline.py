@@ -0,0 +1,287 @@
+"""
+Shared upload pipeline used by the single, batch and job-based upload paths.
+
+The pipeline is split into two halves so that callers can anchor several
+images on the blockchain between them:
+
+1. analyze_upload: duplicate check, similarity verification, ORB feature
+   extraction, deepfake detection and embedding capture (no database writes)
+2. save_upload: create the Image row, store the file and record the audit log
+
+analyze_upload_async is the counterpart of analyze_upload for the ASGI
+upload view: stages are awaited on bounded thread pools (run_stage) so the
+event loop keeps serving other requests meanwhile.
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from django.db import close_old_connections
+
+from apps.images.models import Image, AuditLog
+from .config import ASYNC_UPLOAD_IO_WORKERS, ASYNC_UPLOAD_STAGE_WORKERS
+from .detection_service import get_sha256, deepfake_check, verify_image_similarity
+from .embedding_index import embedding_to_bytes, get_embedding_index
+from .exceptions import SimilarImageError
+from .memory_profiler import memory_stage
+from .metrics import observe_stage, record_deepfake_prediction, record_duplicate, record_outcome
+from .tracing import bind, span
+
+logger = logging.getLogger(__name__)
+
+# Thread pools of the async upload path: "stage" runs detection stages, "io"
+# blockchain, database and storage calls, so slow RPCs cannot starve detection
+_ASYNC_POOL_SIZES = {"stage": ASYNC_UPLOAD_STAGE_WORKERS, "io": ASYNC_UPLOAD_IO_WORKERS}
+_async_pools = {}
+_async_pools_lock = threading.Lock()
+
+
+def _untracked_stage(name):
+    return nullcontext()
+
+
+@contextmanager
+def upload_stage(name):
+    """Record an upload stage in the stage latency histogram, the current trace and memory profile."""
+    with observe_stage(name), span(f"upload.{name}"), memory_stage(name):
+        yield
+
+
+def _timed_stages(track_stage):
+    """Wrap a stage tracker so every stage is also recorded by upload_stage."""
+    @contextmanager
+    def stage(name):
+        with upload_stage(name), track_stage(name):
+            yield
+    return stage
+
+
+def analyze_upload(file_bytes, sha256_hash=None, track_stage=None):
+    """
+    Run the detection stages for an uploaded image.
+
+    Args:
+        file_bytes: Bytes or memory-mapped buffer of the image file
+        sha256_hash: SHA256 hash of the image, computed if omitted
+        track_stage: Optional callable returning a context manager for a stage
+                     name ("hash", "similarity", "deepfake"), used for progress reporting.
+                     The deepfake stage runs before similarity when the embedding
+                     index is in use, since its embedding feeds candidate retrieval
+
+    Returns:
+        dict: sha256_hash, orb_features, deepfake_label, deepfake_confidence,
+              deepfake_model_version and embedding
+
+    Raises:
+        SimilarImageError: If an exact duplicate or similar image already exists
+    """
+    track_stage = _timed_stages(track_stage or _untracked_stage)
+    try:
+        return _analyze(file_bytes, sha256_hash, track_stage)
+    except SimilarImageError as e:
+        record_duplicate(e.duplicate_type)
+        raise
+
+
+def _analyze(file_bytes, sha256_hash, track_stage):
+    with track_stage("hash"):
+        sha256_hash = _hash_stage(file_bytes, sha256_hash)
+
+    deepfake_result = None
+    if get_embedding_index() is not None:
+        # The embedding from the deepfake pass is a candidate source for the similarity stage
+        with track_stage("deepfake"):
+            deepfake_result = deepfake_check(file_bytes)
+
+    with track_stage("similarity"):
+        orb_features = _similarity_stage(
+            file_bytes, sha256_hash, deepfake_result.get("embedding") if deepfake_result else None
+        )
+
+    if deepfake_result is None:
+        with track_stage("deepfake"):
+            deepfake_result = deepfake_check(file_bytes)
+    return _analysis(sha256_hash, orb_features, deepfake_result)
+
+
+def _hash_stage(file_bytes, sha256_hash):
+    sha256_hash = sha256_hash or get_sha256(file_bytes)
+    exact_match_id = Image.objects.filter(sha256_hash=sha256_hash).values_list("id", flat=True).first()
+    if exact_match_id is not None:
+        raise SimilarImageError(
+            message="Exact duplicate image found",
+            image_id=exact_match_id,
+            duplicate_type="exact",
+            similarity=1.0,
+            stage="sha256"
+        )
+    return sha256_hash
+
+
+def _similarity_stage(file_bytes, sha256_hash, query_embedding=None):
+    # _hash_stage already ruled out an exact duplicate
+    return verify_image_similarity(
+        file_bytes, sha256_hash=sha256_hash, query_embedding=query_embedding, check_exact=False
+    )
+
+
+def _analysis(sha256_hash, orb_features, deepfake_result):
+    record_deepfake_prediction(deepfake_result["label"])
+    return {
+        "sha256_hash": sha256_hash,
+        "orb_features": orb_features,
+        "deepfake_label": deepfake_result["label"],
+        "deepfake_confidence": deepfake_result["confidence"],
+        "deepfake_model_version": deepfake_result.get("model_version"),
+        "embedding": deepfake_result.get("embedding"),
+    }
+
+
+def _get_async_pool(pool):
+    with _async_pools_lock:
+        if pool not in _async_pools:
+            _async_pools[pool] = ThreadPoolExecutor(
+                max_workers=max(1, _ASYNC_POOL_SIZES[pool]), thread_name_prefix=f"async-upload-{pool}"
+            )
+        return _async_pools[pool]
+
+
+def _call_blocking(fn, args):
+    # Pool threads outlive requests, so drop connections that are past their age like job workers do
+    close_old_connections()
+    return fn(*args)
+
+
+async def run_blocking(fn, *args, pool="io"):
+    """
+    Await a blocking call on one of the async upload path's bounded thread pools.
+
+    Args:
+        fn: Blocking function
+        *args: Arguments for fn
+        pool: "io" for blockchain, database and storage calls, "stage" for detection
+
+    Returns:
+        The result of fn
+    """
+    loop = asyncio.get_running_loop()
+    # bind carries the request's trace and memory profile into the pool thread
+    return await loop.run_in_executor(_get_async_pool(pool), bind(functools.partial(_call_blocking, fn, args)))
+
+
+def _in_stage(name, fn):
+    @functools.wraps(fn)
+    def wrapper(*args):
+        with upload_stage(name):
+            return fn(*args)
+    return wrapper
+
+
+async def run_stage(name, fn, *args, pool="stage"):
+    """Await a blocking call recorded as an upload stage (see upload_stage)."""
+    return await run_blocking(_in_stage(name, fn), *args, pool=pool)
+
+
+async def analyze_upload_async(file_bytes, sha256_hash=None):
+    """
+    Run the detection stages for an uploaded image without blocking the event loop.
+
+    Same stages and result as analyze_upload. Without an embedding index the
+    similarity and deepfake stages do not depend on each other and run
+    concurrently.
+
+    Args:
+        file_bytes: Bytes or memory-mapped buffer of the image file
+        sha256_hash: SHA256 hash of the image, computed if omitted
+
+    Returns:
+        dict: See analyze_upload
+
+    Raises:
+        SimilarImageError: If an exact duplicate or similar image already exists
+    """
+    try:
+        return await _analyze_async(file_bytes, sha256_hash)
+    except SimilarImageError as e:
+        record_duplicate(e.duplicate_type)
+        raise
+
+
+async def _analyze_async(file_bytes, sha256_hash):
+    sha256_hash = await run_stage("hash", _hash_stage, file_bytes, sha256_hash)
+
+    if get_embedding_index() is not None:
+        deepfake_result = await run_stage("deepfake", deepfake_check, file_bytes)
+        orb_features = await run_stage(
+            "similarity", _similarity_stage, file_bytes, sha256_hash, deepfake_result.get("embedding")
+        )
+        return _analysis(sha256_hash, orb_features, deepfake_result)
+
+    # Both stages are awaited even when similarity finds a duplicate: a pool
+    # thread cannot be cancelled, and both read the caller's upload buffer
+    orb_features, deepfake_result = await asyncio.gather(
+        run_stage("similarity", _similarity_stage, file_bytes, sha256_hash),
+        run_stage("deepfake", deepfake_check, file_bytes),
+        return_exceptions=True
+    )
+    for result in (orb_features, deepfake_result):
+        if isinstance(result, BaseException):
+            raise result
+    return _analysis(sha256_hash, orb_features, deepfake_result)
+
+
+def save_upload(user, uploaded_file, analysis, blockchain_tx):
+    """
+    Persist an analyzed upload.
+
+    Args:
+        user: Uploading user
+        uploaded_file: Django File with the image contents
+        analysis: Result of analyze_upload
+        blockchain_tx: Transaction hash, "IMAGE_EXISTS" or None
+
+    Returns:
+        Image: The created image
+    """
+    with upload_stage("store"):
+        img = _store(user, uploaded_file, analysis, blockchain_tx)
+    record_outcome("created")
+    return img
+
+
+def _store(user, uploaded_file, analysis, blockchain_tx):
+    sha256_hash = analysis["sha256_hash"]
+
+    img = Image.objects.create(
+        sha256_hash=sha256_hash,
+        orb_features=analysis["orb_features"],
+
+        blockchain_tx=blockchain_tx,
+        deepfake_label=analysis["deepfake_label"],
+        deepfake_confidence=analysis["deepfake_confidence"],
+        deepfake_model_version=analysis.get("deepfake_model_version"),
+        embedding=embedding_to_bytes(analysis["embedding"]) if analysis.get("embedding") is not None else None,
+        uploader=user
+    )
+
+    # 从原始文件获取文件扩展名
+    file_name = uploaded_file.name or ""
+    ext = file_name.split('.')[-1] if '.' in file_name else 'jpg'
+    # Stream the spooled upload into storage instead of copying it into memory
+    with span("storage.save", **{"storage.backend": type(img.image_file.storage).__name__}):
+        img.image_file.save(f"{sha256_hash}.{ext}", uploaded_file, save=False)
+    img.save()
+
+    # Record upload log
+    AuditLog.objects.create(
+        user=user,
+        action="upload",
+        image=img,
+        detail=f"User {user.username} uploaded image with hash={img.sha256_hash}"
+    )
+
+    return img
@@ -0,0 +1,69 @@
+"""
+Keep in-process similarity indexes and the shared descriptor store up to
+date as images are added and removed, and tell followers of upload jobs
+when a job changes.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Image, UploadJob
+from .services.bovw_index import descriptors_from_features, get_bovw_index
+from .services.descriptor_store import remove_image_features, store_image_features
+from .services.embedding_index import embedding_from_bytes, get_embedding_index
+from .services.upload_jobs import publish_job_update
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Image)
+def index_saved_image(sender, instance, created, update_fields=None, **kwargs):
+    # Only update indexes this process has already loaded; others catch up by id
+    if created or (update_fields is not None and "orb_features" in update_fields):
+        index = get_bovw_index(load=False)
+        if index is not None and instance.orb_features:
+            try:
+                index.add(instance.id, descriptors_from_features(instance.orb_features))
+            except Exception as e:
+                logger.error(f"Failed to add image {instance.id} to the BoVW index: {str(e)}")
+        if instance.orb_features:
+            # Other workers read the store, so only committed images go in
+            image_id, features = instance.id, instance.orb_features
+            transaction.on_commit(lambda: _store_features(image_id, features))
+
+    if created or (update_fields is not None and "embedding" in update_fields):
+        index = get_embedding_index(load=False)
+        if index is not None and instance.embedding and instance.deepfake_model_version == index.model_version:
+            index.add(instance.id, embedding_from_bytes(instance.embedding))
+
+
+@receiver(post_delete, sender=Image)
+def unindex_deleted_image(sender, instance, **kwargs):
+    for index in (get_bovw_index(load=False), get_embedding_index(load=False)):
+        if index is not None:
+            index.remove(instance.id)
+    image_id = instance.id
+    transaction.on_commit(lambda: _remove_features(image_id))
+
+
+@receiver(post_save, sender=UploadJob)
+def publish_upload_job(sender, instance, **kwargs):
+    publish_job_update(instance)
+
+
+def _store_features(image_id, features):
+    try:
+        store_image_features(image_id, features)
+    except Exception as e:
+        # New images are still caught up by sync(), replaced features are not
+        logger.error(f"Failed to add image {image_id} to the descriptor store: {str(e)}")
+
+
+def _remove_features(image_id):
+    try:
+        remove_image_features(image_id)
+    except Exception as e:
+        logger.error(f"Failed to remove image {image_id} from the descriptor store: {str(e)}")
@@ -0,0 +1,219 @@
+import asyncio
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from apps.images.services.admission import AdmissionController
+from apps.images.services.exceptions import AdmissionRejected
+
+
+def make_controller(max_concurrency=1, queue_size=10, user_queue_size=10, max_wait=5.0):
+    return AdmissionController("test", max_concurrency, queue_size, user_queue_size, max_wait)
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not reached in time")
+        time.sleep(0.005)
+
+
+async def queue_in_order(controller, requests, admitted):
+    """Start one waiting task per (user_key, weight, name), each queued before the next starts."""
+    tasks = []
+    for user_key, weight, name in requests:
+        async def run(user_key=user_key, weight=weight, name=name):
+            with await controller.acquire_async(user_key, weight):
+                admitted.append(name)
+
+        tasks.append(asyncio.create_task(run()))
+        queued = controller.stats()["queued"]
+        while controller.stats()["queued"] == queued:
+            await asyncio.sleep(0)
+    return tasks
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def test_admits_up_to_max_concurrency(self):
+        controller = make_controller(max_concurrency=2)
+        first = controller.acquire("a")
+        second = controller.acquire("b")
+        self.assertEqual(controller.stats()["in_flight"], 2)
+
+        first.release()
+        second.release()
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+    def test_release_is_idempotent(self):
+        controller = make_controller()
+        admission = controller.acquire("a")
+        admission.release()
+        admission.release()
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+    def test_release_hands_the_slot_to_the_waiter(self):
+        controller = make_controller()
+        holder = controller.acquire("a")
+        granted = threading.Event()
+        done = threading.Event()
+
+        def wait_for_slot():
+            with controller.acquire("b"):
+                granted.set()
+                done.wait(5)
+
+        thread = threading.Thread(target=wait_for_slot)
+        thread.start()
+        wait_until(lambda: controller.stats()["queued"] == 1)
+
+        holder.release()
+        self.assertTrue(granted.wait(5))
+        stats = controller.stats()
+        self.assertEqual((stats["in_flight"], stats["queued"]), (1, 0))
+
+        # The slot passed straight on, so a new arrival cannot take it
+        controller.max_wait = 0.01
+        with self.assertRaises(AdmissionRejected) as cm:
+            controller.acquire("c")
+        self.assertEqual(cm.exception.reason, "timeout")
+
+        done.set()
+        thread.join()
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+    def test_rejects_when_queue_full(self):
+        controller = make_controller(queue_size=1)
+
+        async def scenario():
+            holder = await controller.acquire_async("a")
+            waiting = asyncio.create_task(controller.acquire_async("b"))
+            while not controller.stats()["queued"]:
+                await asyncio.sleep(0)
+            with self.assertRaises(AdmissionRejected) as cm:
+                await controller.acquire_async("c")
+            holder.release()
+            (await waiting).release()
+            return cm.exception
+
+        rejection = asyncio.run(scenario())
+        self.assertEqual(rejection.reason, "queue_full")
+        self.assertGreaterEqual(rejection.retry_after, 1)
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+    def test_rejects_when_user_queue_full(self):
+        controller = make_controller(user_queue_size=1)
+
+        async def scenario():
+            holder = await controller.acquire_async("a")
+            waiting = asyncio.create_task(controller.acquire_async("b"))
+            while not controller.stats()["queued"]:
+                await asyncio.sleep(0)
+            with self.assertRaises(AdmissionRejected) as cm:
+                await controller.acquire_async("b")
+            # Another user still gets a place in the queue
+            other = asyncio.create_task(controller.acquire_async("c"))
+            while controller.stats()["queued"] < 2:
+                await asyncio.sleep(0)
+            holder.release()
+            (await waiting).release()
+            (await other).release()
+            return cm.exception
+
+        self.assertEqual(asyncio.run(scenario()).reason, "user_queue_full")
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+    def test_timed_out_waiter_is_withdrawn(self):
+        controller = make_controller(max_wait=0.05)
+        holder = controller.acquire("a")
+
+        with self.assertRaises(AdmissionRejected) as cm:
+            controller.acquire("b")
+        self.assertEqual(cm.exception.reason, "timeout")
+        self.assertEqual(controller.stats()["queued"], 0)
+
+        # The withdrawn waiter is skipped, so the slot is freed
+        holder.release()
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+    def test_async_timed_out_waiter_is_withdrawn(self):
+        controller = make_controller(max_wait=0.05)
+
+        async def scenario():
+            holder = await controller.acquire_async("a")
+            with self.assertRaises(AdmissionRejected) as cm:
+                await controller.acquire_async("b")
+            self.assertEqual(controller.stats()["queued"], 0)
+            holder.release()
+            return cm.exception
+
+        self.assertEqual(asyncio.run(scenario()).reason, "timeout")
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+    def test_cancelled_waiter_is_withdrawn(self):
+        controller = make_controller()
+
+        async def scenario():
+            holder = await controller.acquire_async("a")
+            waiting = asyncio.create_task(controller.acquire_async("b"))
+            while not controller.stats()["queued"]:
+                await asyncio.sleep(0)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual(controller.stats()["queued"], 0)
+            holder.release()
+
+        asyncio.run(scenario())
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+    def test_waiter_cancelled_as_it_is_granted_does_not_leak_the_slot(self):
+        controller = make_controller()
+
+        async def scenario():
+            holder = await controller.acquire_async("a")
+            waiting = asyncio.create_task(controller.acquire_async("b"))
+            while not controller.stats()["queued"]:
+                await asyncio.sleep(0)
+            holder.release()
+            waiting.cancel()
+            try:
+                (await waiting).release()
+            except asyncio.CancelledError:
+                pass
+
+        asyncio.run(scenario())
+        stats = controller.stats()
+        self.assertEqual((stats["in_flight"], stats["queued"]), (0, 0))
+
+    def test_burst_does_not_starve_other_users(self):
+        controller = make_controller()
+        admitted = []
+
+        async def scenario():
+            holder = await controller.acquire_async("x")
+            tasks = await queue_in_order(controller, [
+                ("a", 1.0, "a1"), ("a", 1.0, "a2"), ("a", 1.0, "a3"), ("b", 1.0, "b1"),
+            ], admitted)
+            holder.release()
+            await asyncio.gather(*tasks)
+
+        asyncio.run(scenario())
+        self.assertEqual(admitted, ["a1", "b1", "a2", "a3"])
+
+    def test_weight_gives_proportionally_more_slots(self):
+        controller = make_controller()
+        admitted = []
+
+        async def scenario():
+            holder = await controller.acquire_async("x")
+            tasks = await queue_in_order(controller, [
+                ("a", 1.0, "a1"), ("a", 1.0, "a2"), ("a", 1.0, "a3"),
+                ("staff", 2.0, "s1"), ("staff", 2.0, "s2"), ("staff", 2.0, "s3"),
+            ], admitted)
+            holder.release()
+            await asyncio.gather(*tasks)
+
+        asyncio.run(scenario())
+        self.assertEqual(admitted, ["a1", "s1", "s2", "a2", "s3", "a3"])
@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from apps.images.services import descriptor_store
+from apps.images.services.cpu_pool import decode_policy
+from apps.images.services.descriptor_store import DescriptorStore
+
+FULL = decode_policy(0)
+NORMALIZED = decode_policy(1024)
+
+
+def descriptors(rows, seed):
+    return np.random.default_rng(seed).integers(0, 256, size=(rows, 32), dtype=np.uint8)
+
+
+class DescriptorStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = DescriptorStore(self.directory)
+
+    def assertStored(self, store, image_id, expected, policy):
+        entry = store.get(image_id)
+        self.assertIsNotNone(entry)
+        np.testing.assert_array_equal(entry.descriptors, expected)
+        self.assertEqual(entry.decode, policy)
+
+    def test_append_and_get(self):
+        first, second = descriptors(3, 1), descriptors(5, 2)
+        self.store.append([(1, first, FULL), (2, second, NORMALIZED)])
+
+        self.assertEqual(len(self.store), 2)
+        self.assertStored(self.store, 1, first, FULL)
+        self.assertStored(self.store, 2, second, NORMALIZED)
+        self.assertIsNone(self.store.get(3))
+        self.assertEqual(self.store.stats()["rows"], 8)
+        self.assertEqual(self.store.high_water, 2)
+
+    def test_image_without_descriptors_advances_high_water_only(self):
+        self.store.append([(1, descriptors(2, 1), FULL), (4, None, FULL)])
+
+        self.assertIn(4, self.store)
+        self.assertEqual(self.store.high_water, 4)
+        self.assertEqual([entry.id for entry in self.store.entries()], [1])
+
+    def test_append_replaces_earlier_entry(self):
+        self.store.append([(1, descriptors(3, 1), FULL)])
+        replacement = descriptors(2, 2)
+        self.store.append([(1, replacement, NORMALIZED)])
+
+        self.assertEqual(len(self.store), 1)
+        self.assertStored(self.store, 1, replacement, NORMALIZED)
+        self.assertEqual(self.store.stats()["dead_rows"], 3)
+
+    def test_entries_in_id_order(self):
+        self.store.append([(5, descriptors(1, 5), FULL), (2, descriptors(1, 2), FULL)])
+        self.store.append([(3, descriptors(1, 3), FULL)])
+
+        self.assertEqual([entry.id for entry in self.store.entries()], [2, 3, 5])
+
+    def test_remove_tombstones_image(self):
+        kept = descriptors(2, 2)
+        self.store.append([(1, descriptors(3, 1), FULL), (2, kept, FULL)])
+        self.store.remove(1)
+
+        self.assertNotIn(1, self.store)
+        self.assertIsNone(self.store.get(1))
+        self.assertStored(self.store, 2, kept, FULL)
+        self.assertEqual(self.store.stats()["dead_rows"], 3)
+
+    def test_remove_keeps_high_water(self):
+        self.store.append([(1, descriptors(1, 1), FULL), (2, descriptors(1, 2), FULL)])
+        self.store.remove(2)
+
+        # Otherwise sync would append the removed image again
+        self.assertEqual(self.store.high_water, 2)
+
+    def test_remove_unknown_image_is_a_no_op(self):
+        self.store.append([(1, descriptors(1, 1), FULL)])
+        self.store.remove(7)
+
+        self.assertEqual(self.store.stats()["dead_rows"], 0)
+
+    def test_compact_keeps_live_rows_only(self):
+        live = descriptors(2, 2)
+        self.store.append([(1, descriptors(3, 1), FULL), (2, live, NORMALIZED)])
+        self.store.remove(1)
+        generation = self.store.generation
+
+        self.store.compact()
+
+        self.assertEqual(self.store.generation, generation + 1)
+        self.assertEqual(self.store.stats()["rows"], 2)
+        self.assertEqual(self.store.stats()["dead_rows"], 0)
+        self.assertStored(self.store, 2, live, NORMALIZED)
+        self.assertFalse(os.path.exists(self.store._descriptors_path(generation)))
+        self.assertFalse(os.path.exists(self.store._entries_path(generation)))
+
+    def test_remove_compacts_past_the_dead_row_ratio(self):
+        self.store.append([(1, descriptors(3, 1), FULL), (2, descriptors(1, 2), FULL)])
+        generation = self.store.generation
+
+        with mock.patch.object(descriptor_store, "COMPACT_MIN_DEAD_ROWS", 0), \
+                mock.patch.object(descriptor_store, "DESCRIPTOR_STORE_COMPACT_RATIO", 0.5):
+            self.store.remove(1)
+
+        self.assertEqual(self.store.generation, generation + 1)
+        self.assertEqual(self.store.stats()["rows"], 1)
+
+    def test_rebuild_replaces_contents(self):
+        self.store.append([(1, descriptors(3, 1), FULL)])
+        rebuilt = descriptors(4, 2)
+        self.store.rebuild([(2, rebuilt, FULL)])
+
+        self.assertNotIn(1, self.store)
+        self.assertStored(self.store, 2, rebuilt, FULL)
+        self.assertEqual(self.store.stats()["rows"], 4)
+
+    def test_reader_picks_up_appends_on_refresh(self):
+        reader = DescriptorStore(self.directory)
+        added = descriptors(3, 1)
+        self.store.append([(1, added, FULL)])
+        self.assertNotIn(1, reader)
+
+        reader.refresh()
+        self.assertStored(reader, 1, added, FULL)
+
+        self.store.remove(1)
+        reader.refresh()
+        self.assertNotIn(1, reader)
+
+    def test_reader_switches_generation_after_compaction(self):
+        first, second = descriptors(3, 1), descriptors(2, 2)
+        self.store.append([(1, first, FULL), (2, second, FULL)])
+        reader = DescriptorStore(self.directory)
+        reader.refresh()
+        before = reader.get(1)
+
+        self.store.remove(2)
+        self.store.compact()
+        # The reader's existing mapping stays readable until it refreshes
+        np.testing.assert_array_equal(before.descriptors, first)
+        self.assertIn(2, reader)
+
+        reader.refresh()
+        self.assertEqual(reader.generation, self.store.generation)
+        self.assertNotIn(2, reader)
+        self.assertStored(reader, 1, first, FULL)
+
+        # Appends after the switch land in the new generation
+        third = descriptors(1, 3)
+        self.store.append([(3, third, FULL)])
+        reader.refresh()
+        self.assertStored(reader, 3, third, FULL)
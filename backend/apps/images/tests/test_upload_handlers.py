@@ -0,0 +1,72 @@
+import mmap
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.db.models import FileField
+from django.db.models.fields.files import FieldFile
+from django.test import SimpleTestCase
+
+from apps.images.upload_handlers import map_upload
+
+CONTENT = b"\xff\xd8\xff\xe0 image bytes"
+
+
+class RemoteStorage(Storage):
+    """Storage without local paths, like an object store."""
+
+    def __init__(self, content):
+        self.content = content
+
+    def _open(self, name, mode="rb"):
+        return ContentFile(self.content, name=name)
+
+    def exists(self, name):
+        return True
+
+
+def stored_file(storage, name):
+    return FieldFile(None, FileField(storage=storage), name)
+
+
+class MapUploadTests(SimpleTestCase):
+    def test_spooled_upload_is_mapped(self):
+        uploaded = TemporaryUploadedFile("a.jpg", "image/jpeg", len(CONTENT), None)
+        self.addCleanup(uploaded.close)
+        uploaded.write(CONTENT)
+        uploaded.flush()
+
+        with map_upload(uploaded) as buffer:
+            self.assertIsInstance(buffer, mmap.mmap)
+            self.assertEqual(buffer[:], CONTENT)
+
+    def test_stored_file_on_local_storage_is_mapped(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage = FileSystemStorage(location=directory)
+        name = storage.save("upload_jobs/a.jpg", ContentFile(CONTENT))
+
+        with map_upload(stored_file(storage, name)) as buffer:
+            self.assertIsInstance(buffer, mmap.mmap)
+            self.assertEqual(buffer[:], CONTENT)
+
+    def test_stored_file_on_remote_storage_is_read(self):
+        with map_upload(stored_file(RemoteStorage(CONTENT), "upload_jobs/a.jpg")) as buffer:
+            self.assertEqual(buffer, CONTENT)
+
+    def test_in_memory_upload_is_read(self):
+        uploaded = InMemoryUploadedFile(ContentFile(CONTENT), "file", "a.jpg", "image/jpeg", len(CONTENT), None)
+
+        with map_upload(uploaded) as buffer:
+            self.assertEqual(buffer, CONTENT)
+
+    def test_empty_file_yields_empty_bytes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage = FileSystemStorage(location=directory)
+        name = storage.save("upload_jobs/empty.jpg", ContentFile(b""))
+
+        with map_upload(stored_file(storage, name)) as buffer:
+            self.assertEqual(buffer, b"")
@@ -0,0 +1,222 @@
+"""
+Streaming upload handling for image files.
+
+The handler in this module hashes uploads incrementally as chunks arrive,
+rejects files that exceed the configured size or pixel limits before the
+body has been fully received, and spools the data to a temporary file so
+that later stages can memory-map it instead of holding copies in memory.
+"""
+
+import hashlib
+import io
+import logging
+import mmap
+import os
+from contextlib import contextmanager
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from PIL import Image as PILImage
+
+from .services.config import MAX_UPLOAD_BYTES, MAX_IMAGE_PIXELS, UPLOAD_HEADER_PROBE_BYTES
+from .services.exceptions import FileValidationError
+
+logger = logging.getLogger(__name__)
+
+
+class ImageStreamInspector:
+    """
+    Incrementally inspect an image byte stream.
+
+    Computes the SHA256 hash chunk by chunk, tracks the total size and
+    reads the image dimensions from the header as soon as enough bytes
+    have arrived, raising FileValidationError when a limit is exceeded.
+    """
+
+    def __init__(self, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_IMAGE_PIXELS,
+                 probe_bytes=UPLOAD_HEADER_PROBE_BYTES):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.probe_bytes = probe_bytes
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.image_size = None
+        self._header = bytearray()
+        self._probing = True
+
+    def feed(self, chunk):
+        """
+        Process the next chunk of the stream.
+
+        Args:
+            chunk: Bytes received from the client
+
+        Raises:
+            FileValidationError: If the size or pixel limit is exceeded
+        """
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise FileValidationError(
+                f"Image exceeds the maximum upload size of {self.max_bytes} bytes"
+            )
+
+        self.hasher.update(chunk)
+
+        if self._probing:
+            self._header.extend(chunk[:max(0, self.probe_bytes - len(self._header))])
+            self._probe_dimensions()
+
+    def _probe_dimensions(self):
+        """Try to read the image dimensions from the buffered header."""
+        try:
+            # PIL only parses the header here; pixel data is not decoded
+            with PILImage.open(io.BytesIO(bytes(self._header))) as probe:
+                self.image_size = probe.size
+        except PILImage.DecompressionBombError:
+            raise FileValidationError(
+                f"Image exceeds the maximum of {self.max_pixels} pixels"
+            )
+        except Exception:
+            # Header incomplete (or not an image) - keep buffering up to the probe limit
+            if len(self._header) >= self.probe_bytes:
+                logger.debug("Could not read image dimensions from the first %d bytes", self.probe_bytes)
+                self._stop_probing()
+            return
+
+        self._stop_probing()
+        width, height = self.image_size
+        if self.max_pixels and width * height > self.max_pixels:
+            raise FileValidationError(
+                f"Image of {width}x{height} pixels exceeds the maximum of {self.max_pixels} pixels"
+            )
+
+    def _stop_probing(self):
+        self._probing = False
+        self._header = bytearray()
+
+    @property
+    def sha256_hash(self):
+        return self.hasher.hexdigest()
+
+
+class StreamingImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler that hashes and validates images while spooling them to disk.
+
+    Completed files are TemporaryUploadedFile instances carrying two extra
+    attributes: ``sha256_hash`` and ``image_size`` (``None`` if the header
+    could not be read). When a limit is exceeded the upload is stopped and
+    the error is stored on ``request.upload_error``.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.inspector = ImageStreamInspector()
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            self.inspector.feed(raw_data)
+        except FileValidationError as e:
+            logger.warning("Rejecting upload %s: %s", self.file_name, e.message)
+            self.request.upload_error = e
+            raise StopUpload(connection_reset=False)
+
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256_hash = self.inspector.sha256_hash
+        uploaded_file.image_size = self.inspector.image_size
+        return uploaded_file
+
+
+def spool_image_stream(name, stream, content_type="application/octet-stream", chunk_size=64 * 1024):
+    """
+    Spool a file-like object to a temporary upload file with the same checks
+    as StreamingImageUploadHandler.
+
+    Args:
+        name: File name to give the upload
+        stream: Readable binary file-like object
+        content_type: Content type to record on the upload
+        chunk_size: Number of bytes read per iteration
+
+    Returns:
+        TemporaryUploadedFile: Spooled file with ``sha256_hash`` and ``image_size``
+
+    Raises:
+        FileValidationError: If the size or pixel limit is exceeded
+    """
+    inspector = ImageStreamInspector()
+    uploaded_file = TemporaryUploadedFile(name, content_type, 0, None)
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            inspector.feed(chunk)
+            uploaded_file.write(chunk)
+    except Exception:
+        uploaded_file.close()
+        raise
+
+    uploaded_file.flush()
+    uploaded_file.seek(0)
+    uploaded_file.size = inspector.size
+    uploaded_file.sha256_hash = inspector.sha256_hash
+    uploaded_file.image_size = inspector.image_size
+    return uploaded_file
+
+
+def _local_path(django_file):
+    """Return the local filesystem path of a Django file, or None."""
+    if hasattr(django_file, "temporary_file_path"):
+        # Upload spooled to disk by the upload handler
+        return django_file.temporary_file_path()
+    storage = getattr(django_file, "storage", None)
+    if storage is None or not django_file.name:
+        return None
+    try:
+        # Stored FieldFile (e.g. an upload job's file) on FileSystemStorage
+        return storage.path(django_file.name)
+    except NotImplementedError:
+        # Remote storage has no local paths
+        return None
+
+
+@contextmanager
+def map_upload(uploaded_file):
+    """
+    Expose the contents of an uploaded file as a read-only buffer.
+
+    Files on local disk (spooled uploads or files in FileSystemStorage) are
+    memory-mapped so that hashing, decoding and feature extraction share the
+    page cache instead of private copies. Other files are read once.
+
+    Args:
+        uploaded_file: Django UploadedFile or FieldFile
+
+    Yields:
+        mmap.mmap or bytes: Buffer over the file contents
+    """
+    path = _local_path(uploaded_file)
+    if path is None:
+        uploaded_file.open("rb")
+        uploaded_file.seek(0)
+        yield uploaded_file.read()
+        return
+
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            yield b""
+            return
+
+        buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield buffer
+        finally:
+            try:
+                buffer.close()
+            except BufferError:
+                # A NumPy view still references the mapping; it is released with that view
+                logger.debug("Deferred closing of upload mapping for %s", uploaded_file.name)
@@ -1,10 +1,23 @@
 from django.urls import path
-from .views import UploadImageView, AdminImagesView, AdminDeleteImageView, ImageFileView
+from .views import (
+    UploadImageView, upload_image_async, BatchUploadImageView, PrecheckImageView, SearchImageView,
+    UploadJobStatusView, UploadJobEventsView, upload_job_wait_async,
+    AdminImagesView, AdminDeleteImageView, AdminCpuPoolStatsView, AdminMemoryProfilesView, ImageFileView
+)
 
 urlpatterns = [
     path('upload/', UploadImageView.as_view(), name='upload_image'),
+    path('upload/async/', upload_image_async, name='upload_image_async'),
+    path('upload/batch/', BatchUploadImageView.as_view(), name='batch_upload_image'),
+    path('upload/jobs/<uuid:job_id>/', UploadJobStatusView.as_view(), name='upload_job_status'),
+    path('upload/jobs/<uuid:job_id>/events/', UploadJobEventsView.as_view(), name='upload_job_events'),
+    path('upload/jobs/<uuid:job_id>/wait/', upload_job_wait_async, name='upload_job_wait'),
+    path('precheck/', PrecheckImageView.as_view(), name='precheck_images'),
+    path('search/', SearchImageView.as_view(), name='search_images'),
     path('admin/images/', AdminImagesView.as_view(), name='admin_images'),
     path('admin/images/verified/', AdminImagesView.as_view(), name='admin_verified_images'),  # Corrected
     path('admin/images/<int:pk>/', AdminDeleteImageView.as_view(), name='admin_delete_image'),
+    path('admin/cpu-pool/', AdminCpuPoolStatsView.as_view(), name='admin_cpu_pool_stats'),
+    path('admin/memory-profiles/', AdminMemoryProfilesView.as_view(), name='admin_memory_profiles'),
     path('<int:pk>/file/', ImageFileView.as_view(), name='image_file'),
 ]
\ No newline at end of file
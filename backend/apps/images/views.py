@@ -1,42 +1,112 @@
+import asyncio
+import hmac
 import logging
 import threading
 import os
 import io
-from django.core.files.base import ContentFile
+import json
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from django.http import HttpResponse, JsonResponse, FileResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
 from django.conf import settings
+from django.urls import reverse
 
 from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, BasePermission
+from rest_framework.renderers import JSONRenderer
 
-from .models import Image, AuditLog
-from .serializers import ImageSerializer
-from .services.detection_service import get_orb_features, get_sha256, deepfake_check, verify_image_similarity
-from .services.exceptions import SimilarImageError
+from .models import Image, AuditLog, UploadJob
+from .renderers import EventStreamRenderer
+from .serializers import ImageSerializer, UploadJobSerializer
+from .services.detection_service import get_sha256, search_similar_images
+from .services.upload_pipeline import (
+    analyze_upload, analyze_upload_async, run_blocking, run_stage, save_upload, upload_stage
+)
+from .services.exceptions import (
+    AdmissionRejected,
+    BatchTooLargeError,
+    SimilarImageError,
+    FileValidationError,
+    FeatureExtractionError,
+    ProcessingTimeoutError
+)
+from .services.config import (
+    BATCH_UPLOAD_MAX_ARCHIVE_BYTES,
+    BATCH_UPLOAD_MAX_ITEMS,
+    BATCH_UPLOAD_WORKERS,
+    MEMORY_PROFILING_ENABLED,
+    METRICS_AUTH_TOKEN,
+    METRICS_ENABLED,
+    PRECHECK_MAX_HASHES,
+    SEARCH_DEFAULT_TOP_K,
+    SEARCH_MAX_TOP_K,
+    SEARCH_MAX_BUDGET_MS,
+    UPLOAD_JOB_EVENTS_DB_INTERVAL,
+    UPLOAD_JOB_EVENTS_TIMEOUT,
+    UPLOAD_JOB_POLL_INTERVAL,
+    UPLOAD_JOB_WAIT_TIMEOUT
+)
+from .services.admission import admit_upload, admit_upload_async
+from .services.upload_jobs import create_upload_job, job_update_marker
+from .services.cpu_pool import get_cpu_pool
+from .services.memory_profiler import recent_memory_profiles
+from .services.metrics import UPLOAD_SECONDS, record_duplicate, render_metrics
+from .services.tracing import bind, span
 
-from .services.blockchain_service import store_image_on_blockchain
+from .services.blockchain_service import store_image_on_blockchain, store_images_on_blockchain
+from .upload_handlers import StreamingImageUploadHandler, map_upload, spool_image_stream
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# File extensions picked up from zip archives in batch uploads
+BATCH_IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "bmp", "gif", "webp", "tif", "tiff"}
+
 class UploadImageView(APIView):
     """Upload image with IPFS storage"""
     permission_classes = [IsAuthenticated]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Hash and validate the upload while it streams in, spooling it to disk
+        request.upload_handlers = [StreamingImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request, *args, **kwargs):
+        # Admitted before the body is read, so a rejected client has not sent the file for nothing
+        try:
+            admission = admit_upload(request.user)
+        except AdmissionRejected as e:
+            return _upload_rejected(Response, e)
+        with admission:
+            return self._post(request)
+
+    def _post(self, request):
         file_obj = request.FILES.get("file", None)
+        upload_error = getattr(request, "upload_error", None)
+        if upload_error is not None:
+            return Response({
+                "error": upload_error.message,
+                "stage": "upload",
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
         if not file_obj:
             return Response({"error": "请上传图片文件"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Read file binary
-        file_bytes = file_obj.read()
-        sha256_hash = get_sha256(file_bytes)
+        # SHA256 is computed incrementally by the upload handler
+        sha256_hash = getattr(file_obj, "sha256_hash", None) or get_sha256(file_obj.read())
 
         # 1. Check if exact same image exists using SHA256
         if Image.objects.filter(sha256_hash=sha256_hash).exists():
+            record_duplicate("exact")
             return Response({
                 "error": "Image Exist", 
                 "stage": "sha256",
@@ -44,42 +114,45 @@ class UploadImageView(APIView):
                 "similarity": 1.0,
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # 2. Perform progressive similarity verification (ORB -> SIFT)
-        try:
-            verify_image_similarity(file_bytes)
-        except SimilarImageError as e:
-            return Response({
-                "error": e.message,
-                "image_id": e.image_id,
-                "stage": e.stage,
-                "duplicate_type": e.duplicate_type,
-                "similarity": e.similarity
-            }, status=status.HTTP_400_BAD_REQUEST)
+        # Async job mode: return 202 immediately and let a worker run the pipeline
+        if request.query_params.get("async") in ("1", "true"):
+            job = create_upload_job(request.user, file_obj)
+            return Response(
+                _upload_job_payload(request, job),
+                status=status.HTTP_202_ACCEPTED,
+                headers={"Location": reverse("upload_job_status", args=[job.id])}
+            )
+
+        with UPLOAD_SECONDS.labels(mode="single").time():
+            return self._upload(request, file_obj, sha256_hash)
+
+    def _upload(self, request, file_obj, sha256_hash):
+        # Later stages read the spooled upload through a shared memory map
+        with map_upload(file_obj) as file_bytes:
+            # 2. Perform progressive similarity verification (ORB -> SIFT)
+            # 3. Calculate SIFT and ORB features and run deepfake detection
+            try:
+                analysis = analyze_upload(file_bytes, sha256_hash)
+            except SimilarImageError as e:
+                return Response({
+                    "error": e.message,
+                    "image_id": e.image_id,
+                    "stage": e.stage,
+                    "duplicate_type": e.duplicate_type,
+                    "similarity": e.similarity
+                }, status=status.HTTP_400_BAD_REQUEST)
+            except (FeatureExtractionError, ProcessingTimeoutError) as e:
+                return _processing_failed(Response, e)
 
-        # 3. Calculate SIFT and ORB features
-        orb_features = get_orb_features(file_bytes)
-  
-        deepfake_result = deepfake_check(file_bytes)
-    
-        # Use a queue system for processing uploads to prevent resource contention
-        # First, prepare all the data we need
-        upload_data = {
-            "sha256_hash": sha256_hash,
-            "orb_features": orb_features,
-
-            "deepfake_label": deepfake_result["label"],
-            "deepfake_confidence": deepfake_result["confidence"],
-            "uploader": request.user
-        }
-        
         blockchain_tx = None
         
         try:
-            blockchain_tx = store_image_on_blockchain(
-                sha256_hash, 
-                deepfake_result["label"],
-                deepfake_result["confidence"],
-            )
+            with upload_stage("chain"):
+                blockchain_tx = store_image_on_blockchain(
+                    sha256_hash, 
+                    analysis["deepfake_label"],
+                    analysis["deepfake_confidence"],
+                )
         except Exception as e:
             logger.error(f"Failed to store on blockchain: {str(e)}")
             blockchain_tx = None
@@ -87,38 +160,601 @@ class UploadImageView(APIView):
         # Handle the case where the image already exists on the blockchain
         if blockchain_tx == "IMAGE_EXISTS":
             logger.info(f"Image with hash {sha256_hash} already exists on blockchain. Creating database entry anyway.")
-            blockchain_tx = "IMAGE_EXISTS"  # Keep the special value for reference
 
-        # Store to database
-        img = Image.objects.create(
-            sha256_hash=sha256_hash,
-            orb_features=orb_features,
+        # Store to database and save the image file
+        img = save_upload(request.user, file_obj, analysis, blockchain_tx)
+
+        serializer = ImageSerializer(img)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+def _upload_rejected(response_class, e):
+    """429 for an upload that admission control turned away."""
+    logger.info(f"Upload not admitted ({e.reason}), retry after {e.retry_after}s")
+    return response_class({
+        "error": e.message,
+        "stage": "admission",
+        "reason": e.reason,
+    }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": str(e.retry_after)})
+
+
+def _processing_failed(response_class, e):
+    """400 for an image features cannot be extracted from, 503 for one whose processing timed out."""
+    if isinstance(e, ProcessingTimeoutError):
+        return response_class({"error": e.message, "stage": e.stage}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return response_class({"error": e.message, "stage": "orb"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _authenticate(request):
+    """Authenticate a plain Django request with the REST framework's authentication classes."""
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return drf_request.user, None
+    except APIException as e:
+        return None, e.detail
+
+
+def _parse_upload(request):
+    request.upload_handlers = [StreamingImageUploadHandler(request)]
+    return request.FILES.get("file", None)
+
+
+def _store_upload(user, file_obj, analysis, blockchain_tx):
+    img = save_upload(user, file_obj, analysis, blockchain_tx)
+    return ImageSerializer(img).data
+
+
+async def upload_image_async(request):
+    """
+    Upload an image without holding a thread for the request (served under ASGI).
+
+    Same request and responses as UploadImageView. The event loop only
+    coordinates: the body is received asynchronously by the ASGI handler,
+    detection stages are awaited on the stage pool (similarity and deepfake
+    concurrently where possible) and blockchain, database and storage calls
+    on the I/O pool, see upload_pipeline.run_blocking.
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    user, auth_error = await run_blocking(_authenticate, request)
+    if user is None or not user.is_authenticated:
+        return JsonResponse({"detail": auth_error or "Authentication credentials were not provided."}, status=401)
+    request.user = user
+
+    try:
+        admission = await admit_upload_async(user)
+    except AdmissionRejected as e:
+        return _upload_rejected(JsonResponse, e)
+    with admission:
+        return await _receive_upload_async(request, user)
+
+
+async def _receive_upload_async(request, user):
+    # Multipart parsing spools the file to disk through the streaming upload handler
+    file_obj = await run_blocking(_parse_upload, request)
+    upload_error = getattr(request, "upload_error", None)
+    if upload_error is not None:
+        return JsonResponse({
+            "error": upload_error.message,
+            "stage": "upload",
+        }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    if not file_obj:
+        return JsonResponse({"error": "请上传图片文件"}, status=status.HTTP_400_BAD_REQUEST)
+
+    sha256_hash = getattr(file_obj, "sha256_hash", None) or await run_blocking(get_sha256, file_obj.read(), pool="stage")
+
+    if await run_blocking(Image.objects.filter(sha256_hash=sha256_hash).exists):
+        record_duplicate("exact")
+        return JsonResponse({
+            "error": "Image Exist",
+            "stage": "sha256",
+            "duplicate_type": "exact",
+            "similarity": 1.0,
+        }, status=status.HTTP_400_BAD_REQUEST)
 
-            blockchain_tx=blockchain_tx,
-            deepfake_label=deepfake_result["label"],
-            deepfake_confidence=deepfake_result["confidence"],
-            uploader=request.user
+    if request.GET.get("async") in ("1", "true"):
+        job = await run_blocking(create_upload_job, user, file_obj)
+        return JsonResponse(
+            await run_blocking(_upload_job_payload, request, job),
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": reverse("upload_job_status", args=[job.id])}
         )
 
-        # 将图片文件保存到FileField
-        # 从原始文件获取文件扩展名
-        file_name = file_obj.name
-        ext = file_name.split('.')[-1] if '.' in file_name else 'jpg'
-        img.image_file.save(f"{sha256_hash}.{ext}", ContentFile(file_bytes), save=False)
-        
-        # 保存图片实例
-        img.save()
+    with UPLOAD_SECONDS.labels(mode="async").time():
+        return await _upload_async(request, file_obj, sha256_hash)
 
-        # Record upload log
-        AuditLog.objects.create(
-            user=request.user,
-            action="upload",
-            image=img,
-            detail=f"User {request.user.username} uploaded image with hash={img.sha256_hash}"
+
+async def _upload_async(request, file_obj, sha256_hash):
+    with map_upload(file_obj) as file_bytes:
+        try:
+            analysis = await analyze_upload_async(file_bytes, sha256_hash)
+        except SimilarImageError as e:
+            return JsonResponse({
+                "error": e.message,
+                "image_id": e.image_id,
+                "stage": e.stage,
+                "duplicate_type": e.duplicate_type,
+                "similarity": e.similarity
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except (FeatureExtractionError, ProcessingTimeoutError) as e:
+            return _processing_failed(JsonResponse, e)
+
+    blockchain_tx = None
+    try:
+        blockchain_tx = await run_stage(
+            "chain", store_image_on_blockchain,
+            sha256_hash, analysis["deepfake_label"], analysis["deepfake_confidence"],
+            pool="io"
         )
+    except Exception as e:
+        logger.error(f"Failed to store on blockchain: {str(e)}")
 
-        serializer = ImageSerializer(img)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    if blockchain_tx == "IMAGE_EXISTS":
+        logger.info(f"Image with hash {sha256_hash} already exists on blockchain. Creating database entry anyway.")
+
+    data = await run_blocking(_store_upload, request.user, file_obj, analysis, blockchain_tx)
+    return JsonResponse(data, status=status.HTTP_201_CREATED)
+
+
+# Authentication is handled in the view; JWT requests carry no CSRF token
+upload_image_async.csrf_exempt = True
+
+
+SHA256_HEX = re.compile(r"[0-9a-f]{64}")
+
+
+class PrecheckImageView(APIView):
+    """
+    Tell which images already exist from their SHA256, before they are uploaded.
+
+    Accepts {"sha256": "<hex>"} or {"hashes": ["<hex>", ...]} and answers
+    {"results": [{"sha256", "exists"}]} in request order, so a client can
+    skip sending files that would be rejected as exact duplicates.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        if "hashes" in request.data:
+            hashes = request.data.get("hashes")
+        elif "sha256" in request.data:
+            hashes = [request.data.get("sha256")]
+        else:
+            return Response({"error": "sha256 or hashes is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(hashes, list) or not hashes:
+            return Response({"error": "hashes must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(hashes) > PRECHECK_MAX_HASHES:
+            return Response({"error": f"At most {PRECHECK_MAX_HASHES} hashes per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        normalized = []
+        for sha256_hash in hashes:
+            if not isinstance(sha256_hash, str) or not SHA256_HEX.fullmatch(sha256_hash.lower()):
+                return Response({"error": f"Invalid SHA256 hash: {sha256_hash}"}, status=status.HTTP_400_BAD_REQUEST)
+            normalized.append(sha256_hash.lower())
+
+        # One lookup on the indexed sha256_hash column for the whole request
+        existing = set(
+            Image.objects.filter(sha256_hash__in=set(normalized)).values_list("sha256_hash", flat=True)
+        )
+        return Response({
+            "results": [{"sha256": sha256_hash, "exists": sha256_hash in existing} for sha256_hash in normalized]
+        })
+
+
+class SearchImageView(APIView):
+    """Find the stored images most similar to an image, without storing it"""
+    permission_classes = [IsAuthenticated]
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [StreamingImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        file_obj = request.FILES.get("file", None)
+        upload_error = getattr(request, "upload_error", None)
+        if upload_error is not None:
+            return Response({
+                "error": upload_error.message,
+                "stage": "upload",
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if not file_obj:
+            return Response({"error": "请上传图片文件"}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = {**request.query_params.dict(), **{k: v for k, v in request.data.items() if k != "file"}}
+        try:
+            top_k = int(params.get("top_k", SEARCH_DEFAULT_TOP_K))
+            budget_ms = int(params["budget_ms"]) if params.get("budget_ms") else None
+            min_similarity = float(params.get("min_similarity", 0.0))
+        except (TypeError, ValueError):
+            return Response({"error": "top_k and budget_ms must be integers, min_similarity a number"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= top_k <= SEARCH_MAX_TOP_K:
+            return Response({"error": f"top_k must be between 1 and {SEARCH_MAX_TOP_K}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if budget_ms is not None and not 1 <= budget_ms <= SEARCH_MAX_BUDGET_MS:
+            return Response({"error": f"budget_ms must be between 1 and {SEARCH_MAX_BUDGET_MS}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with map_upload(file_obj) as file_bytes:
+            try:
+                result = search_similar_images(
+                    file_bytes,
+                    top_k=top_k,
+                    budget_ms=budget_ms,
+                    min_similarity=min_similarity,
+                    sha256_hash=getattr(file_obj, "sha256_hash", None)
+                )
+            except (FeatureExtractionError, ProcessingTimeoutError) as e:
+                return _processing_failed(Response, e)
+
+        images = Image.objects.select_related("uploader").in_bulk([m["image_id"] for m in result["matches"]])
+        matches = []
+        for match in result["matches"]:
+            img = images.get(match["image_id"])
+            # Skip images deleted while the scan was running
+            if img is not None:
+                matches.append({
+                    "similarity": match["similarity"],
+                    "image": ImageSerializer(img, context={"request": request}).data,
+                })
+        result["matches"] = matches
+        return Response(result)
+
+def _upload_job_payload(request, job):
+    data = UploadJobSerializer(job).data
+    data["status_url"] = request.build_absolute_uri(reverse("upload_job_status", args=[job.id]))
+    data["events_url"] = request.build_absolute_uri(reverse("upload_job_events", args=[job.id]))
+    data["wait_url"] = request.build_absolute_uri(reverse("upload_job_wait", args=[job.id]))
+    return data
+
+
+def _visible_upload_jobs(request):
+    """Jobs the requesting user may see."""
+    jobs = UploadJob.objects.all()
+    if not request.user.is_staff:
+        jobs = jobs.filter(uploader=request.user)
+    return jobs
+
+
+def _get_upload_job(request, job_id):
+    """Fetch a job visible to the requesting user, or None."""
+    return _visible_upload_jobs(request).filter(pk=job_id).first()
+
+
+class _JobWatch:
+    """
+    Reads a followed job from the database only when it may have changed:
+    when its update marker in the cache changed, or every
+    UPLOAD_JOB_EVENTS_DB_INTERVAL seconds for updates the cache did not see.
+    """
+
+    def __init__(self, jobs, job_id):
+        self.jobs = jobs
+        self.job_id = job_id
+        self.marker = None
+        self.last_read = None
+
+    def due(self):
+        marker = job_update_marker(self.job_id)
+        if (marker != self.marker or self.last_read is None
+                or time.monotonic() - self.last_read >= UPLOAD_JOB_EVENTS_DB_INTERVAL):
+            # Taken before the read, so a save racing with it changes the marker again
+            self.marker = marker
+            return True
+        return False
+
+    def read(self):
+        self.last_read = time.monotonic()
+        return self.jobs.filter(pk=self.job_id).first()
+
+
+class UploadJobStatusView(APIView):
+    """Poll the status of an asynchronous upload job"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = _get_upload_job(request, job_id)
+        if job is None:
+            return Response({"error": "Upload job does not exist"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_upload_job_payload(request, job))
+
+
+class UploadJobEventsView(APIView):
+    """
+    Follow an asynchronous upload job as a server-sent event stream.
+
+    The stream holds a worker thread until the job finishes; it reads the
+    job from the database only when it changed (see _JobWatch). Clients
+    of an ASGI deployment can follow a job with upload_job_wait_async
+    instead, which holds no thread while it waits.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = _get_upload_job(request, job_id)
+        if job is None:
+            return Response({"error": "Upload job does not exist"}, status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(self._events(job.id), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def _events(self, job_id):
+        sent_stages = {}
+        started = time.time()
+        last_heartbeat = started
+        watch = _JobWatch(UploadJob.objects.all(), job_id)
+        job = None
+        while True:
+            if watch.due():
+                job = watch.read()
+                if job is None:
+                    yield self._event("error", {"error": "Upload job does not exist"})
+                    return
+
+                for stage in job.stages:
+                    key = (stage["status"], stage["elapsed_ms"])
+                    if sent_stages.get(stage["name"]) != key:
+                        sent_stages[stage["name"]] = key
+                        yield self._event("stage", stage)
+
+                if job.status in UploadJob.TERMINAL_STATUSES:
+                    yield self._event("status", UploadJobSerializer(job).data)
+                    return
+
+            now = time.time()
+            if now - started > UPLOAD_JOB_EVENTS_TIMEOUT:
+                yield self._event("timeout", {"job_id": str(job_id), "status": job.status})
+                return
+            if now - last_heartbeat > 15:
+                # Comment line keeps proxies from closing an idle stream
+                last_heartbeat = now
+                yield ": heartbeat\n\n"
+
+            time.sleep(UPLOAD_JOB_POLL_INTERVAL)
+
+    def _event(self, name, data):
+        return f"event: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def upload_job_wait_async(request, job_id):
+    """
+    Long-poll an asynchronous upload job without holding a thread (served under ASGI).
+
+    Answers with the job, as UploadJobStatusView does, as soon as its
+    updated_at differs from the ``since`` parameter (the updated_at of the
+    client's last answer) or it has finished, else with the unchanged job
+    after ``timeout`` seconds (at most UPLOAD_JOB_WAIT_TIMEOUT). While
+    waiting only the job's cache marker is read, see _JobWatch.
+    """
+    if request.method != "GET":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    user, auth_error = await run_blocking(_authenticate, request)
+    if user is None or not user.is_authenticated:
+        return JsonResponse({"detail": auth_error or "Authentication credentials were not provided."}, status=401)
+    request.user = user
+
+    try:
+        timeout = min(float(request.GET.get("timeout", UPLOAD_JOB_WAIT_TIMEOUT)), UPLOAD_JOB_WAIT_TIMEOUT)
+    except ValueError:
+        return JsonResponse({"error": "timeout must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    since = request.GET.get("since")
+    deadline = time.monotonic() + timeout
+
+    watch = _JobWatch(_visible_upload_jobs(request), job_id)
+    # Records the current marker
+    await run_blocking(watch.due)
+    while True:
+        job = await run_blocking(watch.read)
+        if job is None:
+            return JsonResponse({"error": "Upload job does not exist"}, status=status.HTTP_404_NOT_FOUND)
+        payload = await run_blocking(_upload_job_payload, request, job)
+        if payload["updated_at"] != since or job.status in UploadJob.TERMINAL_STATUSES:
+            return JsonResponse(payload)
+
+        while not await run_blocking(watch.due):
+            if time.monotonic() >= deadline:
+                return JsonResponse(payload)
+            await asyncio.sleep(UPLOAD_JOB_POLL_INTERVAL)
+
+
+class BatchUploadImageView(APIView):
+    """
+    Upload a batch of images in one request.
+
+    Accepts several ``files`` parts and/or a zip ``archive``. Items are
+    deduplicated by SHA256, analyzed in parallel, anchored on the blockchain
+    together, and reported one JSON object per line as results become
+    available (status: created, exact_duplicate, similar or error).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [StreamingImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        files = request.FILES.getlist("files")
+        archive = request.FILES.get("archive")
+        upload_error = getattr(request, "upload_error", None)
+        if upload_error is not None:
+            return Response({
+                "error": upload_error.message,
+                "stage": "upload",
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if not files and not archive:
+            return Response({"error": "请上传图片文件"}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = [{"index": index, "name": f.name, "file": f} for index, f in enumerate(files)]
+        try:
+            self._check_item_count(len(items))
+            if archive:
+                items.extend(self._extract_archive(archive, start_index=len(items)))
+        except zipfile.BadZipFile:
+            self._close_items(items)
+            return Response({"error": "Invalid zip archive"}, status=status.HTTP_400_BAD_REQUEST)
+        except BatchTooLargeError as e:
+            self._close_items(items)
+            return Response({"error": e.message, "stage": "upload"}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            self._process_batch(request.user, items),
+            content_type="application/x-ndjson"
+        )
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def _check_item_count(self, count):
+        if count > BATCH_UPLOAD_MAX_ITEMS:
+            raise BatchTooLargeError(f"A batch may contain at most {BATCH_UPLOAD_MAX_ITEMS} images")
+
+    def _extract_archive(self, archive, start_index):
+        """
+        Spool every image in a zip archive to its own temporary upload file.
+
+        The limits are checked against the archive's directory before anything
+        is extracted; zipfile never yields more of a member than its directory
+        entry declares.
+
+        Raises:
+            BatchTooLargeError: If the archive holds too many images or too many decompressed bytes
+        """
+        items = []
+        with zipfile.ZipFile(archive) as zf:
+            members = []
+            for info in zf.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                if name.rsplit(".", 1)[-1].lower() not in BATCH_IMAGE_EXTENSIONS:
+                    continue
+                members.append((info, name))
+
+            self._check_item_count(start_index + len(members))
+            if sum(info.file_size for info, _ in members) > BATCH_UPLOAD_MAX_ARCHIVE_BYTES:
+                raise BatchTooLargeError(
+                    f"The images in an archive may total at most {BATCH_UPLOAD_MAX_ARCHIVE_BYTES // (1024 * 1024)} MB"
+                )
+
+            for info, name in members:
+                item = {"index": start_index + len(items), "name": name}
+                try:
+                    # Limits are enforced on the decompressed stream, so zip bombs are cut off early
+                    with zf.open(info) as member:
+                        item["file"] = spool_image_stream(name, member)
+                except FileValidationError as e:
+                    item["error"] = e.message
+                items.append(item)
+        return items
+
+    def _process_batch(self, user, items):
+        try:
+            with UPLOAD_SECONDS.labels(mode="batch").time():
+                yield from self._run_batch(user, items)
+        finally:
+            self._close_items(items)
+
+    def _run_batch(self, user, items):
+        # 1. Deduplicate within the batch and against the database by SHA256
+        first_by_hash = {}
+        candidates = []
+        for item in items:
+            if "error" in item:
+                yield self._result(item, "error", error=item["error"])
+                continue
+            uploaded_file = item["file"]
+            item["sha256_hash"] = getattr(uploaded_file, "sha256_hash", None) or get_sha256(uploaded_file.read())
+            if item["sha256_hash"] in first_by_hash:
+                record_duplicate("exact")
+                yield self._result(item, "exact_duplicate", duplicate_of_index=first_by_hash[item["sha256_hash"]])
+                continue
+            first_by_hash[item["sha256_hash"]] = item["index"]
+            candidates.append(item)
+
+        existing = dict(
+            Image.objects.filter(sha256_hash__in=[item["sha256_hash"] for item in candidates])
+            .values_list("sha256_hash", "id")
+        )
+        survivors = []
+        for item in candidates:
+            if item["sha256_hash"] in existing:
+                record_duplicate("exact")
+                yield self._result(item, "exact_duplicate", image_id=existing[item["sha256_hash"]], similarity=1.0)
+            else:
+                survivors.append(item)
+
+        # 2. Run the detection stages in parallel across items
+        analyzed = []
+        with ThreadPoolExecutor(max_workers=BATCH_UPLOAD_WORKERS) as executor:
+            futures = {executor.submit(bind(self._analyze_item), item): item for item in survivors}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    item["analysis"] = future.result()
+                    analyzed.append(item)
+                except SimilarImageError as e:
+                    yield self._result(
+                        item,
+                        "exact_duplicate" if e.duplicate_type == "exact" else "similar",
+                        image_id=e.image_id,
+                        stage=e.stage,
+                        similarity=e.similarity
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to analyze batch item {item['name']}: {str(e)}")
+                    yield self._result(item, "error", error=str(e))
+
+        if not analyzed:
+            return
+
+        # 3. Anchor the surviving images on the blockchain together
+        analyzed.sort(key=lambda item: item["index"])
+        try:
+            with span("upload.chain", **{"batch.size": len(analyzed)}):
+                blockchain_txs = store_images_on_blockchain(
+                    (item["sha256_hash"], item["analysis"]["deepfake_label"], item["analysis"]["deepfake_confidence"])
+                    for item in analyzed
+                )
+        except Exception as e:
+            logger.error(f"Failed to store batch on blockchain: {str(e)}")
+            blockchain_txs = {}
+
+        # 4. Store to database
+        for item in analyzed:
+            try:
+                img = save_upload(user, item["file"], item["analysis"], blockchain_txs.get(item["sha256_hash"]))
+            except Exception as e:
+                logger.error(f"Failed to save batch item {item['name']}: {str(e)}")
+                yield self._result(item, "error", error=str(e))
+                continue
+            yield self._result(item, "created", image=ImageSerializer(img).data)
+
+    def _analyze_item(self, item):
+        try:
+            with map_upload(item["file"]) as file_bytes:
+                return analyze_upload(file_bytes, item["sha256_hash"])
+        finally:
+            # Worker threads open their own database connections
+            connections.close_all()
+
+    def _result(self, item, result_status, **fields):
+        result = {
+            "index": item["index"],
+            "name": item["name"],
+            "sha256_hash": item.get("sha256_hash"),
+            "status": result_status,
+        }
+        result.update(fields)
+        return json.dumps(result, cls=DjangoJSONEncoder) + "\n"
+
+    def _close_items(self, items):
+        for item in items:
+            if "file" in item:
+                item["file"].close()
 
 class ImageFileView(APIView):
     """通过ID获取图片文件"""
@@ -167,7 +803,7 @@ class AdminImagesView(APIView):
         if 'is_verified' in request.query_params:
             filters['is_verified'] = request.query_params['is_verified'] == 'true'
         
-        images = Image.objects.filter(**filters).order_by('-uploaded_at')
+        images = Image.objects.select_related('uploader').filter(**filters).order_by('-uploaded_at')
         
         # Implement pagination
         page = request.query_params.get('page', 1)
@@ -192,7 +828,38 @@ class AdminImagesView(APIView):
 
     def get_verified_images(self, request, *args, **kwargs):
         # Fetch only verified images
-        verified_images = Image.objects.filter(is_verified=True).order_by('-uploaded_at')
+        verified_images = Image.objects.select_related('uploader').filter(is_verified=True).order_by('-uploaded_at')
         serializer = ImageSerializer(verified_images, many=True)
         
         return Response(serializer.data)
+
+
+class AdminCpuPoolStatsView(APIView):
+    """Admin view of CPU pool saturation metrics"""
+    permission_classes = [IsAuthenticated, IsAdminUserCustom]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_cpu_pool().stats())
+
+
+class AdminMemoryProfilesView(APIView):
+    """Admin view of the latest per-request memory profiles recorded by this process"""
+    permission_classes = [IsAuthenticated, IsAdminUserCustom]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            "enabled": MEMORY_PROFILING_ENABLED,
+            "profiles": recent_memory_profiles(),
+        })
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (plain Django view, outside DRF authentication)"""
+    if not METRICS_ENABLED:
+        return HttpResponse(status=404)
+    if METRICS_AUTH_TOKEN:
+        expected = f"Bearer {METRICS_AUTH_TOKEN}"
+        if not hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", ""), expected):
+            return HttpResponse(status=401)
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
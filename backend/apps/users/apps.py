@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class UsersConfig(AppConfig):
+    name = "apps.users"
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
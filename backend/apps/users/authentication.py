@@ -0,0 +1,66 @@
+# apps/users/authentication.py
+"""
+JWT authentication that resolves users from a cache instead of the database.
+
+JWTAuthentication loads the user row on every authenticated request.
+CachedJWTAuthentication keeps the resolved user in the AUTH_USER_CACHE_ALIAS
+cache for AUTH_USER_CACHE_TTL seconds, keyed by user id and the user's
+cache version. Saving or deleting a user bumps the version (see signals.py),
+so a changed password, role or is_active flag takes effect on the next
+request.
+
+With the default in-process cache, other worker processes only notice a
+change once their entry expires; point CACHE_URL at a shared cache (e.g.
+memcached) to invalidate them immediately. Changes made with
+QuerySet.update() bypass the signals and are picked up after the TTL.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+def _cache():
+    return caches[settings.AUTH_USER_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f"users:auth-version:{user_id}"
+
+
+def _user_key(user_id, version):
+    return f"users:auth-user:{user_id}:{version}"
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with users resolved through a short-lived cache."""
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None or not settings.AUTH_USER_CACHE_TTL:
+            return super().get_user(validated_token)
+
+        cache = _cache()
+        # Read the version before the row, so a concurrent save leaves at most
+        # a stale entry under a version nobody reads any more
+        key = _user_key(user_id, cache.get(_version_key(user_id), 0))
+        user = cache.get(key)
+        if user is None:
+            # Raises for unknown and inactive users, which are never cached
+            user = super().get_user(validated_token)
+            cache.set(key, user, settings.AUTH_USER_CACHE_TTL)
+        return user
+
+
+def invalidate_cached_user(user_id):
+    """Drop the cached user so the next request reloads it from the database."""
+    cache = _cache()
+    version_key = _version_key(user_id)
+    cache.delete(_user_key(user_id, cache.get(version_key, 0)))
+    if not cache.add(version_key, 1, timeout=None):
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            # Evicted since add()
+            cache.set(version_key, 1, timeout=None)
@@ -3,7 +3,6 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
-from django.contrib.auth import authenticate
 
 from .models import User
 from .serializers import UserSerializer, LoginSerializer
@@ -32,9 +31,8 @@ class LoginView(APIView):
         except User.DoesNotExist:
             return Response({"error": "Invalid username or password"}, status=status.HTTP_401_UNAUTHORIZED)
         
-        # 再验证密码
-        user = authenticate(username=user.username, password=password)
-        if not user:
+        # 再验证密码 (on the row fetched above, instead of authenticate() loading it again)
+        if not user.check_password(password) or not user.is_active:
             return Response({"error": "Invalid username or password"}, status=status.HTTP_401_UNAUTHORIZED)
 
         # 生成 JWT 令牌
@@ -0,0 +1,21 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_backend.settings')
+
+# Serves only the async views, /api/images/upload/async/ and
+# /api/images/upload/jobs/<job_id>/wait/, behind a proxy that routes every
+# other path to the WSGI application (see README, "Run the Backend Server").
+# Their request bodies are received and their waits run on the event loop,
+# so slow clients do not hold a thread. Under Django 3.2 the streaming sync
+# views (the job event stream, the batch upload's NDJSON progress) would
+# iterate their responses on the loop and fail on their database queries.
+application = get_asgi_application()
+
+# Load the similarity index snapshots now rather than on the first request
+from apps.images.services.index_snapshots import warm_similarity_indexes  # noqa: E402
+from apps.images.services.upload_jobs import start_upload_job_workers  # noqa: E402
+
+warm_similarity_indexes()
+# Resume upload jobs a previous process left queued or running
+start_upload_job_workers()
@@ -0,0 +1,91 @@
+# django_backend/log_handlers.py
+"""
+Logging handlers that keep file and console I/O off the request thread.
+
+In production log mode (LOG_MODE=production) settings.LOGGING wraps its
+handlers in QueuedHandler: the request thread only enqueues the record,
+and a QueueListener thread in each process formats it and writes it out.
+"""
+
+import atexit
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from django.utils.module_loading import import_string
+
+
+class QueuedHandler(QueueHandler):
+    """
+    Hands records to a background thread that passes them to the wrapped handler.
+
+    The listener thread is started by the first record each process logs:
+    dictConfig runs before a preforking server forks its workers, and a
+    forked worker inherits the queue but not the thread that drains it.
+    """
+
+    def __init__(self, handler):
+        super().__init__(queue.SimpleQueue())
+        self.handler = handler
+        self.listener = None
+        self._listener_pid = None
+        self._stopped = False
+        atexit.register(self.stop)
+
+    def enqueue(self, record):
+        # Runs under the handler lock, which logging re-creates in a forked child
+        if self._listener_pid != os.getpid():
+            self._start_listener()
+        super().enqueue(record)
+
+    def _start_listener(self):
+        if self._listener_pid is not None:
+            # Records queued in the parent are written by the parent
+            self.queue = queue.SimpleQueue()
+            self._stopped = False
+        self.listener = QueueListener(self.queue, self.handler, respect_handler_level=True)
+        self.listener.start()
+        self._listener_pid = os.getpid()
+
+    def setFormatter(self, fmt):
+        # dictConfig assigns the formatter here, but the wrapped handler does the formatting
+        self.handler.setFormatter(fmt)
+
+    def prepare(self, record):
+        # The queue never leaves the process, so the record is formatted on the
+        # listener thread instead of being flattened to a string here
+        return record
+
+    def stop(self):
+        """Flush queued records and stop the listener thread."""
+        if not self._stopped and self._listener_pid == os.getpid():
+            self._stopped = True
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        self.handler.close()
+        super().close()
+
+
+def queued_handler(handler_class, **kwargs):
+    """
+    dictConfig factory for a queued handler.
+
+    Args:
+        handler_class: Dotted path of the wrapped handler class
+        **kwargs: Arguments for the wrapped handler
+
+    Returns:
+        QueuedHandler: Handler wrapping ``handler_class(**kwargs)``
+    """
+    return QueuedHandler(import_string(handler_class)(**kwargs))
+
+
+def queue_handlers(handlers):
+    """Rewrite LOGGING handler configs in place to run through QueuedHandler."""
+    for config in handlers.values():
+        config["handler_class"] = config.pop("class")
+        config["()"] = "django_backend.log_handlers.queued_handler"
+    return handlers
+
@@ -5,6 +5,8 @@ from pathlib import Path
 from datetime import timedelta
 import environ
 
+from django_backend.log_handlers import queue_handlers
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key")  # 或放在 .env
@@ -35,6 +37,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so the trace covers the whole request; a no-op unless TRACING_ENABLED
+    "apps.images.middleware.TracingMiddleware",
+    # Next, so reports cover the rest of the request; a no-op unless MEMORY_PROFILING_ENABLED
+    "apps.images.middleware.MemoryProfilingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -91,6 +97,7 @@ CORS_ALLOW_HEADERS = [
 
 
 WSGI_APPLICATION = "django_backend.wsgi.application"
+ASGI_APPLICATION = "django_backend.asgi.application"
 
 # Database configuration is defined below using environment variables
 
@@ -123,10 +130,15 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # Django REST framework 配置
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # JWTAuthentication with users resolved through the cache below
+        "apps.users.authentication.CachedJWTAuthentication",
     ),
 }
 
+# Seconds an authenticated user is served from the cache (0 disables it)
+AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", "60"))
+AUTH_USER_CACHE_ALIAS = "default"
+
 # SimpleJWT 配置
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
@@ -139,6 +151,12 @@ SIMPLE_JWT = {
 env = environ.Env()
 environ.Env.read_env(os.path.join(BASE_DIR, '.env'))  # 读取 .env 文件
 
+# 缓存配置: in-process by default; a shared cache (e.g. CACHE_URL=pylibmc://127.0.0.1:11211)
+# lets every worker see user invalidations immediately
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 # 数据库配置
 DATABASES = {
     'default': {
@@ -173,7 +191,7 @@ LOGGING = {
             'formatter': 'verbose',
         },
         'image_detection_file': {
-            'level': 'INFO',
+            'level': 'DEBUG',
             'class': 'logging.FileHandler',
             'filename': os.path.join(BASE_DIR, 'logs', 'image_detection.log'),
             'formatter': 'verbose',
@@ -196,9 +214,19 @@ LOGGING = {
         },
         'apps.images.services.detection_service': {
             'handlers': ['image_detection_file', 'console'],
-            'level': 'INFO',
+            # LOG_MODE decides which debug events are logged
+            'level': 'DEBUG',
             'propagate': False,
         },
     },
 }
 
+# Log mode:
+# - "verbose": handlers write synchronously and the detection service logs
+#   every debug event (development, debugging)
+# - "production": handlers write from a background queue and the detection
+#   service logs per-request summaries, sampling per-image debug events
+LOG_MODE = env('LOG_MODE', default='verbose')
+if LOG_MODE == 'production':
+    queue_handlers(LOGGING['handlers'])
+
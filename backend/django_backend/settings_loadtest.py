@@ -0,0 +1,51 @@
+# django_backend/settings_loadtest.py
+"""
+Settings for the loadtest command on machines without the production services.
+
+Uses SQLite instead of PostgreSQL and keeps the database, media files and
+similarity indexes in a scratch directory (LOADTEST_DIR, a new temporary
+directory by default), so a run never reads or writes the real ones:
+
+    python manage.py loadtest --settings=django_backend.settings_loadtest
+"""
+
+import os
+import tempfile
+
+LOADTEST_DIR = os.environ.get("LOADTEST_DIR") or tempfile.mkdtemp(prefix="honour-loadtest-")
+
+# Read by apps.images.services.config, which is imported after the settings
+os.environ.setdefault("INDEX_DIR", os.path.join(LOADTEST_DIR, "indexes"))
+
+from .settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(LOADTEST_DIR, "db.sqlite3"),
+        "OPTIONS": {
+            # Request threads write concurrently; wait for the lock instead of failing
+            "timeout": 30,
+        },
+        "TEST": {
+            "NAME": os.path.join(LOADTEST_DIR, "test_db.sqlite3"),
+        },
+    }
+}
+
+MEDIA_ROOT = os.path.join(LOADTEST_DIR, "media")
+
+# Per-request INFO logging to files would be part of what gets measured
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+        },
+    },
+    "root": {
+        "handlers": ["console"],
+        "level": "WARNING",
+    },
+}
@@ -3,6 +3,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse
 
+from apps.images.views import metrics_view
+
 
 def home_view(request):
     return JsonResponse({"message": "Welcome to My Django Backend!"})
@@ -11,6 +13,7 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/auth/", include("apps.users.urls")),
     path("api/images/", include("apps.images.urls")),
+    path("metrics", metrics_view, name="metrics"),
     path('', home_view),  # 添加根路径
     # 其它...
 ]
@@ -4,3 +4,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_backend.settings')
 
 application = get_wsgi_application()
+
+# Load the similarity index snapshots now rather than on the first request
+from apps.images.services.index_snapshots import warm_similarity_indexes  # noqa: E402
+from apps.images.services.upload_jobs import start_upload_job_workers  # noqa: E402
+
+warm_similarity_indexes()
+# Resume upload jobs a previous process left queued or running
+start_upload_job_workers()
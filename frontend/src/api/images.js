@@ -71,6 +71,28 @@ export const uploadImage = (imageFile) => {
   });
 };
 
+/**
+ * Compute the SHA256 of a file in the browser, as the server does on upload
+ * @param {File} imageFile - The image file to hash
+ * @returns {Promise<string|null>} - Lowercase hex digest, or null where WebCrypto is unavailable (non-HTTPS origins)
+ */
+export const sha256Hex = async (imageFile) => {
+  if (!window.crypto?.subtle) {
+    return null;
+  }
+  const digest = await window.crypto.subtle.digest('SHA-256', await imageFile.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+/**
+ * Check which images already exist before uploading them
+ * @param {string[]} hashes - SHA256 hex digests of the images
+ * @returns {Promise} - API response with results: [{ sha256, exists }] in request order
+ */
+export const precheckImages = (hashes) => {
+  return api.post('/api/images/precheck/', { hashes });
+};
+
 /**
  * Admin: Get recently verified images
  * @returns {Promise} - API response with recently verified images
@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useImages } from '../context/ImageContext';
 import Navbar from '../components/common/Navbar';
-import { loadImage } from '../api/images'; // Importing loadImage function
+import { loadImage, precheckImages, sha256Hex } from '../api/images'; // Image loading and duplicate precheck helpers
 
 const ImageUpload = () => {
   const { uploadImage } = useImages();
@@ -91,6 +91,22 @@ const ImageUpload = () => {
     setVerificationProgress(0);
     setSimilarImage(null);
     
+    // Skip sending a file the server already has; any failure here falls back to a normal upload
+    try {
+      const hash = await sha256Hex(files[0]);
+      if (hash) {
+        const precheck = await precheckImages([hash]);
+        if (precheck.data.results[0]?.exists) {
+          setLoading(false);
+          setVerificationStep(0);
+          setError('Upload failed: This image already exists');
+          return;
+        }
+      }
+    } catch (err) {
+      console.error('Pre-check error:', err);
+    }
+
     try {
       const uploadResponse = await uploadImage(files[0]);
       